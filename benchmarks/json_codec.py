@@ -0,0 +1,64 @@
+"""
+Micro-benchmark of decoding and encoding a representative FHIR bundle with
+each installed JSON backend, against the previous text-mode json.load.
+
+Run with: python -m benchmarks.json_codec --resources 20000
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from typing import Callable
+
+from benchmarks.synthetic import synthetic_bundle
+from refiner.utils import json_codec
+
+
+def best_of(repeat: int, func: Callable[[], object]) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def stdlib_text_load(path: str):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="JSON codec benchmark")
+    parser.add_argument('--resources', type=int, default=20000, help="Bundle entries in the input file")
+    parser.add_argument('--repeat', type=int, default=5, help="Runs per measurement, the best is reported")
+    args = parser.parse_args()
+
+    data = synthetic_bundle(args.resources)
+    with tempfile.TemporaryDirectory() as work_dir:
+        path = os.path.join(work_dir, 'bundle.json')
+        with open(path, 'w') as f:
+            json.dump(data, f)
+        size_mb = os.path.getsize(path) / 1024 / 1024
+        print(f"{args.resources} resources, {size_mb:.1f} MiB, best of {args.repeat} runs")
+        print(f"{'backend':<22} {'decode s':>9} {'MiB/s':>7} {'encode s':>9}")
+
+        baseline = best_of(args.repeat, lambda: stdlib_text_load(path))
+        encode = best_of(args.repeat, lambda: json.dumps(data))
+        print(f"{'json.load (text)':<22} {baseline:>9.3f} {size_mb / baseline:>7.1f} {encode:>9.3f}")
+
+        for name in json_codec.BACKENDS:
+            try:
+                json_codec.select_backend(name)
+            except ImportError:
+                print(f"{name:<22} not installed")
+                continue
+            decode = best_of(args.repeat, lambda: json_codec.load_file(path))
+            encode = best_of(args.repeat, lambda: json_codec.dumps(data))
+            print(f"{name + ' (bytes)':<22} {decode:>9.3f} {size_mb / decode:>7.1f} {encode:>9.3f}"
+                  f"   {baseline / decode:.2f}x decode")
+
+
+if __name__ == '__main__':
+    main()
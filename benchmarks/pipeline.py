@@ -0,0 +1,275 @@
+"""
+End-to-end refinement benchmark on synthetic bundles of increasing size. Each
+stage is timed on its own: decode, validate, transform, insert, schema,
+finalize, encrypt and upload (to a local stub of the Pinata API). Peak RSS is
+recorded after every stage, each size running in a fresh process so sizes do
+not inflate each other's peak. The JSON report is meant to be diffed across
+commits.
+
+Run with: REFINEMENT_ENCRYPTION_KEY=bench python -m benchmarks.pipeline --sizes 100 10000 1000000
+"""
+import argparse
+import hashlib
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Sequence
+
+from benchmarks.synthetic import MIXES, synthetic_bundle
+from refiner.config import settings
+from refiner.models.offchain_schema import OffChainSchema
+from refiner.models.unrefined import GoogleProfileFHIRPatient
+from refiner.transformer.bulk_writer import model_to_row
+from refiner.transformer.user_transformer import UserTransformer
+from refiner.utils import json_codec
+from refiner.utils.encrypt import encrypt_file
+from refiner.utils.ipfs import IPFSClient
+from refiner.utils.metrics import peak_rss_mb
+
+STAGES = ('decode', 'validate', 'transform', 'insert', 'schema', 'finalize', 'encrypt', 'upload')
+
+
+class StubRequest(NamedTuple):
+    """A request received by the stub API, with a digest of its body rather than the body itself."""
+    path: str
+    headers: Dict[str, str]
+    chunked: bool
+    length: int
+    sha256: str
+
+
+class _StubPinataHandler(BaseHTTPRequestHandler):
+    """Accepts pin requests and answers with a hash of the body, like a very fast Pinata."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        digest = hashlib.sha256()
+        length = 0
+        chunked = self.headers.get('Transfer-Encoding', '').lower() == 'chunked'
+        if chunked:
+            while True:
+                size = int(self.rfile.readline().split(b';')[0], 16)
+                chunk = self.rfile.read(size)
+                digest.update(chunk)
+                length += len(chunk)
+                self.rfile.readline()
+                if size == 0:
+                    break
+        else:
+            remaining = int(self.headers.get('Content-Length', 0))
+            while remaining > 0:
+                chunk = self.rfile.read(min(remaining, 1024 * 1024))
+                if not chunk:
+                    break
+                digest.update(chunk)
+                length += len(chunk)
+                remaining -= len(chunk)
+
+        self.server.requests.append(
+            StubRequest(self.path, dict(self.headers), chunked, length, digest.hexdigest())
+        )
+        status = self.server.next_status()
+        if status != 200:
+            self.send_response(status)
+            self.send_header('Retry-After', '0')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        body = json_codec.dumps({'IpfsHash': f"Qm{digest.hexdigest()[:44]}"})
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubPinata(ThreadingHTTPServer):
+    """
+    Local stand-in for the Pinata API on a free port. It records every request
+    it receives and can answer the first ones with error statuses, e.g. to
+    exercise the upload retries.
+    """
+
+    def __init__(self, failures: Sequence[int] = ()):
+        """
+        Args:
+            failures: Statuses answered, in order, before requests succeed
+        """
+        super().__init__(('127.0.0.1', 0), _StubPinataHandler)
+        self.requests: List[StubRequest] = []
+        self._failures = deque(failures)
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def next_status(self) -> int:
+        with self._lock:
+            return self._failures.popleft() if self._failures else 200
+
+
+@contextmanager
+def serve_stub_pinata(failures: Sequence[int] = ()) -> Iterator[StubPinata]:
+    """Serve the stub API for the duration of the block, yielding the server."""
+    server = StubPinata(failures)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@contextmanager
+def stub_pinata() -> Iterator[str]:
+    """Serve the stub API on a free local port for the duration of the block, yielding its URL."""
+    with serve_stub_pinata() as server:
+        yield server.url
+
+
+def run_once(n_resources: int, mix: str, seed: int, api_url: str, work_dir: str) -> Dict[str, Any]:
+    """Refine one synthetic bundle stage by stage, the way Refiner does for a single file."""
+    input_path = os.path.join(work_dir, 'bundle.json')
+    db_path = os.path.join(work_dir, 'db.libsql')
+    json_codec.dump_file(synthetic_bundle(n_resources, seed, MIXES[mix]), input_path)
+
+    durations: Dict[str, float] = {}
+    rss: Dict[str, float] = {'start': round(peak_rss_mb(), 1)}
+
+    @contextmanager
+    def stage(name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        yield
+        durations[name] = time.perf_counter() - start
+        rss[name] = round(peak_rss_mb(), 1)
+
+    with stage('decode'):
+        data = json_codec.load_file(input_path)
+    with stage('validate'):
+        bundle = GoogleProfileFHIRPatient.model_validate(data)
+    with stage('transform'):
+        groups: Dict = {}
+        for model in UserTransformer(None).transform_bundle(bundle):
+            table, columns, row = model_to_row(model)
+            groups.setdefault((table.name, columns), []).append(row)
+        file_rows = [(table_name, columns, rows) for (table_name, columns), rows in groups.items()]
+    del data, bundle, groups
+    with stage('insert'):
+        transformer = UserTransformer(db_path, pii_key='bench')
+        transformer.process_rows(file_rows)
+    with stage('schema'):
+        schema = OffChainSchema(
+            name=settings.SCHEMA_NAME,
+            version=settings.SCHEMA_VERSION,
+            description=settings.SCHEMA_DESCRIPTION,
+            dialect=settings.SCHEMA_DIALECT,
+            schema=transformer.get_schema()
+        )
+        json_codec.dump_file(schema.model_dump(), os.path.join(work_dir, 'schema.json'), indent=4)
+    with stage('finalize'):
+        transformer.finalize(optimize=settings.SQLITE_OPTIMIZE)
+    with stage('encrypt'):
+        encrypted_path = encrypt_file(
+            settings.REFINEMENT_ENCRYPTION_KEY, db_path,
+            streaming=settings.STREAMING_ENCRYPTION, armor=settings.ENCRYPTION_ARMOR
+        )
+    with stage('upload'):
+        with IPFSClient('bench', 'bench', api_url=api_url, max_retries=0) as client:
+            client.upload_json(schema.model_dump())
+            client.upload_file(encrypted_path)
+
+    rows: Dict[str, int] = {}
+    for table_name, _, table_rows in file_rows:
+        rows[str(table_name)] = rows.get(str(table_name), 0) + len(table_rows)
+    return {
+        'stages': durations,
+        'peak_rss_mb': rss,
+        'bytes': {
+            'input': os.path.getsize(input_path),
+            'database': os.path.getsize(db_path),
+            'encrypted': os.path.getsize(encrypted_path),
+        },
+        'rows': dict(sorted(rows.items())),
+    }
+
+
+def run_size(n_resources: int, mix: str, seed: int, api_url: str, work_dir: Optional[str]) -> Dict[str, Any]:
+    """Process entry point: one run in a fresh temporary directory."""
+    with tempfile.TemporaryDirectory(dir=work_dir) as run_dir:
+        return run_once(n_resources, mix, seed, api_url, run_dir)
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="End-to-end refinement benchmark")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000, 100000],
+                        help="Bundle entries per run, up to 1000000")
+    parser.add_argument('--mix', choices=sorted(MIXES), default='default', help="Resource mix per encounter")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the synthetic bundles")
+    parser.add_argument('--repeat', type=int, default=1, help="Runs per size, the median of each stage is reported")
+    parser.add_argument('--dir', default=None, help="Directory for the work files, e.g. on the target volume")
+    parser.add_argument('--output', default='benchmark_report.json', help="Path of the JSON report")
+    args = parser.parse_args()
+
+    results: List[Dict[str, Any]] = []
+    with stub_pinata() as api_url:
+        for n_resources in args.sizes:
+            runs = []
+            for _ in range(args.repeat):
+                # A fresh process per run so peak RSS belongs to this size alone
+                with ProcessPoolExecutor(max_workers=1) as pool:
+                    runs.append(pool.submit(run_size, n_resources, args.mix, args.seed, api_url, args.dir).result())
+            result = runs[0]
+            result['stages'] = {
+                name: round(statistics.median(run['stages'][name] for run in runs), 4) for name in STAGES
+            }
+            result['peak_rss_mb'] = {
+                name: max(run['peak_rss_mb'][name] for run in runs) for name in result['peak_rss_mb']
+            }
+            results.append({'resources': n_resources, **result})
+
+            total = sum(result['stages'].values())
+            print(f"{n_resources:>8} resources  total {total:8.3f}s  "
+                  + "  ".join(f"{name} {result['stages'][name]:.3f}" for name in STAGES)
+                  + f"  peak {max(result['peak_rss_mb'].values()):.0f} MiB")
+
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'json_backend': json_codec.backend,
+        'mix': args.mix,
+        'seed': args.seed,
+        'repeat': args.repeat,
+        'results': results,
+    }
+    json_codec.dump_file(report, args.output, indent=2)
+    print(f"Report written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
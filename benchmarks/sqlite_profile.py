@@ -0,0 +1,80 @@
+"""
+Compare writing synthetic bundles with SQLite's default settings against the
+bulk-load profile (journal in memory, synchronous=OFF, larger page cache).
+Rows are prepared up front so only the database work is timed.
+
+Run with: python -m benchmarks.sqlite_profile --resources 100000 --files 20
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from typing import Dict, List
+
+from benchmarks.synthetic import synthetic_bundle
+from refiner.transformer.base_transformer import FileRows
+from refiner.transformer.bulk_writer import model_to_row
+from refiner.transformer.user_transformer import UserTransformer
+
+
+def prepare_rows(n_resources: int, n_files: int) -> List[FileRows]:
+    """Transform n_files synthetic bundles, n_resources entries in total, into row groups."""
+    transformer = UserTransformer(None)
+    prepared = []
+    for seed in range(n_files):
+        groups: Dict = {}
+        for model in transformer.transform(synthetic_bundle(n_resources // n_files, seed)):
+            table, columns, row = model_to_row(model)
+            groups.setdefault((table.name, columns), []).append(row)
+        prepared.append([(table_name, columns, rows) for (table_name, columns), rows in groups.items()])
+    return prepared
+
+
+def run_once(prepared: List[FileRows], db_path: str, bulk_load: bool, optimize: bool = True) -> Dict[str, float]:
+    """
+    Write every file in its own transaction, as the refiner does, and time
+    each phase. Both profiles must be run with the same optimize, so that
+    their finalize phases do the same work.
+    """
+    start = time.perf_counter()
+    # Masking keyed like a real run, without requiring REFINEMENT_ENCRYPTION_KEY
+    transformer = UserTransformer(db_path, upsert=True, bulk_load=bulk_load, pii_key='bench')
+    for file_rows in prepared:
+        transformer.process_rows(file_rows)
+    loaded = time.perf_counter()
+    transformer.finalize(optimize=optimize)
+    finalized = time.perf_counter()
+    return {'load': loaded - start, 'finalize': finalized - loaded, 'total': finalized - start}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="SQLite bulk-load profile benchmark")
+    parser.add_argument('--resources', type=int, default=100000, help="Bundle entries to load in total")
+    parser.add_argument('--files', type=int, default=20, help="Input files, each written in one transaction")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per profile, the median is reported")
+    parser.add_argument('--dir', default=None, help="Directory for the database, e.g. on the target volume")
+    parser.add_argument('--no-optimize', dest='optimize', action='store_false',
+                        help="Skip ANALYZE and VACUUM in finalize, for both profiles")
+    args = parser.parse_args()
+
+    prepared = prepare_rows(args.resources, args.files)
+    with tempfile.TemporaryDirectory(dir=args.dir) as work_dir:
+        db_path = os.path.join(work_dir, 'db.libsql')
+        results = {}
+        for name, bulk_load in (('default', False), ('bulk-load', True)):
+            runs = [run_once(prepared, db_path, bulk_load, args.optimize) for _ in range(args.repeat)]
+            results[name] = {phase: statistics.median(run[phase] for run in runs) for phase in runs[0]}
+            results[name]['size'] = os.path.getsize(db_path)
+
+    optimized = "with" if args.optimize else "without"
+    print(f"{args.resources} resources in {args.files} files, median of {args.repeat} runs, {optimized} ANALYZE and VACUUM")
+    print(f"{'profile':<10} {'load s':>8} {'finalize s':>11} {'total s':>8} {'size KiB':>9}")
+    for name, result in results.items():
+        print(f"{name:<10} {result['load']:>8.3f} {result['finalize']:>11.3f} "
+              f"{result['total']:>8.3f} {result['size'] // 1024:>9}")
+    print(f"bulk-load profile speedup: {results['default']['total'] / results['bulk-load']['total']:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,307 @@
+"""
+Deterministic synthetic input for benchmarks: a Google profile wrapped around
+a Synthea-style FHIR R4 patient bundle.
+"""
+import random
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+# Observations per encounter in the generated bundles
+OBSERVATIONS_PER_ENCOUNTER = 8
+
+_OBSERVATION_CODES = [
+    ("8302-2", "Body Height", "cm", 150.0, 200.0),
+    ("29463-7", "Body Weight", "kg", 45.0, 120.0),
+    ("39156-5", "Body mass index", "kg/m2", 17.0, 35.0),
+    ("8867-4", "Heart rate", "/min", 50.0, 110.0),
+    ("9279-1", "Respiratory rate", "/min", 10.0, 22.0),
+    ("2339-0", "Glucose", "mg/dL", 65.0, 140.0),
+    ("2093-3", "Total Cholesterol", "mg/dL", 140.0, 260.0),
+    ("718-7", "Hemoglobin", "g/dL", 11.0, 17.0),
+]
+
+_CONDITION_CODES = [
+    ("444814009", "Viral sinusitis (disorder)"),
+    ("195662009", "Acute viral pharyngitis (disorder)"),
+    ("10509002", "Acute bronchitis (disorder)"),
+    ("38341003", "Hypertension"),
+]
+
+# Resources generated per encounter, in generation order. DEFAULT_MIX is shaped
+# like a Synthea export; FULL_MIX exercises every resource mapper
+DEFAULT_MIX: Dict[str, int] = {"Observation": OBSERVATIONS_PER_ENCOUNTER, "Condition": 1, "Procedure": 1}
+FULL_MIX: Dict[str, int] = {
+    "Observation": OBSERVATIONS_PER_ENCOUNTER, "Condition": 1, "Procedure": 1,
+    "MedicationRequest": 2, "Immunization": 1, "DiagnosticReport": 1, "Claim": 1,
+}
+MIXES: Dict[str, Dict[str, int]] = {"default": DEFAULT_MIX, "full": FULL_MIX}
+
+_MEDICATION_CODES = [
+    ("314076", "lisinopril 10 MG Oral Tablet"),
+    ("197361", "amlodipine 5 MG Oral Tablet"),
+    ("860975", "24 HR metformin hydrochloride 500 MG Extended Release Oral Tablet"),
+]
+
+_VACCINE_CODES = [
+    ("140", "Influenza, seasonal, injectable, preservative free"),
+    ("113", "Td (adult) preservative free"),
+    ("208", "SARS-COV-2 (COVID-19) vaccine, mRNA, spike protein, LNP, preservative free, 30 mcg/0.3mL dose"),
+]
+
+
+def _timestamp(rng: random.Random) -> str:
+    return (f"{rng.randint(1990, 2023)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+            f"T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00-05:00")
+
+
+def _coding(code: str, display: str, system: str = "http://snomed.info/sct") -> Dict[str, Any]:
+    return {"coding": [{"system": system, "code": code, "display": display}], "text": display}
+
+
+def _entry(resource: Dict[str, Any]) -> Dict[str, Any]:
+    full_url = f"urn:uuid:{resource['id']}"
+    return {
+        "fullUrl": full_url,
+        "resource": resource,
+        "request": {"method": "POST", "url": resource["resourceType"]},
+    }
+
+
+class _Encounter(NamedTuple):
+    """References shared by the resources generated for one encounter."""
+    seed: int
+    number: int
+    start: str
+    patient: Dict[str, str]
+    practitioner: Dict[str, str]
+    organization: Dict[str, str]
+    encounter: Dict[str, str]
+
+
+def _observation(rng: random.Random, encounter: _Encounter, index: int) -> Dict[str, Any]:
+    code, display, unit, low, high = _OBSERVATION_CODES[index % len(_OBSERVATION_CODES)]
+    return {
+        "resourceType": "Observation",
+        "id": f"observation-{encounter.seed}-{encounter.number}-{index}",
+        "status": "final",
+        "category": [_coding("vital-signs", "Vital signs",
+                             "http://terminology.hl7.org/CodeSystem/observation-category")],
+        "code": _coding(code, display, "http://loinc.org"),
+        "subject": encounter.patient,
+        "encounter": encounter.encounter,
+        "effectiveDateTime": encounter.start,
+        "issued": encounter.start,
+        "valueQuantity": {"value": round(rng.uniform(low, high), 2), "unit": unit},
+    }
+
+
+def _condition(rng: random.Random, encounter: _Encounter, index: int) -> Dict[str, Any]:
+    code, display = rng.choice(_CONDITION_CODES)
+    return {
+        "resourceType": "Condition",
+        "id": f"condition-{encounter.seed}-{encounter.number}" + (f"-{index}" if index else ""),
+        "clinicalStatus": {"coding": [{"code": "active"}]},
+        "verificationStatus": {"coding": [{"code": "confirmed"}]},
+        "code": _coding(code, display),
+        "subject": encounter.patient,
+        "encounter": encounter.encounter,
+        "onsetDateTime": encounter.start,
+    }
+
+
+def _procedure(rng: random.Random, encounter: _Encounter, index: int) -> Dict[str, Any]:
+    return {
+        "resourceType": "Procedure",
+        "id": f"procedure-{encounter.seed}-{encounter.number}" + (f"-{index}" if index else ""),
+        "status": "completed",
+        "code": _coding("430193006", "Medication Reconciliation (procedure)"),
+        "subject": encounter.patient,
+        "encounter": encounter.encounter,
+        "performedPeriod": {"start": encounter.start, "end": encounter.start},
+    }
+
+
+def _medication_request(rng: random.Random, encounter: _Encounter, index: int) -> Dict[str, Any]:
+    code, display = rng.choice(_MEDICATION_CODES)
+    return {
+        "resourceType": "MedicationRequest",
+        "id": f"medication-request-{encounter.seed}-{encounter.number}-{index}",
+        "status": "active",
+        "intent": "order",
+        "medicationCodeableConcept": _coding(code, display, "http://www.nlm.nih.gov/research/umls/rxnorm"),
+        "subject": encounter.patient,
+        "encounter": encounter.encounter,
+        "requester": encounter.practitioner,
+        "authoredOn": encounter.start,
+        "dosageInstruction": [{"text": "Take one tablet daily"}],
+    }
+
+
+def _immunization(rng: random.Random, encounter: _Encounter, index: int) -> Dict[str, Any]:
+    code, display = rng.choice(_VACCINE_CODES)
+    return {
+        "resourceType": "Immunization",
+        "id": f"immunization-{encounter.seed}-{encounter.number}-{index}",
+        "status": "completed",
+        "vaccineCode": _coding(code, display, "http://hl7.org/fhir/sid/cvx"),
+        "patient": encounter.patient,
+        "encounter": encounter.encounter,
+        "performer": [{"actor": encounter.practitioner}],
+        "occurrenceDateTime": encounter.start,
+        "lotNumber": f"{rng.randrange(16 ** 6):06x}",
+    }
+
+
+def _diagnostic_report(rng: random.Random, encounter: _Encounter, index: int) -> Dict[str, Any]:
+    return {
+        "resourceType": "DiagnosticReport",
+        "id": f"diagnostic-report-{encounter.seed}-{encounter.number}-{index}",
+        "status": "final",
+        "category": [_coding("LAB", "Laboratory", "http://terminology.hl7.org/CodeSystem/v2-0074")],
+        "code": _coding("51990-0", "Basic metabolic panel", "http://loinc.org"),
+        "subject": encounter.patient,
+        "encounter": encounter.encounter,
+        "performer": [encounter.organization],
+        "effectiveDateTime": encounter.start,
+        "issued": encounter.start,
+        "conclusion": "Within normal limits",
+    }
+
+
+def _claim(rng: random.Random, encounter: _Encounter, index: int) -> Dict[str, Any]:
+    return {
+        "resourceType": "Claim",
+        "id": f"claim-{encounter.seed}-{encounter.number}-{index}",
+        "status": "active",
+        "type": _coding("professional", "Professional",
+                        "http://terminology.hl7.org/CodeSystem/claim-type"),
+        "use": "claim",
+        "patient": encounter.patient,
+        "insurer": encounter.organization,
+        "created": encounter.start,
+        "total": {"value": round(rng.uniform(50.0, 2500.0), 2), "currency": "USD"},
+    }
+
+
+_RESOURCE_BUILDERS: Dict[str, Callable[[random.Random, _Encounter, int], Dict[str, Any]]] = {
+    "Observation": _observation,
+    "Condition": _condition,
+    "Procedure": _procedure,
+    "MedicationRequest": _medication_request,
+    "Immunization": _immunization,
+    "DiagnosticReport": _diagnostic_report,
+    "Claim": _claim,
+}
+
+
+def synthetic_entries(n_resources: int, seed: int = 0, mix: Optional[Dict[str, int]] = None) -> List[Dict[str, Any]]:
+    """
+    Generate bundle entries for one patient.
+
+    Args:
+        n_resources: Number of entries to generate, at least 3
+        seed: Seed making the output reproducible
+        mix: Resources generated per encounter by resourceType, DEFAULT_MIX if not given
+
+    Returns:
+        List of bundle entries
+    """
+    mix = DEFAULT_MIX if mix is None else mix
+    unknown = set(mix) - set(_RESOURCE_BUILDERS)
+    if unknown:
+        raise ValueError(f"Cannot generate resource types: {', '.join(sorted(unknown))}")
+
+    rng = random.Random(seed)
+    patient_id = f"patient-{seed}"
+    organization_id = f"organization-{seed}"
+    practitioner_id = f"practitioner-{seed}"
+    patient_ref = {"reference": f"urn:uuid:{patient_id}"}
+    practitioner_ref = {"reference": f"urn:uuid:{practitioner_id}"}
+    organization_ref = {"reference": f"urn:uuid:{organization_id}"}
+
+    entries = [
+        _entry({
+            "resourceType": "Patient",
+            "id": patient_id,
+            "name": [{"use": "official", "family": "Doe", "given": ["Jane"], "prefix": ["Ms."]}],
+            "gender": "female",
+            "birthDate": "1980-02-03",
+            "address": [{"line": ["1 Main St"], "city": "Boston", "state": "MA",
+                         "postalCode": "02110", "country": "US"}],
+            "telecom": [{"system": "phone", "value": "555-555-1234", "use": "home"}],
+            "identifier": [
+                {"system": "http://hl7.org/fhir/sid/us-ssn", "value": "999-11-2222",
+                 "type": {"coding": [{"code": "SS"}]}},
+                {"system": "urn:oid:2.16.840.1.113883.4.3.25", "value": "S99999999",
+                 "type": {"coding": [{"code": "DL"}]}},
+            ],
+            "extension": [
+                {"url": "http://hl7.org/fhir/StructureDefinition/patient-mothersMaidenName",
+                 "valueString": "Smith"},
+            ],
+            "maritalStatus": {"coding": [{"code": "M", "display": "Married"}]},
+        }),
+        _entry({
+            "resourceType": "Organization",
+            "id": organization_id,
+            "name": "General Hospital",
+            "type": [{"coding": [{"code": "prov", "display": "Healthcare Provider"}]}],
+            "address": [{"line": ["2 Hospital Rd"], "city": "Boston", "state": "MA"}],
+        }),
+        _entry({
+            "resourceType": "Practitioner",
+            "id": practitioner_id,
+            "identifier": [{"system": "http://hl7.org/fhir/sid/us-npi", "value": f"99{seed:08d}"}],
+            "name": [{"family": "Who", "given": ["Doc"], "prefix": ["Dr."]}],
+            "gender": "male",
+        }),
+    ]
+
+    encounter_number = 0
+    while len(entries) < n_resources:
+        encounter_id = f"encounter-{seed}-{encounter_number}"
+        start = _timestamp(rng)
+        entries.append(_entry({
+            "resourceType": "Encounter",
+            "id": encounter_id,
+            "status": "finished",
+            "class": {"code": "AMB"},
+            "type": [_coding("185349003", "Encounter for check up")],
+            "subject": patient_ref,
+            "participant": [{"individual": practitioner_ref}],
+            "period": {"start": start, "end": start},
+            "serviceProvider": organization_ref,
+        }))
+        encounter = _Encounter(seed, encounter_number, start, patient_ref, practitioner_ref,
+                               organization_ref, {"reference": f"urn:uuid:{encounter_id}"})
+        for resource_type, count in mix.items():
+            build = _RESOURCE_BUILDERS[resource_type]
+            for index in range(count):
+                entries.append(_entry(build(rng, encounter, index)))
+        encounter_number += 1
+
+    return entries[:n_resources]
+
+
+def synthetic_bundle(n_resources: int, seed: int = 0, mix: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+    """
+    Generate a complete input file: Google profile fields plus a FHIR bundle.
+
+    Args:
+        n_resources: Number of bundle entries
+        seed: Seed making the output reproducible
+        mix: Resources generated per encounter by resourceType, DEFAULT_MIX if not given
+
+    Returns:
+        Dictionary in the shape of an input JSON file
+    """
+    return {
+        "userId": f"user-{seed}",
+        "email": f"user{seed}@example.com",
+        "timestamp": 1704067200000,
+        "profile": {"name": "Jane Doe", "locale": "en"},
+        "storage": {"percentUsed": 12.5},
+        "metadata": {"source": "Google", "collectionDate": "2024-01-01T00:00:00Z", "dataType": "profile"},
+        "resourceType": "Bundle",
+        "type": "transaction",
+        "entry": synthetic_entries(n_resources, seed, mix),
+    }
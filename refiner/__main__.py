@@ -1,47 +1,94 @@
-import json
+import argparse
 import logging
 import os
 import sys
 import traceback
 import zipfile
 
-from refiner.refine import Refiner
-from refiner.config import settings
-
+# Everything else is imported when first needed: the container refines a
+# single job, so start-up time is paid on every refinement
 logging.basicConfig(level=logging.INFO, format='%(message)s')
 
 
-def run() -> None:
-    """Transform all input files into the database."""
+def run(transform_executor=None) -> None:
+    """
+    Transform all input files into the database.
+    :param transform_executor: Process pool for TRANSFORM_WORKERS to reuse, kept warm by a batch worker
+    """
+    from refiner.config import settings
+
     input_files_exist = os.path.isdir(settings.INPUT_DIR) and bool(os.listdir(settings.INPUT_DIR))
 
     if not input_files_exist:
         raise FileNotFoundError(f"No input files found in {settings.INPUT_DIR}")
     extract_input()
 
-    refiner = Refiner()
+    from refiner.refine import Refiner
+    from refiner.utils import json_codec
+
+    refiner = Refiner(transform_executor)
     output = refiner.transform()
     
     output_path = os.path.join(settings.OUTPUT_DIR, "output.json")
-    with open(output_path, 'w') as f:
-        json.dump(output.model_dump(), f, indent=2)    
+    json_codec.dump_file(output.model_dump(), output_path, indent=2)
     logging.info(f"Data transformation complete: {output}")
 
 
 def extract_input() -> None:
     """
-    If the input directory contains any zip files, extract them
+    If the input directory contains any zip files, extract them, unless
+    ZIP_STREAMING is enabled and the refiner reads them in place
     :return:
     """
+    from refiner.config import settings
+    from refiner.utils.archive import extract_archives
+
+    if settings.ZIP_STREAMING:
+        return
+
+    archives = []
     for input_filename in os.listdir(settings.INPUT_DIR):
         input_file = os.path.join(settings.INPUT_DIR, input_filename)
 
         if zipfile.is_zipfile(input_file):
-            with zipfile.ZipFile(input_file, 'r') as zip_ref:
-                zip_ref.extractall(settings.INPUT_DIR)
+            archives.append(input_file)
+
+    extract_archives(
+        archives,
+        settings.INPUT_DIR,
+        max_members=settings.ZIP_MAX_MEMBERS,
+        max_total_size=settings.ZIP_MAX_UNCOMPRESSED_MB * 1024 * 1024
+    )
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog='python -m refiner', description="Refine the input files into an encrypted database")
+    parser.add_argument('--profile-startup', nargs='?', const='', default=None, metavar='REPORT',
+                        help="Report the import time of each stage of a run instead of refining, "
+                             "optionally writing it as JSON to REPORT")
+    commands = parser.add_subparsers(dest='command')
+
+    batch = commands.add_parser('batch', help="Refine a queue of jobs, each with its own directories and key, in one process")
+    jobs = batch.add_mutually_exclusive_group(required=True)
+    jobs.add_argument('--manifest', help="JSON-lines file with one job per line")
+    jobs.add_argument('--jobs-dir', help="Directory of job folders, each ready once it holds a job.json")
+    batch.add_argument('--poll', type=float, default=None, metavar='SECONDS',
+                       help="Keep watching --jobs-dir for new job folders, checking at this interval")
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
+    args = parse_args()
+    if args.profile_startup is not None:
+        from refiner.utils.startup import profile_startup
+        profile_startup(args.profile_startup or None)
+        sys.exit(0)
+
+    if args.command == 'batch':
+        from refiner.batch import run_batch
+        failed = run_batch(run, manifest_path=args.manifest, jobs_dir=args.jobs_dir, poll_interval=args.poll)
+        sys.exit(1 if failed else 0)
+
     try:
         run()
     except Exception as e:
@@ -0,0 +1,243 @@
+"""
+Batch worker refining a queue of jobs in one warm process. Each job has its
+own input directory, output directory and encryption key. Imports, the model
+metadata, the IPFS session and the transform worker pool are set up once and
+shared by every job. The keys are not: each job runs on its own copy of the
+settings, dropped when the job ends, and transform workers are spawned rather
+than forked so they never hold a copy of a job's key.
+"""
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, List, NamedTuple, Optional
+
+from refiner.config import override_settings, settings
+from refiner.utils import json_codec
+
+# Written last by whoever queues a job folder, marking it ready
+JOB_FILE = 'job.json'
+# Written to the output directory of every finished job, successful or not
+RESULT_FILE = 'result.json'
+
+
+class Job(NamedTuple):
+    """One refinement job and the keys it is refined with."""
+    job_id: str
+    input_dir: str
+    output_dir: str
+    encryption_key: str
+    pii_hmac_key: Optional[str] = None
+    # Why the job's description could not be read: such a job fails without running
+    error: Optional[str] = None
+
+    def __repr__(self) -> str:
+        # Keep the keys out of logs and tracebacks
+        return f"Job(job_id={self.job_id!r}, input_dir={self.input_dir!r}, output_dir={self.output_dir!r})"
+
+
+def _job_from_record(record: Any, job_id: str, base_dir: str, default_input_dir: Optional[str] = None,
+                     default_output_dir: Optional[str] = None) -> Job:
+    """
+    Build a job from its JSON description.
+
+    Args:
+        record: Object with encryption_key, input_dir, output_dir and optionally id and pii_hmac_key
+        job_id: Id of the job when the record has none
+        base_dir: Directory relative paths are resolved against
+        default_input_dir: Input directory when the record has none
+        default_output_dir: Output directory when the record has none
+
+    Returns:
+        The job
+    """
+    if not isinstance(record, dict):
+        raise ValueError(f"Job {job_id} is not a JSON object")
+    job_id = str(record.get('id') or job_id)
+    input_dir = record.get('input_dir') or default_input_dir
+    output_dir = record.get('output_dir') or default_output_dir
+    if not record.get('encryption_key'):
+        raise ValueError(f"Job {job_id} has no encryption_key")
+    if not input_dir or not output_dir:
+        raise ValueError(f"Job {job_id} needs an input_dir and an output_dir")
+    return Job(
+        job_id=job_id,
+        input_dir=os.path.join(base_dir, input_dir),
+        output_dir=os.path.join(base_dir, output_dir),
+        encryption_key=record['encryption_key'],
+        pii_hmac_key=record.get('pii_hmac_key')
+    )
+
+
+def _invalid_job(job_id: str, error: Exception, output_dir: Optional[str] = None) -> Job:
+    """A job whose description is not valid, recording its failure in output_dir if known."""
+    return Job(job_id=job_id, input_dir='', output_dir=output_dir or '', encryption_key='', error=str(error))
+
+
+def read_manifest(manifest_path: str) -> List[Job]:
+    """
+    Read jobs from a JSON-lines manifest, one object per line such as
+    {"id": "a", "input_dir": "a/in", "output_dir": "a/out", "encryption_key": "..."}.
+    Relative directories are resolved against the manifest's directory. A line
+    that is not a valid job becomes a job that fails, so it does not stop the others.
+
+    Args:
+        manifest_path: Path of the manifest
+
+    Returns:
+        Jobs in manifest order
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    jobs = []
+    with open(manifest_path, 'rb') as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            record = None
+            try:
+                record = json_codec.loads(line)
+                jobs.append(_job_from_record(record, str(line_number), base_dir))
+            except (ValueError, TypeError) as e:
+                job_id, output_dir = str(line_number), None
+                if isinstance(record, dict):
+                    job_id = str(record.get('id') or job_id)
+                    if isinstance(record.get('output_dir'), str):
+                        output_dir = os.path.join(base_dir, record['output_dir'])
+                jobs.append(_invalid_job(job_id, e, output_dir))
+    return jobs
+
+
+def pending_jobs(jobs_dir: str) -> List[Job]:
+    """
+    List the job folders in jobs_dir that are ready and not yet refined. A
+    folder is ready once it holds a job.json, which takes the same fields as
+    a manifest line; input_dir and output_dir default to its input/ and output/
+    subfolders. A folder is done once its output directory holds a result.json.
+    A job.json that is not a valid job becomes a job that fails, writing the
+    result.json that keeps the folder from being picked up again.
+
+    Args:
+        jobs_dir: Directory of job folders
+
+    Returns:
+        Pending jobs in folder name order
+    """
+    jobs = []
+    for name in sorted(os.listdir(jobs_dir)):
+        job_dir = os.path.join(jobs_dir, name)
+        job_file = os.path.join(job_dir, JOB_FILE)
+        if not os.path.isfile(job_file):
+            continue
+        try:
+            job = _job_from_record(json_codec.load_file(job_file), name, job_dir, 'input', 'output')
+        except (ValueError, TypeError) as e:
+            job = _invalid_job(name, e, os.path.join(job_dir, 'output'))
+        if not os.path.exists(os.path.join(job.output_dir, RESULT_FILE)):
+            jobs.append(job)
+    return jobs
+
+
+def _write_result(output_dir: str, job_id: str, error: Optional[str], seconds: float) -> None:
+    result = {
+        'job': job_id,
+        'status': 'failed' if error else 'succeeded',
+        'error': error,
+        'seconds': round(seconds, 3),
+    }
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+        json_codec.dump_file(result, os.path.join(output_dir, RESULT_FILE), indent=2)
+    except OSError as e:
+        logging.warning(f"Could not write the result of job {job_id}: {e}")
+
+
+def run_job(job: Job, refine: Callable[[Optional[ProcessPoolExecutor]], None],
+            transform_executor: Optional[ProcessPoolExecutor] = None) -> bool:
+    """
+    Refine one job with its directories and keys in the settings, then record its result.
+
+    Args:
+        job: The job
+        refine: Runs a refinement from the current settings, such as refiner.__main__.run
+        transform_executor: Shared process pool for TRANSFORM_WORKERS
+
+    Returns:
+        True if the job succeeded
+    """
+    if job.error is not None:
+        logging.error(f"Invalid job {job.job_id}: {job.error}")
+        if job.output_dir:
+            _write_result(job.output_dir, job.job_id, job.error, 0.0)
+        return False
+
+    logging.info(f"Starting job {job.job_id}")
+    start = time.perf_counter()
+    error = None
+    try:
+        os.makedirs(job.output_dir, exist_ok=True)
+        with override_settings(
+            INPUT_DIR=job.input_dir,
+            OUTPUT_DIR=job.output_dir,
+            REFINEMENT_ENCRYPTION_KEY=job.encryption_key,
+            # Never fall back to a PII key shared by the whole worker
+            PII_HMAC_KEY=job.pii_hmac_key
+        ):
+            refine(transform_executor)
+    except Exception as e:
+        error = str(e) or type(e).__name__
+        logging.error(f"Job {job.job_id} failed: {error}", exc_info=True)
+
+    seconds = time.perf_counter() - start
+    _write_result(job.output_dir, job.job_id, error, seconds)
+    logging.info(f"Job {job.job_id} {'failed' if error else 'succeeded'} in {seconds:.2f}s")
+    return error is None
+
+
+def run_batch(refine: Callable[[Optional[ProcessPoolExecutor]], None], manifest_path: Optional[str] = None,
+              jobs_dir: Optional[str] = None, poll_interval: Optional[float] = None) -> int:
+    """
+    Refine the jobs of a manifest, or the pending job folders of a directory,
+    one after another.
+
+    Args:
+        refine: Runs a refinement from the current settings, such as refiner.__main__.run
+        manifest_path: JSON-lines manifest of jobs
+        jobs_dir: Directory of job folders, used when no manifest is given
+        poll_interval: Keep watching jobs_dir for new folders, checking every
+            poll_interval seconds, until interrupted
+
+    Returns:
+        Number of failed jobs
+    """
+    if not manifest_path and not jobs_dir:
+        raise ValueError("Either a manifest or a jobs directory is required")
+
+    transform_executor = None
+    if settings.TRANSFORM_WORKERS > 1:
+        # Spawned workers start from a fresh interpreter instead of a copy of this one
+        transform_executor = ProcessPoolExecutor(
+            max_workers=settings.TRANSFORM_WORKERS,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+
+    failed = 0
+    try:
+        if manifest_path:
+            for job in read_manifest(manifest_path):
+                failed += not run_job(job, refine, transform_executor)
+        else:
+            while True:
+                for job in pending_jobs(jobs_dir):
+                    failed += not run_job(job, refine, transform_executor)
+                if poll_interval is None:
+                    break
+                time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        logging.info("Batch worker interrupted")
+    finally:
+        if transform_executor is not None:
+            transform_executor.shutdown(cancel_futures=True)
+
+    logging.info(f"Batch finished, {failed} failed jobs")
+    return failed
@@ -1,6 +1,8 @@
+from contextlib import contextmanager
+from functools import lru_cache
 from pydantic_settings import BaseSettings
 from pydantic import Field
-from typing import Optional
+from typing import Any, Iterator, Optional
 
 class Settings(BaseSettings):
     """Global settings configuration using environment variables"""
@@ -15,11 +17,21 @@ class Settings(BaseSettings):
         description="Directory where output files will be written"
     )
     
-    REFINEMENT_ENCRYPTION_KEY: str = Field(
+    REFINEMENT_ENCRYPTION_KEY: Optional[str] = Field(
         default=None,
-        description="Key to symmetrically encrypt the refinement. This is derived from the original file encryption key"
+        description="Key to symmetrically encrypt the refinement. This is derived from the original file encryption key. Required, except for batch workers, whose jobs each bring their own"
     )
     
+    PII_HMAC_KEY: Optional[str] = Field(
+        default=None,
+        description="Secret key for HMAC masking of PII columns such as patients.ssn. Defaults to a key derived from REFINEMENT_ENCRYPTION_KEY with HKDF, never the encryption key itself"
+    )
+
+    PII_CACHE_SIZE: int = Field(
+        default=65536,
+        description="Distinct values memoized per masked column, so repeated values are masked once"
+    )
+
     SCHEMA_NAME: str = Field(
         default="HealthDataSov",
         description="Name of the schema"
@@ -39,6 +51,21 @@ class Settings(BaseSettings):
         default="sqlite",
         description="Dialect of the schema"
     )
+
+    SCHEMA_CACHE_ENABLED: bool = Field(
+        default=True,
+        description="Reuse the IPFS hash of a previously uploaded schema with identical content instead of uploading it again"
+    )
+
+    SCHEMA_CACHE_PATH: Optional[str] = Field(
+        default=None,
+        description="File mapping schema hashes to IPFS hashes. Defaults to schema_cache.json in OUTPUT_DIR"
+    )
+
+    SCHEMA_DDL_CACHE_PATH: Optional[str] = Field(
+        default=None,
+        description="File caching the table DDL compiled from the models, keyed by a fingerprint of their sources, e.g. written once into the image. Compiled once per process when unset"
+    )
     
     # Optional, required if using https://pinata.cloud (IPFS pinning service)
     PINATA_API_KEY: Optional[str] = Field(
@@ -51,6 +78,166 @@ class Settings(BaseSettings):
         description="Pinata API secret"
     )
 
+    PINATA_API_URL: str = Field(
+        default="https://api.pinata.cloud",
+        description="Base URL of the Pinata API. Point at a local stub server to test uploads offline"
+    )
+
+    IPFS_CONNECT_TIMEOUT: float = Field(
+        default=10.0,
+        description="Seconds to wait for a connection to the IPFS pinning API"
+    )
+
+    IPFS_READ_TIMEOUT: float = Field(
+        default=300.0,
+        description="Seconds to wait for the IPFS pinning API to respond once the request is sent"
+    )
+
+    IPFS_MAX_RETRIES: int = Field(
+        default=5,
+        description="Times an upload is retried after a connection error, timeout, 429 or 5xx response"
+    )
+
+    IPFS_RETRY_BACKOFF: float = Field(
+        default=0.5,
+        description="Base delay in seconds of the jittered exponential backoff between upload retries"
+    )
+
+    JSON_BACKEND: str = Field(
+        default="auto",
+        description="JSON library used to decode input files and encode outputs: 'orjson', 'msgspec', 'json' or 'auto' for the fastest installed"
+    )
+
+    INCREMENTAL_REFINEMENT: bool = Field(
+        default=False,
+        description="Merge into the database of the previous run, refining only resources whose content changed and deleting those no longer submitted. The content hashes are kept out of the published database, encrypted in db.libsql.hashes.pgp in OUTPUT_DIR. Requires MERGE_INPUT_FILES"
+    )
+
+    PREVIOUS_DATABASE_PATH: Optional[str] = Field(
+        default=None,
+        description="Encrypted database of the previous run for INCREMENTAL_REFINEMENT (defaults to OUTPUT_DIR/db.libsql.pgp, which incremental runs always write). Its resource hashes are read from the .hashes.pgp file next to it, e.g. db.libsql.hashes.pgp. Refines from scratch, with a warning, if missing"
+    )
+
+    MERGE_INPUT_FILES: bool = Field(
+        default=True,
+        description="Refine all input files into a single database that is encrypted and uploaded once. Rows sharing a primary key are upserted"
+    )
+
+    TRANSFORM_WORKERS: int = Field(
+        default=1,
+        description="Number of worker processes parsing and validating input files when MERGE_INPUT_FILES is enabled. Rows are written by the main process"
+    )
+
+    ZIP_STREAMING: bool = Field(
+        default=False,
+        description="Read JSON files straight out of zip archives in INPUT_DIR instead of extracting them first"
+    )
+
+    ZIP_MAX_MEMBERS: int = Field(
+        default=10000,
+        description="Maximum number of files in all zip archives of INPUT_DIR together"
+    )
+
+    ZIP_MAX_UNCOMPRESSED_MB: int = Field(
+        default=8192,
+        description="Maximum uncompressed size of all zip archives of INPUT_DIR together, in MiB"
+    )
+
+    TRUSTED_INPUT: bool = Field(
+        default=False,
+        description="Skip pydantic validation of bundle entries that proof-of-contribution has already checked. Patient resources and bundle headers are still validated"
+    )
+
+    STREAMING_INGEST: bool = Field(
+        default=False,
+        description="Stream the FHIR bundle 'entry' array instead of loading each input file into memory"
+    )
+
+    STREAM_CHUNK_SIZE: int = Field(
+        default=64 * 1024,
+        description="Number of characters read from an input file at a time when streaming"
+    )
+
+    INSERT_BATCH_SIZE: int = Field(
+        default=5000,
+        description="Number of rows written to the database per batch"
+    )
+
+    BULK_INSERT: bool = Field(
+        default=True,
+        description="Write rows with executemany-style Core inserts grouped by table. Set to false to use the ORM session"
+    )
+
+    SQLITE_BULK_LOAD: bool = Field(
+        default=True,
+        description="Load the database with journaling in memory and fsyncs off, restoring safe settings before it is encrypted"
+    )
+
+    SQLITE_CACHE_SIZE_MB: int = Field(
+        default=64,
+        description="SQLite page cache size in MiB used while loading the database"
+    )
+
+    SQLITE_PAGE_SIZE: int = Field(
+        default=4096,
+        description="SQLite page size in bytes of the refined database"
+    )
+
+    SQLITE_SECONDARY_INDEXES: bool = Field(
+        default=True,
+        description="Build indexes on the foreign key and date columns once all rows are loaded"
+    )
+
+    SQLITE_IN_MEMORY: bool = Field(
+        default=False,
+        description="Build the database in memory and write it to OUTPUT_DIR once, after ingest and indexing. Useful when OUTPUT_DIR is on a slow network filesystem"
+    )
+
+    SQLITE_IN_MEMORY_MAX_MB: int = Field(
+        default=512,
+        description="Build on disk instead when the input files exceed this size, and move an in-memory database to disk once it outgrows it"
+    )
+
+    SQLITE_OPTIMIZE: bool = Field(
+        default=True,
+        description="Run ANALYZE and VACUUM on the database after loading"
+    )
+
+    STREAMING_ENCRYPTION: bool = Field(
+        default=True,
+        description="Encrypt the database in fixed-size chunks straight to disk. Set to false to build the whole message in memory with pgpy"
+    )
+
+    FUSED_ENCRYPT_UPLOAD: bool = Field(
+        default=True,
+        description="Stream the encrypted database straight into the IPFS upload instead of writing db.libsql.pgp and reading it back. Requires STREAMING_ENCRYPTION"
+    )
+
+    KEEP_ENCRYPTED_DATABASE: bool = Field(
+        default=False,
+        description="Debug option: also write db.libsql.pgp to OUTPUT_DIR when the encrypted database is streamed to IPFS. Always written with INCREMENTAL_REFINEMENT, which merges into it on the next run"
+    )
+
+    ENCRYPTION_ARMOR: bool = Field(
+        default=True,
+        description="Write db.libsql.pgp as an ASCII-armored message. Set to false to write raw binary packets, about 25% smaller"
+    )
+
+    COLUMNAR_EXPORT: bool = Field(
+        default=False,
+        description="Also export the refined tables as Parquet files, with dictionary-encoded code and display columns, in one encrypted archive uploaded next to the database for analytics. Requires pyarrow"
+    )
+
+    COLUMNAR_COMPRESSION: str = Field(
+        default="zstd",
+        description="Compression codec of the Parquet export: 'zstd', 'snappy', 'gzip', 'lz4' or 'none'"
+    )
+
+    METRICS_FILE: Optional[str] = Field(
+        default="metrics.json",
+        description="File in OUTPUT_DIR receiving per-stage timings, row and byte counters and peak memory of each run. Empty to disable"
+    )
+
     IPFS_GATEWAY_URL: str = Field(
         default="https://gateway.pinata.cloud/ipfs",
         description="IPFS gateway URL for accessing uploaded files. Recommended to use own dedicated gateway to avoid congestion and rate limiting. Example: 'https://ipfs.my-dao.org/ipfs' (Note: won't work for third-party files)"
@@ -60,4 +247,42 @@ class Settings(BaseSettings):
         env_file = ".env"
         case_sensitive = True
 
-settings = Settings() 
\ No newline at end of file
+
+@lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    """Read the settings from the environment and .env, once, on first use."""
+    return Settings()
+
+
+class LazySettings:
+    """Stands in for the Settings instance, deferring get_settings() until a setting is first read"""
+
+    # Copy of the settings replaced by override_settings, if any
+    _active: Optional[Settings] = None
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._active or get_settings(), name)
+
+
+settings = LazySettings()
+
+
+@contextmanager
+def override_settings(**values: Any) -> Iterator[Settings]:
+    """
+    Replace some settings for the duration of the block, e.g. the directories
+    and keys of one batch job. The copy is dropped when the block exits.
+    Process-wide, so blocks must not run concurrently.
+
+    Args:
+        values: Settings to replace, by field name
+
+    Returns:
+        Context manager yielding the settings in effect inside the block
+    """
+    previous = settings._active
+    settings._active = (previous or get_settings()).model_copy(update=values)
+    try:
+        yield settings._active
+    finally:
+        settings._active = previous
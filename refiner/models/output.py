@@ -1,8 +1,19 @@
-from typing import Optional
+from typing import List, Optional
 from pydantic import BaseModel
 
 from refiner.models.offchain_schema import OffChainSchema
 
+class ColumnarTable(BaseModel):
+    table_name: str
+    file_name: str
+    row_count: int
+
+class ColumnarExport(BaseModel):
+    url: Optional[str] = None
+    file_format: str = "parquet"
+    tables: List[ColumnarTable] = []
+
 class Output(BaseModel):
     refinement_url: Optional[str] = None
-    schema: Optional[OffChainSchema] = None
\ No newline at end of file
+    schema: Optional[OffChainSchema] = None
+    columnar_export: Optional[ColumnarExport] = None
@@ -14,7 +14,7 @@ class UserRefined(Base):
     __tablename__ = 'users'
     
     user_id = Column(String, primary_key=True)
-    email = Column(String, nullable=False, unique=True)
+    email = Column(String, nullable=False, unique=True, info={'pii': 'email'})
     name = Column(String, nullable=False)
     locale = Column(String, nullable=False)
     created_at = Column(DateTime, nullable=False)
@@ -24,6 +24,9 @@ class UserRefined(Base):
 
 class StorageMetric(Base):
     __tablename__ = 'storage_metrics'
+    __table_args__ = {'info': {'deferred_indexes': [
+        ('user_id',)
+    ]}}
     
     metric_id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(String, ForeignKey('users.user_id'), nullable=False)
@@ -34,6 +37,9 @@ class StorageMetric(Base):
 
 class AuthSource(Base):
     __tablename__ = 'auth_sources'
+    __table_args__ = {'info': {'deferred_indexes': [
+        ('user_id',)
+    ]}}
     
     auth_id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(String, ForeignKey('users.user_id'), nullable=False)
@@ -66,18 +72,19 @@ class Patient(Base):
     birth_place_city = Column(String(100))
     birth_place_state = Column(String(100))
     birth_place_country = Column(String(100))
-    address_line = Column(String(500))
+    # PII is masked on insert, see refiner.utils.pii for the rules
+    address_line = Column(String(500), info={'pii': 'null'})
     address_city = Column(String(100))
     address_state = Column(String(100))
-    address_postal_code = Column(String(20))
+    address_postal_code = Column(String(20), info={'pii': ('truncate', 3)})
     address_country = Column(String(100))
-    address_latitude = Column(DECIMAL(10,8))
-    address_longitude = Column(DECIMAL(11,8))
-    phone = Column(String(20))
+    address_latitude = Column(DECIMAL(10,8), info={'pii': ('truncate', 1)})
+    address_longitude = Column(DECIMAL(11,8), info={'pii': ('truncate', 1)})
+    phone = Column(String(20), info={'pii': 'hmac'})
     language = Column(String(100))
-    ssn = Column(String(20))
-    drivers_license = Column(String(50))
-    mothers_maiden_name = Column(String(255))
+    ssn = Column(String(20), info={'pii': 'hmac'})
+    drivers_license = Column(String(50), info={'pii': 'hmac'})
+    mothers_maiden_name = Column(String(255), info={'pii': 'null'})
     daly = Column(DECIMAL(10,6))
     qaly = Column(DECIMAL(10,6))
     import_date = Column(DateTime, default=datetime.utcnow)
@@ -141,6 +148,11 @@ class Organization(Base):
 
 class Encounter(Base):
     __tablename__ = 'encounters'
+    __table_args__ = {'info': {'deferred_indexes': [
+        ('patient_id', 'start_date'),
+        ('practitioner_id',),
+        ('organization_id',)
+    ]}}
     
     id = Column(String, primary_key=True)
     resource_id = Column(String, nullable=False)
@@ -168,6 +180,11 @@ class Encounter(Base):
 
 class Observation(Base):
     __tablename__ = 'observations'
+    __table_args__ = {'info': {'deferred_indexes': [
+        ('patient_id', 'effective_date_time'),
+        ('encounter_id',),
+        ('performer_id',)
+    ]}}
     
     id = Column(String, primary_key=True)
     resource_id = Column(String, nullable=False)
@@ -197,6 +214,11 @@ class Observation(Base):
 
 class Condition(Base):
     __tablename__ = 'conditions'
+    __table_args__ = {'info': {'deferred_indexes': [
+        ('patient_id', 'onset_date_time'),
+        ('encounter_id',),
+        ('asserter_id',)
+    ]}}
     
     id = Column(String, primary_key=True)
     resource_id = Column(String, nullable=False)
@@ -220,6 +242,11 @@ class Condition(Base):
 
 class MedicationRequest(Base):
     __tablename__ = 'medication_requests'
+    __table_args__ = {'info': {'deferred_indexes': [
+        ('patient_id', 'authored_on'),
+        ('encounter_id',),
+        ('requester_id',)
+    ]}}
     
     id = Column(String, primary_key=True)
     resource_id = Column(String, nullable=False)
@@ -241,6 +268,10 @@ class MedicationRequest(Base):
 
 class Immunization(Base):
     __tablename__ = 'immunizations'
+    __table_args__ = {'info': {'deferred_indexes': [
+        ('patient_id', 'occurrence_date_time'),
+        ('performer_id',)
+    ]}}
     
     id = Column(String, primary_key=True)
     resource_id = Column(String, nullable=False)
@@ -259,6 +290,11 @@ class Immunization(Base):
 
 class DiagnosticReport(Base):
     __tablename__ = 'diagnostic_reports'
+    __table_args__ = {'info': {'deferred_indexes': [
+        ('patient_id', 'effective_date_time'),
+        ('encounter_id',),
+        ('performer_id',)
+    ]}}
     
     id = Column(String, primary_key=True)
     resource_id = Column(String, nullable=False)
@@ -281,6 +317,12 @@ class DiagnosticReport(Base):
 
 class Procedure(Base):
     __tablename__ = 'procedures'
+    __table_args__ = {'info': {'deferred_indexes': [
+        ('patient_id', 'performed_date_time'),
+        ('encounter_id',),
+        ('performer_id',),
+        ('location_id',)
+    ]}}
     
     id = Column(String, primary_key=True)
     resource_id = Column(String, nullable=False)
@@ -302,6 +344,10 @@ class Procedure(Base):
 
 class Claim(Base):
     __tablename__ = 'claims'
+    __table_args__ = {'info': {'deferred_indexes': [
+        ('patient_id', 'created'),
+        ('insurer_id',)
+    ]}}
     
     id = Column(String, primary_key=True)
     resource_id = Column(String, nullable=False)
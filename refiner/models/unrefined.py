@@ -1,5 +1,5 @@
-from typing import List, Literal, Optional, Union
-from pydantic import BaseModel
+from typing import Annotated, Any, Dict, List, Literal, Optional, Union
+from pydantic import BaseModel, ConfigDict, Discriminator, Tag
 from datetime import datetime, date
 
 # ---------------------------------------------------
@@ -95,13 +95,17 @@ class PatientResource(BaseModel):
     communication: Optional[List[Communication]] = None
 
 # Generic fallback for Encounter, Condition, etc.
+# Fields not declared here are kept as raw JSON in model_extra for the resource mappers
 class GenericResource(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
     resourceType: str
     id: Optional[str] = None
     text: Optional[dict] = None
     extension: Optional[List[dict]] = None
     identifier: Optional[List[dict]] = None
-    name: Optional[List[dict]] = None
+    # Organization.name is a plain string, HumanName lists elsewhere
+    name: Optional[Union[str, List[dict]]] = None
     telecom: Optional[List[dict]] = None
     gender: Optional[str] = None
     birthDate: Optional[str] = None
@@ -114,19 +118,60 @@ class GenericResource(BaseModel):
 # ---------------------------------------------------
 # Bundle Entry
 # ---------------------------------------------------
+def _resource_tag(resource: Any) -> str:
+    resource_type = resource.get("resourceType") if isinstance(resource, dict) else getattr(resource, "resourceType", None)
+    return "Patient" if resource_type == "Patient" else "generic"
+
+# Dispatched on resourceType, so each resource is validated against exactly one model
+Resource = Annotated[
+    Union[
+        Annotated[PatientResource, Tag("Patient")],
+        Annotated[GenericResource, Tag("generic")],
+    ],
+    Discriminator(_resource_tag),
+]
+
 class Request(BaseModel):
     method: str
     url: str
 
 class Entry(BaseModel):
     fullUrl: Optional[str] = None
-    resource: Union[PatientResource, GenericResource]
+    resource: Resource
     request: Optional[Request] = None
 
+class TrustedResource:
+    """
+    Attribute view over a raw non-Patient resource, standing in for
+    GenericResource when the input is trusted. Missing fields read as None,
+    like the optional fields of GenericResource.
+    """
+
+    def __init__(self, data: Dict[str, Any]):
+        self.__dict__.update(data)
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return None
+
+def trusted_resource(data: Optional[Dict[str, Any]]) -> Union[PatientResource, TrustedResource, None]:
+    """
+    Wrap a resource from trusted input, such as a bundle proof-of-contribution
+    has already checked, without validating it. Patient resources are still
+    validated, as the mappers rely on their nested models and parsed dates.
+    """
+    if data is None:
+        return None
+    if _resource_tag(data) == "Patient":
+        return PatientResource.model_validate(data)
+    return TrustedResource(data)
+
 # ---------------------------------------------------
 # Bundle Root (Google Profile + FHIR Bundle)
 # ---------------------------------------------------
-class GoogleProfileFHIRPatient(BaseModel):
+class GoogleProfileFHIRHeader(BaseModel):
+    """Top-level bundle fields, validated separately when entries are streamed."""
     userId: str
     email: str
     timestamp: int
@@ -135,4 +180,6 @@ class GoogleProfileFHIRPatient(BaseModel):
     metadata: Metadata
     resourceType: Literal["Bundle"]
     type: Literal["transaction"]
+
+class GoogleProfileFHIRPatient(GoogleProfileFHIRHeader):
     entry: List[Entry]
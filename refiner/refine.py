@@ -1,57 +1,446 @@
-import json
 import logging
 import os
+import time
+import zipfile
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Optional
 
 from refiner.models.offchain_schema import OffChainSchema
-from refiner.models.output import Output
+from refiner.models.output import ColumnarExport, ColumnarTable, Output
+from refiner.models.refined import Base
+from refiner.transformer.columnar import export_parquet, require_pyarrow
+from refiner.transformer.incremental import hashes_path
 from refiner.transformer.user_transformer import UserTransformer
 from refiner.config import settings
-from refiner.utils.encrypt import encrypt_file
-from refiner.utils.ipfs import upload_file_to_ipfs, upload_json_to_ipfs
+from refiner.utils import json_codec
+from refiner.utils.archive import (
+    InputSource, close_archives, input_name, input_size, is_json_input, list_json_members, read_input
+)
+from refiner.utils.schema_cache import SchemaCache, schema_hash
+from refiner.utils.metrics import RefinementMetrics
+
+# refiner.utils.encrypt (pgpy, cryptography) and refiner.utils.ipfs (requests)
+# are imported by the stages that use them, keeping them off the start-up path
 
 class Refiner:
-    def __init__(self):
+    def __init__(self, transform_executor: Optional[ProcessPoolExecutor] = None):
+        """
+        Args:
+            transform_executor: Process pool for TRANSFORM_WORKERS to reuse, e.g.
+                across the jobs of a batch worker, instead of starting one per run
+        """
+        if not settings.REFINEMENT_ENCRYPTION_KEY:
+            raise ValueError("REFINEMENT_ENCRYPTION_KEY not set, please check your environment variables")
+        if settings.COLUMNAR_EXPORT:
+            require_pyarrow()
+        self.transform_executor = transform_executor
         self.db_path = os.path.join(settings.OUTPUT_DIR, 'db.libsql')
+        self.schema_cache = None
+        if settings.SCHEMA_CACHE_ENABLED:
+            self.schema_cache = SchemaCache(
+                settings.SCHEMA_CACHE_PATH or os.path.join(settings.OUTPUT_DIR, 'schema_cache.json')
+            )
+        self.metrics = RefinementMetrics()
+        self._schemas = {}
+        self._schema_uploads = {}
 
     def transform(self) -> Output:
         """Transform all input files into the database."""
         logging.info("Starting data transformation")
         output = Output()
+        self.metrics = RefinementMetrics()
+        self._schemas = {}
+        self._schema_uploads = {}
+        input_files = self._input_files()
+        self.metrics.count('input_files', len(input_files))
+        # Sizes of zip members come from the listing, so this reads no input
+        input_sizes = [input_size(input_file) for input_file in input_files]
+        self.metrics.count('input_bytes', sum(input_sizes))
+
+        try:
+            # Uploads run on these threads while the main thread ingests and encrypts
+            with ThreadPoolExecutor(max_workers=2, thread_name_prefix='refiner-upload') as pool:
+                with self.metrics.stage('total'):
+                    if settings.MERGE_INPUT_FILES:
+                        self._transform_merged(input_files, input_sizes, output, pool)
+                    else:
+                        if settings.INCREMENTAL_REFINEMENT:
+                            logging.warning("INCREMENTAL_REFINEMENT requires MERGE_INPUT_FILES, refining every file from scratch")
+                        self._transform_separately(input_files, input_sizes, output, pool)
+        finally:
+            close_archives()
+            # Written for failed runs too, to show where they spent their time
+            self._write_metrics()
+
+        logging.info(f"Stage timings: {self.metrics.summary()}")
+        logging.info("Data transformation completed successfully")
+        return output
+
+    def _write_metrics(self) -> None:
+        if settings.METRICS_FILE:
+            metrics_path = os.path.join(settings.OUTPUT_DIR, settings.METRICS_FILE)
+            try:
+                self.metrics.write(metrics_path)
+            except OSError as e:
+                logging.warning(f"Could not write metrics to {metrics_path}: {e}")
+
+    def _transform_merged(self, input_files: List[InputSource], input_sizes: List[int], output: Output,
+                          pool: ThreadPoolExecutor) -> None:
+        """Create the schema once and append every file into the same database."""
+        if not input_files:
+            return
 
-        # Iterate through files and transform data
+        if settings.INCREMENTAL_REFINEMENT:
+            self._restore_previous_database()
+        transformer = self._create_transformer(sum(input_sizes), upsert=True, incremental=settings.INCREMENTAL_REFINEMENT)
+        schema_upload = self._start_schema_upload(transformer, output, pool)
+        with self.metrics.stage('ingest'):
+            # Workers cannot see which resources are unchanged, so incremental runs map in this process
+            if settings.TRANSFORM_WORKERS > 1 and len(input_files) > 1 and not settings.INCREMENTAL_REFINEMENT:
+                # Parse and validate in worker processes, write from this one
+                transformer.process_files_parallel(
+                    input_files,
+                    max_workers=settings.TRANSFORM_WORKERS,
+                    streaming=settings.STREAMING_INGEST,
+                    chunk_size=settings.STREAM_CHUNK_SIZE,
+                    executor=self.transform_executor
+                )
+            else:
+                for input_file in input_files:
+                    self._ingest(transformer, input_file)
+        self._finalize(transformer)
+        if settings.INCREMENTAL_REFINEMENT:
+            self._encrypt_resource_hashes()
+        columnar_upload = self._export_columnar(output, pool)
+        self._encrypt_and_upload(output, pool, schema_upload).result()
+        if columnar_upload is not None:
+            columnar_upload.result()
+
+    def _transform_separately(self, input_files: List[InputSource], input_sizes: List[int], output: Output,
+                              pool: ThreadPoolExecutor) -> None:
+        """Refine, encrypt and upload each file into its own database."""
+        database_upload = None
+        columnar_upload = None
+        for input_file, size in zip(input_files, input_sizes):
+            # A streamed upload is still reading the database about to be recreated
+            if database_upload is not None and self._fused_upload():
+                database_upload.result()
+            transformer = self._create_transformer(size)
+            schema_upload = self._start_schema_upload(transformer, output, pool)
+            with self.metrics.stage('ingest'):
+                self._ingest(transformer, input_file)
+            self._finalize(transformer)
+            # The previous uploads read the encrypted files about to be overwritten
+            if columnar_upload is not None:
+                columnar_upload.result()
+            columnar_upload = self._export_columnar(output, pool)
+            if database_upload is not None:
+                database_upload.result()
+            database_upload = self._encrypt_and_upload(output, pool, schema_upload)
+
+        if database_upload is not None:
+            database_upload.result()
+        if columnar_upload is not None:
+            columnar_upload.result()
+
+    def _input_files(self) -> List[InputSource]:
+        """
+        List the JSON files in the input directory and, when ZIP_STREAMING is
+        enabled, the JSON members of the zip archives there.
+        """
+        input_files = []
+        archives = []
         for input_filename in os.listdir(settings.INPUT_DIR):
             input_file = os.path.join(settings.INPUT_DIR, input_filename)
-            if os.path.splitext(input_file)[1].lower() == '.json':
-                with open(input_file, 'r') as f:
-                    input_data = json.load(f)
-
-                    # Transform account data
-                    transformer = UserTransformer(self.db_path)
-                    transformer.process(input_data)
-                    logging.info(f"Transformed {input_filename}")
-                    
-                    # Create a schema based on the SQLAlchemy schema
-                    schema = OffChainSchema(
-                        name=settings.SCHEMA_NAME,
-                        version=settings.SCHEMA_VERSION,
-                        description=settings.SCHEMA_DESCRIPTION,
-                        dialect=settings.SCHEMA_DIALECT,
-                        schema=transformer.get_schema()
+            if is_json_input(input_filename):
+                input_files.append(input_file)
+            elif settings.ZIP_STREAMING and zipfile.is_zipfile(input_file):
+                archives.append(input_file)
+        input_files.extend(list_json_members(
+            archives,
+            max_members=settings.ZIP_MAX_MEMBERS,
+            max_total_size=settings.ZIP_MAX_UNCOMPRESSED_MB * 1024 * 1024
+        ))
+        return input_files
+
+    def _restore_previous_database(self) -> None:
+        """
+        Decrypt the database of the previous run and its resource hashes to
+        db_path, so only the changes are refined into it.
+        """
+        # Never merge into a database left behind by some other run
+        for path in (self.db_path, hashes_path(self.db_path)):
+            if os.path.exists(path):
+                os.remove(path)
+        previous_path = settings.PREVIOUS_DATABASE_PATH or os.path.join(settings.OUTPUT_DIR, 'db.libsql.pgp')
+        if not os.path.exists(previous_path):
+            logging.warning(f"No previous database at {previous_path}, refining from scratch")
+            return
+        from refiner.utils.encrypt import decrypt_file
+
+        # db.libsql.pgp keeps its hashes in db.libsql.hashes.pgp
+        previous_hashes_path = f"{hashes_path(os.path.splitext(previous_path)[0])}.pgp"
+        with self.metrics.stage('decrypt_previous'):
+            try:
+                decrypt_file(settings.REFINEMENT_ENCRYPTION_KEY, previous_path, output_path=self.db_path)
+                if os.path.exists(previous_hashes_path):
+                    decrypt_file(
+                        settings.REFINEMENT_ENCRYPTION_KEY, previous_hashes_path, output_path=hashes_path(self.db_path)
                     )
-                    output.schema = schema
-                        
-                    # Upload the schema to IPFS
-                    schema_file = os.path.join(settings.OUTPUT_DIR, 'schema.json')
-                    with open(schema_file, 'w') as f:
-                        json.dump(schema.model_dump(), f, indent=4)
-                        schema_ipfs_hash = upload_json_to_ipfs(schema.model_dump())
-                        logging.info(f"Schema uploaded to IPFS with hash: {schema_ipfs_hash}")
-                    
-                    # Encrypt and upload the database to IPFS
-                    encrypted_path = encrypt_file(settings.REFINEMENT_ENCRYPTION_KEY, self.db_path)
-                    ipfs_hash = upload_file_to_ipfs(encrypted_path)
-                    output.refinement_url = f"{settings.IPFS_GATEWAY_URL}/{ipfs_hash}"
-                    continue
+            except Exception as e:
+                # pgpy raises a range of errors for damaged or foreign messages
+                logging.warning(f"Could not decrypt the previous database at {previous_path}, refining from scratch: {e}")
+                for path in (self.db_path, hashes_path(self.db_path)):
+                    self._remove_file(path)
+                return
+        logging.info(f"Decrypted previous database from {previous_path}")
 
-        logging.info("Data transformation completed successfully")
-        return output
\ No newline at end of file
+    def _encrypt_resource_hashes(self) -> None:
+        """Encrypt the resource hashes for the next incremental run, leaving no plaintext copy behind."""
+        from refiner.utils.encrypt import encrypt_file
+
+        path = hashes_path(self.db_path)
+        with self.metrics.stage('encrypt_hashes'):
+            encrypt_file(
+                settings.REFINEMENT_ENCRYPTION_KEY,
+                path,
+                streaming=settings.STREAMING_ENCRYPTION,
+                armor=settings.ENCRYPTION_ARMOR
+            )
+        os.remove(path)
+
+    def _create_transformer(self, input_bytes: int, upsert: bool = False,
+                            incremental: bool = False) -> UserTransformer:
+        return UserTransformer(
+            self.db_path,
+            batch_size=settings.INSERT_BATCH_SIZE,
+            bulk_insert=settings.BULK_INSERT,
+            upsert=upsert,
+            bulk_load=settings.SQLITE_BULK_LOAD,
+            cache_size_mb=settings.SQLITE_CACHE_SIZE_MB,
+            page_size=settings.SQLITE_PAGE_SIZE,
+            secondary_indexes=settings.SQLITE_SECONDARY_INDEXES,
+            in_memory=self._build_in_memory(input_bytes),
+            max_memory_mb=settings.SQLITE_IN_MEMORY_MAX_MB,
+            pii_cache_size=settings.PII_CACHE_SIZE,
+            trusted_input=settings.TRUSTED_INPUT,
+            metrics=self.metrics,
+            incremental=incremental,
+            schema_ddl_cache=settings.SCHEMA_DDL_CACHE_PATH
+        )
+
+    def _build_in_memory(self, input_bytes: int) -> bool:
+        """Build in memory only when the input, a rough upper bound of the database size, fits the limit."""
+        if not settings.SQLITE_IN_MEMORY:
+            return False
+        if input_bytes > settings.SQLITE_IN_MEMORY_MAX_MB * 1024 * 1024:
+            logging.info(f"Input is {input_bytes} bytes, building the database on disk")
+            return False
+        return True
+
+    def _ingest(self, transformer: UserTransformer, input_file: InputSource) -> None:
+        """Transform one input file into the transformer's database."""
+        # Transform account data
+        if settings.STREAMING_INGEST:
+            transformer.process_stream(input_file, chunk_size=settings.STREAM_CHUNK_SIZE)
+        else:
+            with self.metrics.stage('decode'):
+                input_data = json_codec.loads(read_input(input_file))
+            transformer.process(input_data)
+        logging.info(f"Transformed {input_name(input_file)}")
+
+    def _finalize(self, transformer: UserTransformer) -> None:
+        """Restore safe SQLite settings and optimize the database before it is encrypted."""
+        with self.metrics.stage('finalize'):
+            transformer.finalize(optimize=settings.SQLITE_OPTIMIZE)
+        self.metrics.count('database_bytes', os.path.getsize(self.db_path))
+
+    def _export_columnar(self, output: Output, pool: ThreadPoolExecutor) -> Optional[Future]:
+        """
+        Export the tables of the finalized database as Parquet files in one
+        archive, encrypt it like the database and upload it in the background.
+        The plaintext archive, which holds the masked PII columns, is removed.
+        """
+        if not settings.COLUMNAR_EXPORT:
+            return None
+        from refiner.utils.encrypt import encrypt_file
+
+        archive_path = os.path.join(settings.OUTPUT_DIR, 'columnar.zip')
+        with self.metrics.stage('columnar_export'):
+            columnar_files = export_parquet(
+                self.db_path, Base.metadata, archive_path, compression=settings.COLUMNAR_COMPRESSION
+            )
+        with self.metrics.stage('columnar_encrypt'):
+            encrypted_path = encrypt_file(
+                settings.REFINEMENT_ENCRYPTION_KEY,
+                archive_path,
+                streaming=settings.STREAMING_ENCRYPTION,
+                armor=settings.ENCRYPTION_ARMOR
+            )
+        os.remove(archive_path)
+        self.metrics.count('columnar_bytes', os.path.getsize(encrypted_path))
+
+        export = ColumnarExport(tables=[
+            ColumnarTable(table_name=f.table_name, file_name=f.file_name, row_count=f.row_count)
+            for f in columnar_files
+        ])
+        output.columnar_export = export
+        return pool.submit(self._upload_columnar, encrypted_path, export)
+
+    def _upload_columnar(self, encrypted_path: str, export: ColumnarExport) -> None:
+        from refiner.utils.ipfs import upload_file_to_ipfs
+
+        with self.metrics.stage('columnar_upload'):
+            ipfs_hash = upload_file_to_ipfs(encrypted_path)
+        export.url = f"{settings.IPFS_GATEWAY_URL}/{ipfs_hash}"
+
+    def _start_schema_upload(self, transformer: UserTransformer, output: Output, pool: ThreadPoolExecutor) -> Future:
+        """
+        Build the schema from the freshly created tables, then write and upload
+        it in the background. It only depends on the table definitions, so it
+        can proceed while the data is ingested. Identical schemas share one upload.
+        """
+        # Create a schema based on the SQLAlchemy schema
+        with self.metrics.stage('schema'):
+            ddl = transformer.get_schema()
+            # Files refined from the same models share one schema and its hash
+            if ddl not in self._schemas:
+                schema = OffChainSchema(
+                    name=settings.SCHEMA_NAME,
+                    version=settings.SCHEMA_VERSION,
+                    description=settings.SCHEMA_DESCRIPTION,
+                    dialect=settings.SCHEMA_DIALECT,
+                    schema=ddl
+                )
+                self._schemas[ddl] = (schema, schema_hash(schema))
+            schema, key = self._schemas[ddl]
+        output.schema = schema
+
+        if key not in self._schema_uploads:
+            self._schema_uploads[key] = pool.submit(self._write_and_upload_schema, schema)
+        return self._schema_uploads[key]
+
+    def _write_and_upload_schema(self, schema: OffChainSchema) -> str:
+        # Upload the schema to IPFS
+        with self.metrics.stage('schema_upload'):
+            schema_file = os.path.join(settings.OUTPUT_DIR, 'schema.json')
+            json_codec.dump_file(schema.model_dump(), schema_file, indent=4)
+            return self._upload_schema(schema)
+
+    def _fused_upload(self) -> bool:
+        return settings.FUSED_ENCRYPT_UPLOAD and settings.STREAMING_ENCRYPTION
+
+    def _encrypt_and_upload(self, output: Output, pool: ThreadPoolExecutor, schema_upload: Future) -> Future:
+        """Encrypt the database, then upload it in the background once its schema is uploaded."""
+        if self._fused_upload():
+            # Never publish a database whose schema failed to upload
+            schema_upload.result()
+            return pool.submit(self._encrypt_and_upload_stream, output)
+
+        from refiner.utils.encrypt import encrypt_file
+
+        # Encrypt and upload the database to IPFS
+        with self.metrics.stage('encrypt'):
+            encrypted_path = encrypt_file(
+                settings.REFINEMENT_ENCRYPTION_KEY,
+                self.db_path,
+                streaming=settings.STREAMING_ENCRYPTION,
+                armor=settings.ENCRYPTION_ARMOR
+            )
+        self._log_encrypted_size(os.path.getsize(encrypted_path))
+        # Never publish a database whose schema failed to upload
+        schema_upload.result()
+        return pool.submit(self._upload_database, encrypted_path, output)
+
+    def _encrypt_and_upload_stream(self, output: Output) -> None:
+        """
+        Encrypt the database straight into the upload request body, without an
+        encrypted copy on disk. encrypt_upload times the two together; the time
+        spent producing the encrypted chunks is also recorded as encrypt, so
+        the stage can be compared with runs that encrypt to disk first.
+        """
+        from refiner.utils.encrypt import iter_encrypted_file
+        from refiner.utils.ipfs import upload_chunks_to_ipfs
+
+        encrypted_name = f"{os.path.basename(self.db_path)}.pgp"
+        # An incremental run merges into this copy next time
+        keep_copy = settings.KEEP_ENCRYPTED_DATABASE or settings.INCREMENTAL_REFINEMENT
+        copy_path = os.path.join(settings.OUTPUT_DIR, encrypted_name) if keep_copy else None
+        # The previous copy is only replaced once a complete message has been uploaded
+        temp_path = f"{copy_path}.tmp" if copy_path is not None else None
+        sizes = []
+        encrypt_seconds = [0.0]
+
+        def encrypted_chunks():
+            # Called again from the start if the upload is retried
+            sizes.clear()
+            size = 0
+            chunks = iter_encrypted_file(
+                settings.REFINEMENT_ENCRYPTION_KEY,
+                self.db_path,
+                armor=settings.ENCRYPTION_ARMOR,
+                copy_path=temp_path
+            )
+            while True:
+                start = time.perf_counter()
+                chunk = next(chunks, None)
+                encrypt_seconds[0] += time.perf_counter() - start
+                if chunk is None:
+                    break
+                size += len(chunk)
+                yield chunk
+            sizes.append(size)
+
+        try:
+            with self.metrics.stage('encrypt_upload'):
+                ipfs_hash = upload_chunks_to_ipfs(encrypted_chunks, encrypted_name)
+        except BaseException:
+            self._remove_file(temp_path)
+            raise
+        finally:
+            self.metrics.add_time('encrypt', encrypt_seconds[0])
+
+        if sizes:
+            self._log_encrypted_size(sizes[-1])
+            if temp_path is not None:
+                os.replace(temp_path, copy_path)
+        else:
+            logging.warning("The upload did not read the encrypted database to its end, its size is unknown")
+            # A truncated copy would fail to decrypt in the next incremental run
+            self._remove_file(temp_path)
+        output.refinement_url = f"{settings.IPFS_GATEWAY_URL}/{ipfs_hash}"
+
+    @staticmethod
+    def _remove_file(path: Optional[str]) -> None:
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+
+    def _log_encrypted_size(self, encrypted_size: int) -> None:
+        self.metrics.count('encrypted_bytes', encrypted_size)
+        if not settings.ENCRYPTION_ARMOR:
+            from refiner.utils.encrypt import armored_size
+            saved = armored_size(encrypted_size) - encrypted_size
+            logging.info(f"Encrypted database is {encrypted_size} bytes in binary form, {saved} bytes smaller than ASCII armor")
+
+    def _upload_database(self, encrypted_path: str, output: Output) -> None:
+        from refiner.utils.ipfs import upload_file_to_ipfs
+
+        with self.metrics.stage('database_upload'):
+            ipfs_hash = upload_file_to_ipfs(encrypted_path)
+        output.refinement_url = f"{settings.IPFS_GATEWAY_URL}/{ipfs_hash}"
+
+    def _upload_schema(self, schema: OffChainSchema) -> str:
+        """Upload the schema to IPFS unless identical content was uploaded before."""
+        if self.schema_cache is not None:
+            cached_hash = self.schema_cache.get(schema)
+            if cached_hash:
+                logging.info(f"Schema unchanged, reusing IPFS hash: {cached_hash}")
+                return cached_hash
+
+        from refiner.utils.ipfs import upload_json_to_ipfs
+
+        schema_ipfs_hash = upload_json_to_ipfs(schema.model_dump())
+        logging.info(f"Schema uploaded to IPFS with hash: {schema_ipfs_hash}")
+        if self.schema_cache is not None:
+            self.schema_cache.put(schema, schema_ipfs_hash)
+        return schema_ipfs_hash
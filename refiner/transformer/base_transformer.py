@@ -1,10 +1,32 @@
-from typing import Dict, Any, List
-from sqlalchemy import create_engine
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, Type
+from sqlalchemy import create_engine, delete, or_
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 from refiner.models.refined import Base
+from refiner.transformer.bulk_writer import BulkWriter, model_to_row, unique_constraints
+from refiner.transformer.incremental import ResourceHashes, hashes_path, supports_incremental
+from refiner.transformer.indexes import create_deferred_indexes
+from refiner.transformer.schema_ddl import CompiledSchema, compiled_schema, schema_mismatches, stored_tables
+from refiner.transformer.sqlite_profile import (
+    apply_pragmas, attach_bulk_load_profile, finalize_database, optimize_database, SAFE_PRAGMAS
+)
+from refiner.utils import json_codec
+from refiner.utils.archive import InputSource, input_name, open_input, read_input
+from refiner.utils.json_stream import DEFAULT_CHUNK_SIZE, iter_bundle_entries, read_bundle_header
+from refiner.utils.metrics import RefinementMetrics
+from refiner.utils.pii import DEFAULT_CACHE_SIZE, PIIMasker
+import multiprocessing
 import sqlite3
 import os
 import logging
+import time
+
+# Rows of one input file as (table name, column names, row tuples) groups,
+# compact enough to send from worker processes to the writer
+FileRows = List[Tuple[str, Tuple[str, ...], List[Tuple[Any, ...]]]]
 
 class DataTransformer:
     """
@@ -12,23 +34,139 @@ class DataTransformer:
     Users should extend this class and override the transform method
     to customize the transformation process for their specific data.
     """
+
+    # Top-level array holding the records when a file is streamed
+    stream_key = 'entry'
+    # Tables whose rows are not keyed by a resource, emptied and written again
+    # in full by an incremental run
+    rebuilt_tables: Tuple[str, ...] = ()
     
-    def __init__(self, db_path: str):
-        """Initialize the transformer with a database path."""
+    def __init__(self, db_path: Optional[str], batch_size: int = 5000, bulk_insert: bool = True, upsert: bool = False,
+                 bulk_load: bool = True, cache_size_mb: int = 64, page_size: int = 4096,
+                 secondary_indexes: bool = True, in_memory: bool = False, max_memory_mb: int = 512,
+                 pii_key: Optional[str] = None, pii_cache_size: int = DEFAULT_CACHE_SIZE,
+                 trusted_input: bool = False, metrics: Optional[RefinementMetrics] = None,
+                 incremental: bool = False, schema_ddl_cache: Optional[str] = None):
+        """
+        Initialize the transformer with a database path.
+
+        Args:
+            db_path: Path of the SQLite database to create, or None for a
+                transform-only instance such as in a worker process
+            batch_size: Number of rows written per batch
+            bulk_insert: Write rows with Core executemany inserts instead of the ORM session
+            upsert: Replace existing rows on primary key conflicts, so several
+                files can be processed into the same database
+            bulk_load: Load with journaling and fsyncs relaxed until finalize is called
+            cache_size_mb: SQLite page cache size per connection during the load, in MiB
+            page_size: SQLite page size of the new database, in bytes
+            secondary_indexes: Build the indexes declared on the models in finalize
+            in_memory: Build the database in memory and write it to db_path once, in finalize
+            max_memory_mb: Size above which an in-memory database is moved to
+                db_path and the load continues on disk
+            pii_key: Secret key for HMAC masking of PII columns
+            pii_cache_size: Distinct values memoized per masked column
+            trusted_input: Skip validating records that were already checked upstream
+            metrics: Collector for transform and insert times and rows written per table
+            incremental: Merge into the database already at db_path, refined by a
+                previous incremental run, writing only resources that are new or
+                changed and deleting those no longer submitted. The resource
+                hashes are kept in a side database at hashes_path(db_path).
+                Implies upsert and an on-disk build
+            schema_ddl_cache: JSON file caching the DDL compiled from the models
+        """
         self.db_path = db_path
-        self._initialize_database()
+        self.batch_size = batch_size
+        self.bulk_insert = bulk_insert
+        self.upsert = upsert or incremental
+        self.bulk_load = bulk_load
+        self.cache_size_mb = cache_size_mb
+        self.page_size = page_size
+        self.secondary_indexes = secondary_indexes
+        self.in_memory = in_memory and not incremental
+        self.max_memory_mb = max_memory_mb
+        self.trusted_input = trusted_input
+        self.metrics = metrics
+        self.incremental = incremental
+        self.resource_hashes: Optional[ResourceHashes] = None
+        self.schema_ddl_cache = schema_ddl_cache
+        if db_path is not None:
+            self.masker = PIIMasker(Base.metadata, pii_key, pii_cache_size)
+            self._initialize_database()
     
     def _initialize_database(self) -> None:
         """
         Initialize or recreate the database and its tables.
         """
+        if self.incremental and os.path.exists(self.db_path):
+            self._create_engine()
+            if supports_incremental(self.engine, hashes_path(self.db_path)):
+                self._open_incremental()
+                logging.info(f"Refining incrementally into {self.db_path}")
+                return
+            self.engine.dispose()
+            logging.info("Existing database cannot be refined incrementally, rebuilding it")
+
         if os.path.exists(self.db_path):
             os.remove(self.db_path)
             logging.info(f"Deleted existing database at {self.db_path}")
+        # Hashes of some other database would mark resources missing here as unchanged
+        if self.incremental and os.path.exists(hashes_path(self.db_path)):
+            os.remove(hashes_path(self.db_path))
         
-        self.engine = create_engine(f'sqlite:///{self.db_path}')
+        self._create_engine()
+        Base.metadata.create_all(self.engine)
+        if self.incremental:
+            self._open_incremental()
+
+    def _open_incremental(self) -> None:
+        """Load the resource hashes and clear the tables that are rebuilt on every run."""
         Base.metadata.create_all(self.engine)
+        self.resource_hashes = ResourceHashes(hashes_path(self.db_path))
+        with self.engine.begin() as connection:
+            for table_name in self.rebuilt_tables:
+                connection.execute(delete(Base.metadata.tables[table_name]))
+
+    def _create_engine(self) -> None:
+        """Create the engine and session factory for the in-memory or on-disk database."""
+        if self.in_memory:
+            # A single connection shared by every checkout keeps the database alive
+            self.engine = create_engine(
+                'sqlite://',
+                poolclass=StaticPool,
+                connect_args={'check_same_thread': False}
+            )
+        else:
+            self.engine = create_engine(f'sqlite:///{self.db_path}')
+        if self.bulk_load:
+            attach_bulk_load_profile(self.engine, self.cache_size_mb, self.page_size)
         self.Session = sessionmaker(bind=self.engine)
+
+    def _save_to_disk(self) -> None:
+        """Copy the in-memory database to db_path with the SQLite backup API and continue on disk."""
+        source = self.engine.raw_connection()
+        target = sqlite3.connect(self.db_path)
+        try:
+            source.driver_connection.backup(target)
+            apply_pragmas(target, SAFE_PRAGMAS)
+        finally:
+            target.close()
+            source.close()
+        self.engine.dispose()
+        self.in_memory = False
+        self._create_engine()
+        logging.info(f"Saved in-memory database to {self.db_path}")
+
+    def _check_memory_size(self) -> None:
+        """Move an in-memory database to disk once it outgrows max_memory_mb."""
+        if not self.in_memory:
+            return
+        with self.engine.connect() as connection:
+            page_count = connection.exec_driver_sql("PRAGMA page_count").scalar()
+            page_size = connection.exec_driver_sql("PRAGMA page_size").scalar()
+        if page_count * page_size > self.max_memory_mb * 1024 * 1024:
+            logging.info(f"In-memory database exceeded {self.max_memory_mb} MiB, continuing on disk")
+            self._save_to_disk()
     
     def transform(self, data: Dict[str, Any]) -> List[Base]:
         """
@@ -41,18 +179,84 @@ class DataTransformer:
             List of SQLAlchemy model instances to be saved to the database
         """
         raise NotImplementedError("Subclasses must implement transform method")
-    
-    def get_schema(self):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+
+    def transform_stream(self, header: Dict[str, Any], records: Iterable[Any]) -> Iterator[Base]:
+        """
+        Transform a streamed file into SQLAlchemy model instances.
         
-        # Get all table definitions in order
-        schema = []
-        for table in cursor.execute("SELECT sql FROM sqlite_master WHERE type='table' ORDER BY name"):
-            schema.append(table[0] + ";")
+        Args:
+            header: Dictionary containing every top-level field except stream_key
+            records: Iterable yielding the elements of the stream_key array one at a time
+            
+        Returns:
+            Iterator of SQLAlchemy model instances to be saved to the database
+        """
+        raise NotImplementedError("Subclasses must implement transform_stream to support streaming ingest")
+    
+    def get_schema(self) -> str:
+        """
+        DDL of the refined tables, compiled from the models rather than read
+        back from sqlite_master. It is checked against sqlite_master the first
+        time a database is created from the models in this process, and always
+        for a database refined incrementally, which older models may have created.
+
+        Returns:
+            CREATE TABLE statements, then the secondary indexes whether or not
+            finalize has built them yet
+        """
+        schema = compiled_schema(Base.metadata, self.schema_ddl_cache)
+        if self.incremental or schema.fingerprint not in _verified_schemas:
+            # Read through the engine, as the database may only exist in memory
+            with self.engine.connect() as connection:
+                mismatches = schema_mismatches(schema, connection)
+                if mismatches:
+                    logging.warning(
+                        f"Compiled DDL differs from the database for {', '.join(mismatches)}, "
+                        f"using the DDL stored by SQLite"
+                    )
+                    stored = stored_tables(connection, list(schema.tables))
+                    return CompiledSchema(schema.fingerprint, stored, schema.indexes).sql(self.secondary_indexes)
+            if not self.incremental:
+                _verified_schemas.add(schema.fingerprint)
+        return schema.sql(self.secondary_indexes)
+
+    def finalize(self, optimize: bool = True) -> None:
+        """
+        Finish loading: build the secondary indexes in one pass, close the
+        engine's connections, restore durable SQLite settings and, optionally,
+        run ANALYZE and VACUUM. An in-memory database is optimized in memory
+        and then written to db_path in one go. Call once after the last file
+        is processed and before the database file is read elsewhere.
         
-        conn.close()
-        return "\n\n".join(schema)
+        Args:
+            optimize: Refresh planner statistics and compact the file
+        """
+        if self.resource_hashes is not None:
+            with self.engine.begin() as connection:
+                deleted = self.resource_hashes.finish(connection)
+            if self.metrics is not None:
+                self.metrics.count('resources.unchanged', self.resource_hashes.unchanged)
+                self.metrics.count('resources.changed', self.resource_hashes.changed)
+                self.metrics.count('resources.deleted', deleted)
+
+        if self.secondary_indexes:
+            with self.engine.begin() as connection:
+                count = create_deferred_indexes(connection, Base.metadata, if_not_exists=self.incremental)
+            logging.info(f"Created {count} secondary indexes")
+
+        if self.in_memory:
+            if optimize:
+                source = self.engine.raw_connection()
+                try:
+                    optimize_database(source.driver_connection)
+                finally:
+                    source.close()
+            self._save_to_disk()
+            self.engine.dispose()
+            return
+
+        self.engine.dispose()
+        finalize_database(self.db_path, optimize)
 
     def process(self, data: Dict[str, Any]) -> None:
         """
@@ -62,15 +266,231 @@ class DataTransformer:
         Args:
             data: Dictionary containing the JSON data
         """
+        # Transform data into model instances
+        with self._stage('transform'):
+            models = self.transform(data)
+        with self._stage('insert'):
+            self._insert(models)
+
+    def process_stream(self, input_file: InputSource, chunk_size: int = DEFAULT_CHUNK_SIZE) -> None:
+        """
+        Process a JSON file without loading the stream_key array into memory.
+        Records are decoded, transformed and flushed to the database in batches,
+        so peak memory depends on the largest record rather than the file size.
+        
+        Args:
+            input_file: Path to the JSON file, or a JSON member of a zip archive
+            chunk_size: Number of characters read from the file at a time
+        """
+        self._write(self.iter_file_models(input_file, streaming=True, chunk_size=chunk_size))
+
+    def iter_file_models(self, input_file: InputSource, streaming: bool = False,
+                         chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Base]:
+        """
+        Decode a JSON file and transform it into SQLAlchemy model instances.
+        
+        Args:
+            input_file: Path to the JSON file, or a JSON member of a zip archive
+            streaming: Stream the stream_key array instead of loading the whole file
+            chunk_size: Number of characters read from the file at a time when streaming
+            
+        Returns:
+            Iterator of SQLAlchemy model instances
+        """
+        if not streaming:
+            data = json_codec.loads(read_input(input_file))
+            yield from self.transform(data)
+            return
+
+        with open_input(input_file, text=True) as f:
+            header = read_bundle_header(f, self.stream_key, chunk_size)
+
+        with open_input(input_file, text=True) as f:
+            records = iter_bundle_entries(f, self.stream_key, chunk_size)
+            yield from self.transform_stream(header, records)
+
+    def transform_file_rows(self, input_file: InputSource, streaming: bool = False,
+                            chunk_size: int = DEFAULT_CHUNK_SIZE) -> FileRows:
+        """
+        Transform a JSON file into plain row tuples grouped by table, without
+        touching the database.
+        
+        Args:
+            input_file: Path to the JSON file, or a JSON member of a zip archive
+            streaming: Stream the stream_key array instead of loading the whole file
+            chunk_size: Number of characters read from the file at a time when streaming
+            
+        Returns:
+            List of (table name, column names, rows) groups in first-seen order
+        """
+        groups: Dict[Tuple[str, Tuple[str, ...]], List[Tuple[Any, ...]]] = {}
+        for model in self.iter_file_models(input_file, streaming, chunk_size):
+            table, columns, row = model_to_row(model)
+            groups.setdefault((table.name, columns), []).append(row)
+        return [(table_name, columns, rows) for (table_name, columns), rows in groups.items()]
+
+    def process_rows(self, file_rows: FileRows) -> None:
+        """
+        Save rows produced by transform_file_rows in a single transaction.
+        
+        Args:
+            file_rows: Row groups of one input file
+        """
+        with self._stage('insert'), self.engine.begin() as connection:
+            writer = BulkWriter(connection, self.batch_size, upsert=self.upsert, masker=self.masker)
+            for table_name, columns, rows in file_rows:
+                writer.add_rows(Base.metadata.tables[table_name], columns, rows)
+            writer.flush()
+        logging.info(f"Inserted rows: {writer.row_counts}")
+        self._count_rows(writer.row_counts)
+        self._check_memory_size()
+
+    def process_files_parallel(self, input_files: Sequence[InputSource], max_workers: int, streaming: bool = False,
+                               chunk_size: int = DEFAULT_CHUNK_SIZE,
+                               executor: Optional[ProcessPoolExecutor] = None) -> None:
+        """
+        Decode, validate and transform files in worker processes while this
+        process, the only one holding a database connection, writes their rows.
+        Files are written in input order, one transaction each, so the result
+        matches processing them one after another.
+        
+        Args:
+            input_files: Paths to the JSON files, or JSON members of zip archives
+            max_workers: Number of worker processes
+            streaming: Stream the stream_key array of each file inside the workers
+            chunk_size: Number of characters read from a file at a time when streaming
+            executor: Process pool to reuse instead of starting a new one
+        """
+        owns_executor = executor is None
+        if owns_executor:
+            # Spawn rather than fork: the schema upload thread may already be running
+            executor = ProcessPoolExecutor(
+                max_workers=max_workers, mp_context=multiprocessing.get_context('spawn')
+            )
+        try:
+            # Keep a bounded number of files in flight so finished rows cannot pile up
+            in_flight = deque()
+            for input_file in input_files:
+                in_flight.append((input_file, executor.submit(
+                    _transform_file_rows, type(self), input_file, streaming, chunk_size, self.trusted_input
+                )))
+                if len(in_flight) >= 2 * max_workers:
+                    self._write_file_rows(*in_flight.popleft())
+            while in_flight:
+                self._write_file_rows(*in_flight.popleft())
+        finally:
+            if owns_executor:
+                executor.shutdown(cancel_futures=True)
+
+    def _write_file_rows(self, input_file: InputSource, future) -> None:
+        self.process_rows(future.result())
+        logging.info(f"Transformed {input_name(input_file)}")
+
+    def _stage(self, name: str):
+        """Time a stage when metrics are collected."""
+        return self.metrics.stage(name) if self.metrics is not None else nullcontext()
+
+    def _count_rows(self, row_counts: Dict[str, int]) -> None:
+        if self.metrics is not None:
+            for table_name, count in row_counts.items():
+                self.metrics.count(f"rows.{table_name}", count)
+
+    def _write(self, models: Iterable[Base]) -> None:
+        """Save model instances, possibly produced lazily, in a single transaction."""
+        if self.metrics is None:
+            self._insert(models)
+            return
+
+        # Streamed models are produced while rows are written, so time the two apart
+        transform_seconds = [0.0]
+        start = time.perf_counter()
+        self._insert(_timed_models(models, transform_seconds))
+        elapsed = time.perf_counter() - start
+        self.metrics.add_time('transform', transform_seconds[0])
+        self.metrics.add_time('insert', elapsed - transform_seconds[0])
+
+    def _insert(self, models: Iterable[Base]) -> None:
+        if self.bulk_insert:
+            self._write_bulk(models)
+        else:
+            self._write_orm(models)
+
+    def _write_bulk(self, models: Iterable[Base]) -> None:
+        """Insert rows grouped by table with executemany-style Core inserts."""
+        with self.engine.begin() as connection:
+            writer = BulkWriter(connection, self.batch_size, upsert=self.upsert, masker=self.masker)
+            for model in models:
+                writer.add(model)
+            writer.flush()
+        logging.info(f"Inserted rows: {writer.row_counts}")
+        self._count_rows(writer.row_counts)
+        self._check_memory_size()
+
+    def _write_orm(self, models: Iterable[Base]) -> None:
+        """Insert rows through the ORM unit of work, flushing every batch_size instances."""
         session = self.Session()
+        row_counts: Dict[str, int] = {}
         try:
-            # Transform data into model instances
-            models = self.transform(data)
+            pending = 0
             for model in models:
-                session.add(model)
+                table_name = model.__table__.name
+                row_counts[table_name] = row_counts.get(table_name, 0) + 1
+                self.masker.mask_model(model)
+                if self.upsert:
+                    _delete_unique_conflicts(session, model)
+                    session.merge(model)
+                else:
+                    session.add(model)
+                pending += 1
+                if pending >= self.batch_size:
+                    session.flush()
+                    session.expunge_all()
+                    pending = 0
             session.commit()
         except Exception as e:
             session.rollback()
             raise e
         finally:
-            session.close()
\ No newline at end of file
+            session.close()
+        self._count_rows(row_counts)
+        self._check_memory_size()
+
+
+# Fingerprints of compiled schemas that matched a database created from the models
+_verified_schemas: Set[str] = set()
+
+
+def _delete_unique_conflicts(session, model: Base) -> None:
+    """
+    Delete the rows holding a unique value of model under another primary key,
+    as merge only matches on the primary key. Mirrors BulkWriter's upserts.
+    """
+    table, columns, row = model_to_row(model)
+    values = dict(zip(columns, row))
+    for constraint_columns in unique_constraints(table):
+        if all(name in values for name in constraint_columns):
+            session.execute(delete(table).where(
+                *[table.c[name] == values[name] for name in constraint_columns],
+                or_(*[column != values.get(column.name) for column in table.primary_key.columns])
+            ))
+
+
+def _timed_models(models: Iterable[Base], seconds: List[float]) -> Iterator[Base]:
+    """Yield models, adding the time spent producing them to seconds[0]."""
+    iterator = iter(models)
+    while True:
+        start = time.perf_counter()
+        try:
+            model = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            seconds[0] += time.perf_counter() - start
+        yield model
+
+
+def _transform_file_rows(transformer_class: Type[DataTransformer], input_file: InputSource,
+                         streaming: bool, chunk_size: int, trusted_input: bool = False) -> FileRows:
+    """Worker process entry point for DataTransformer.process_files_parallel."""
+    transformer = transformer_class(None, trusted_input=trusted_input)
+    return transformer.transform_file_rows(input_file, streaming, chunk_size)
@@ -0,0 +1,129 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import Table, UniqueConstraint, inspect, insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Connection
+from refiner.models.refined import Base
+from refiner.utils.pii import PIIMasker
+
+
+# mapper -> [(attribute key, column name)]
+_COLUMN_ATTRS: Dict[Any, List[Tuple[str, str]]] = {}
+
+
+def model_to_row(model: Base) -> Tuple[Table, Tuple[str, ...], Tuple[Any, ...]]:
+    """
+    Convert an ORM instance to a plain row.
+
+    Returns:
+        Tuple of (table, column names, row values). Attributes never set are
+        omitted so column defaults apply, as with the ORM
+    """
+    state = inspect(model)
+    mapper = state.mapper
+    attrs = _COLUMN_ATTRS.get(mapper)
+    if attrs is None:
+        attrs = [(prop.key, prop.columns[0].name) for prop in mapper.column_attrs]
+        _COLUMN_ATTRS[mapper] = attrs
+
+    values = state.dict
+    columns = tuple(name for key, name in attrs if key in values)
+    row = tuple(values[key] for key, name in attrs if key in values)
+    return mapper.local_table, columns, row
+
+
+def unique_constraints(table: Table) -> List[Tuple[str, ...]]:
+    """
+    Column names of each unique constraint of a table besides its primary key.
+
+    Returns:
+        One tuple of column names per constraint, e.g. [('email',)] for users
+    """
+    return [
+        tuple(column.name for column in constraint.columns)
+        for constraint in table.constraints if isinstance(constraint, UniqueConstraint)
+    ]
+
+
+class BulkWriter:
+    """
+    Buffers rows per table and writes them with executemany-style Core inserts,
+    bypassing the ORM unit of work (identity map, cascades, per-object INSERTs).
+
+    Only the column attributes set on each model are written, so relationship
+    attributes are ignored and foreign keys must be assigned directly.
+    """
+
+    def __init__(self, connection: Connection, chunk_size: int = 5000, upsert: bool = False,
+                 masker: Optional[PIIMasker] = None):
+        """
+        Args:
+            connection: Connection inside an open transaction
+            chunk_size: Number of rows sent per executemany call
+            upsert: Replace the existing row when a primary key, or the value
+                of another unique column, is already present
+            masker: Masks PII columns of each batch before it is written
+        """
+        self.connection = connection
+        self.chunk_size = chunk_size
+        self.upsert = upsert
+        self.masker = masker
+        self.row_counts: Dict[str, int] = {}
+        self._pending: Dict[Tuple[Table, Tuple[str, ...]], List[Tuple[Any, ...]]] = {}
+
+    def add(self, model: Base) -> None:
+        """Queue an ORM instance for insertion."""
+        table, columns, row = model_to_row(model)
+        self.add_rows(table, columns, [row])
+
+    def add_rows(self, table: Table, columns: Sequence[str], rows: Sequence[Tuple[Any, ...]]) -> None:
+        """
+        Queue rows for insertion.
+
+        Args:
+            table: Table the rows belong to
+            columns: Column names, in the order values appear in each row
+            rows: Row value tuples
+        """
+        key = (table, tuple(columns))
+        pending = self._pending.setdefault(key, [])
+        pending.extend(rows)
+        if len(pending) >= self.chunk_size:
+            self._write(key)
+
+    def flush(self) -> None:
+        """Write all queued rows, parents before children."""
+        order = {table: index for index, table in enumerate(Base.metadata.sorted_tables)}
+        for key in sorted(self._pending, key=lambda k: order.get(k[0], len(order))):
+            self._write(key)
+
+    def _write(self, key: Tuple[Table, Tuple[str, ...]]) -> None:
+        rows = self._pending.pop(key, None)
+        if not rows:
+            return
+
+        table, columns = key
+        if self.masker is not None:
+            rows = self.masker.mask_rows(table.name, columns, rows)
+        statement = self._statement(table, columns)
+        for start in range(0, len(rows), self.chunk_size):
+            chunk = rows[start:start + self.chunk_size]
+            self.connection.execute(statement, [dict(zip(columns, row)) for row in chunk])
+        self.row_counts[table.name] = self.row_counts.get(table.name, 0) + len(rows)
+
+    def _statement(self, table: Table, columns: Tuple[str, ...]):
+        if self.upsert and unique_constraints(table):
+            # An upsert only resolves conflicts on one index, and a row can
+            # conflict on another, e.g. the same email under a new user id.
+            # The row written last replaces whichever rows it conflicts with
+            return insert(table).prefix_with('OR REPLACE')
+
+        primary_key = [column.name for column in table.primary_key.columns]
+        # Rows without their primary key (autoincrement) can never conflict
+        if not self.upsert or not all(name in columns for name in primary_key):
+            return insert(table)
+
+        statement = sqlite_insert(table)
+        updates = {name: statement.excluded[name] for name in columns if name not in primary_key}
+        if not updates:
+            return statement.on_conflict_do_nothing(index_elements=primary_key)
+        return statement.on_conflict_do_update(index_elements=primary_key, set_=updates)
@@ -0,0 +1,142 @@
+"""
+Columnar export of the refined tables as Parquet files, for analytics
+consumers that scan a few columns of many rows. The files are packed in one
+uncompressed zip archive, so the export is encrypted and uploaded once
+rather than once per table. pyarrow is an optional dependency, imported only
+when an export runs.
+"""
+import importlib.util
+import logging
+import os
+import sqlite3
+import zipfile
+from typing import Any, BinaryIO, List, NamedTuple, Sequence, Union
+from sqlalchemy import Boolean, Column, Date, DateTime, Float, Integer, MetaData, Numeric, Table
+
+# Rows read from SQLite and written as one Parquet row group at a time
+EXPORT_BATCH_ROWS = 65536
+
+
+class ColumnarFile(NamedTuple):
+    """A table exported to a Parquet file in the archive."""
+    table_name: str
+    file_name: str
+    row_count: int
+
+
+def require_pyarrow() -> None:
+    """Fail early, without importing it, if pyarrow is not installed."""
+    if importlib.util.find_spec('pyarrow') is None:
+        raise ImportError("Columnar export requires pyarrow, install it with: pip install pyarrow")
+
+
+def is_dictionary_column(column: Column) -> bool:
+    """Coded values and their display texts repeat a lot, so they are dictionary-encoded."""
+    name = column.name
+    return name in ('code', 'display') or name.endswith('_code') or name.endswith('_display')
+
+
+def _arrow_type(column: Column):
+    import pyarrow as pa
+
+    column_type = column.type
+    if isinstance(column_type, Boolean):
+        return pa.bool_()
+    if isinstance(column_type, Integer):
+        return pa.int64()
+    # SQLAlchemy stores DECIMAL columns as SQLite REALs, so doubles lose nothing
+    if isinstance(column_type, (Float, Numeric)):
+        return pa.float64()
+    if isinstance(column_type, DateTime):
+        return pa.timestamp('us')
+    if isinstance(column_type, Date):
+        return pa.date32()
+    if is_dictionary_column(column):
+        return pa.dictionary(pa.int32(), pa.string())
+    return pa.string()
+
+
+def _arrow_array(values: Sequence[Any], arrow_type):
+    import pyarrow as pa
+
+    if pa.types.is_boolean(arrow_type):
+        return pa.array([None if value is None else bool(value) for value in values], pa.bool_())
+    # Dates and timestamps are stored as ISO 8601 text and parsed by Arrow
+    if pa.types.is_timestamp(arrow_type) or pa.types.is_date(arrow_type):
+        return pa.array(values, pa.string()).cast(arrow_type)
+    if pa.types.is_dictionary(arrow_type):
+        return pa.array(values, pa.string()).dictionary_encode()
+    return pa.array(values, arrow_type)
+
+
+def export_table(connection: sqlite3.Connection, table: Table, where: Union[str, BinaryIO],
+                 compression: str = 'zstd', batch_rows: int = EXPORT_BATCH_ROWS) -> int:
+    """
+    Write one table to a Parquet file, a row group per batch of rows.
+
+    Args:
+        connection: Connection to the refined database
+        table: Table to export
+        where: Path or writable binary file receiving the Parquet data
+        compression: Parquet compression codec, e.g. 'zstd', 'snappy' or 'none'
+        batch_rows: Rows per row group
+
+    Returns:
+        Number of rows written
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    columns = list(table.columns)
+    schema = pa.schema([pa.field(column.name, _arrow_type(column)) for column in columns])
+    dictionary_columns = [column.name for column in columns if is_dictionary_column(column)]
+
+    column_names = ', '.join(f'"{column.name}"' for column in columns)
+    cursor = connection.execute(f'SELECT {column_names} FROM "{table.name}"')
+    row_count = 0
+    with pq.ParquetWriter(where, schema, compression=compression, use_dictionary=dictionary_columns) as writer:
+        while True:
+            rows = cursor.fetchmany(batch_rows)
+            if not rows:
+                break
+            values = list(zip(*rows))
+            writer.write_batch(pa.record_batch(
+                [_arrow_array(values[i], field.type) for i, field in enumerate(schema)], schema=schema
+            ))
+            row_count += len(rows)
+    return row_count
+
+
+def export_parquet(db_path: str, metadata: MetaData, archive_path: str, compression: str = 'zstd',
+                   batch_rows: int = EXPORT_BATCH_ROWS) -> List[ColumnarFile]:
+    """
+    Export every non-empty table of the metadata from a finalized database
+    to <table>.parquet in a zip archive.
+
+    Args:
+        db_path: Path of the refined SQLite database
+        metadata: Metadata holding the tables
+        archive_path: Path of the zip archive to create
+        compression: Parquet compression codec
+        batch_rows: Rows per row group
+
+    Returns:
+        The exported files, in table name order
+    """
+    require_pyarrow()
+    exported = []
+    connection = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        # Stored, not deflated: the Parquet files are compressed already
+        with zipfile.ZipFile(archive_path, 'w', zipfile.ZIP_STORED) as archive:
+            for table in sorted(metadata.sorted_tables, key=lambda table: table.name):
+                if connection.execute(f'SELECT 1 FROM "{table.name}" LIMIT 1').fetchone() is None:
+                    continue
+                file_name = f"{table.name}.parquet"
+                with archive.open(file_name, 'w', force_zip64=True) as f:
+                    row_count = export_table(connection, table, f, compression, batch_rows)
+                exported.append(ColumnarFile(str(table.name), file_name, row_count))
+    finally:
+        connection.close()
+    logging.info(f"Exported {len(exported)} tables to Parquet in {os.path.basename(archive_path)}")
+    return exported
@@ -0,0 +1,210 @@
+import hashlib
+import logging
+import os
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import Column, MetaData, String, Table, create_engine, delete, inspect
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.engine import Connection, Engine
+from refiner.models.refined import Base
+from refiner.utils import json_codec
+
+# Kept out of Base.metadata and out of the published database: hashes of the
+# raw, unmasked resources would let anyone holding it test guesses of their PII
+hash_metadata = MetaData()
+
+resource_hashes = Table(
+    'resource_hashes', hash_metadata,
+    Column('resource_type', String, primary_key=True),
+    Column('resource_id', String, primary_key=True),
+    # Table holding the resource's row, NULL for types that are not refined
+    Column('table_name', String),
+    Column('content_hash', String, nullable=False),
+)
+
+ResourceKey = Tuple[str, str]
+
+# Ids per DELETE statement, below SQLite's limit on bound parameters
+DELETE_CHUNK_SIZE = 500
+
+
+def content_hash(resource: Dict[str, Any]) -> str:
+    """
+    Hash the canonical JSON form of a raw FHIR resource.
+
+    Args:
+        resource: Resource as decoded from the input file
+
+    Returns:
+        Hex SHA-256 digest, identical for resources with equal content
+    """
+    return hashlib.sha256(json_codec.dumps(resource, sort_keys=True)).hexdigest()
+
+
+def hashes_path(db_path: str) -> str:
+    """
+    Side database holding the resource hashes of a refined database. It is
+    encrypted and kept next to the database, never uploaded with it.
+
+    Args:
+        db_path: Path of the refined database
+
+    Returns:
+        Path of its hash database
+    """
+    return f"{db_path}.hashes"
+
+
+def supports_incremental(engine: Engine, hash_path: str) -> bool:
+    """
+    Whether an existing database can be refined incrementally: there must be
+    the content hashes of the previous incremental run, and every table it
+    shares with the models must have the same columns.
+
+    Args:
+        engine: Engine of the previous database
+        hash_path: Hash database of the previous run
+
+    Returns:
+        True if new rows can be merged into it
+    """
+    if not os.path.exists(hash_path):
+        logging.info("Previous database has no resource hashes")
+        return False
+    inspector = inspect(engine)
+    table_names = set(inspector.get_table_names())
+    for table in Base.metadata.sorted_tables:
+        if table.name not in table_names:
+            continue
+        columns = {column['name'] for column in inspector.get_columns(table.name)}
+        if columns != set(table.c.keys()):
+            logging.info(f"Columns of {table.name} changed since the previous database")
+            return False
+    return True
+
+
+class ResourceHashes:
+    """
+    Content hashes of the resources a database was refined from, used to map
+    and write only the resources that are new or changed since the previous
+    run, and to delete the rows of resources that are no longer submitted.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Hash database of the previous run, created empty if missing
+        """
+        self.path = path
+        self.engine = create_engine(f'sqlite:///{path}')
+        hash_metadata.create_all(self.engine)
+        with self.engine.connect() as connection:
+            self._previous: Dict[ResourceKey, Tuple[Optional[str], str]] = {
+                (row.resource_type, row.resource_id): (row.table_name, row.content_hash)
+                for row in connection.execute(resource_hashes.select())
+            }
+        self._current: Dict[ResourceKey, Tuple[Optional[str], str]] = {}
+        self._changed: Dict[ResourceKey, Tuple[Optional[str], str]] = {}
+        self.unchanged = 0
+
+    def check(self, resource: Any) -> Tuple[Optional[ResourceKey], Optional[str]]:
+        """
+        Compare a raw resource with the version last written, by an earlier
+        file of this run or else by the previous run, and mark it as still submitted.
+
+        Args:
+            resource: Resource as decoded from the input file
+
+        Returns:
+            (key, hash) of a resource that has to be mapped and written, or
+            (None, None) if its content is already in the database
+        """
+        if not isinstance(resource, dict) or resource.get('id') is None:
+            return None, None
+        key = (resource.get('resourceType'), resource['id'])
+        digest = content_hash(resource)
+
+        current = self._current.get(key)
+        if current is not None:
+            return (None, None) if current[1] == digest else (key, digest)
+        previous = self._previous.get(key)
+        if previous is not None and previous[1] == digest:
+            self._current[key] = previous
+            self.unchanged += 1
+            return None, None
+        return key, digest
+
+    def record(self, key: ResourceKey, digest: str, model: Optional[Base]) -> None:
+        """
+        Record the hash of a resource mapped in this run.
+
+        Args:
+            key: Key returned by check
+            digest: Hash returned by check
+            model: Refined model the resource was mapped to, or None
+        """
+        entry = (model.__table__.name if model is not None else None, digest)
+        self._current[key] = entry
+        self._changed[key] = entry
+
+    @property
+    def changed(self) -> int:
+        return len(self._changed)
+
+    def finish(self, connection: Connection) -> int:
+        """
+        Delete the rows and hashes of resources that were not submitted in
+        this run and save the hashes of new or changed resources to the hash
+        database, which is closed afterwards.
+
+        Args:
+            connection: Connection to the refined database inside an open transaction
+
+        Returns:
+            Number of resources deleted
+        """
+        vanished: Dict[Tuple[str, Optional[str]], List[str]] = {}
+        for key, (table_name, _) in self._previous.items():
+            if key not in self._current:
+                vanished.setdefault((key[0], table_name), []).append(key[1])
+
+        for (resource_type, table_name), resource_ids in vanished.items():
+            table = Base.metadata.tables.get(table_name) if table_name is not None else None
+            if table is not None:
+                primary_key = next(iter(table.primary_key.columns))
+                for start in range(0, len(resource_ids), DELETE_CHUNK_SIZE):
+                    connection.execute(delete(table).where(
+                        primary_key.in_(resource_ids[start:start + DELETE_CHUNK_SIZE])
+                    ))
+
+        with self.engine.begin() as hash_connection:
+            self._save(hash_connection, vanished)
+        self.engine.dispose()
+
+        deleted = sum(len(resource_ids) for resource_ids in vanished.values())
+        logging.info(
+            f"Incremental refinement: {self.unchanged} resources unchanged, "
+            f"{self.changed} new or changed, {deleted} deleted"
+        )
+        return deleted
+
+    def _save(self, connection: Connection, vanished: Dict[Tuple[str, Optional[str]], List[str]]) -> None:
+        for (resource_type, _), resource_ids in vanished.items():
+            for start in range(0, len(resource_ids), DELETE_CHUNK_SIZE):
+                connection.execute(delete(resource_hashes).where(
+                    resource_hashes.c.resource_type == resource_type,
+                    resource_hashes.c.resource_id.in_(resource_ids[start:start + DELETE_CHUNK_SIZE])
+                ))
+
+        if self._changed:
+            statement = insert(resource_hashes)
+            statement = statement.on_conflict_do_update(
+                index_elements=[resource_hashes.c.resource_type, resource_hashes.c.resource_id],
+                set_={
+                    'table_name': statement.excluded.table_name,
+                    'content_hash': statement.excluded.content_hash,
+                }
+            )
+            connection.execute(statement, [
+                {'resource_type': key[0], 'resource_id': key[1], 'table_name': table_name, 'content_hash': digest}
+                for key, (table_name, digest) in self._changed.items()
+            ])
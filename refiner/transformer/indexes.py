@@ -0,0 +1,56 @@
+"""
+Secondary indexes declared on the models as
+__table_args__ = {'info': {'deferred_indexes': [('user_id',), ...]}}, one
+tuple of columns per index. They are not created with the tables but built
+in one pass after the bulk load, which is faster than maintaining them row
+by row while the rows are inserted.
+"""
+from typing import List
+from sqlalchemy import MetaData, Table
+from sqlalchemy.engine import Connection
+
+
+def index_name(table: Table, columns) -> str:
+    return f"ix_{table.name}_{'_'.join(columns)}"
+
+
+def deferred_index_statements(metadata: MetaData) -> List[str]:
+    """
+    CREATE INDEX statements for the indexes declared under
+    __table_args__ info['deferred_indexes'] of each model, ordered by index name.
+
+    Args:
+        metadata: Metadata holding the tables
+
+    Returns:
+        SQL statements, without trailing semicolons
+    """
+    statements = {}
+    for table in metadata.sorted_tables:
+        for columns in table.info.get('deferred_indexes', []):
+            for column in columns:
+                if column not in table.c:
+                    raise ValueError(f"Deferred index on unknown column {table.name}.{column}")
+            name = index_name(table, columns)
+            statements[name] = f"CREATE INDEX {name} ON {table.name} ({', '.join(columns)})"
+    return [statements[name] for name in sorted(statements)]
+
+
+def create_deferred_indexes(connection: Connection, metadata: MetaData, if_not_exists: bool = False) -> int:
+    """
+    Build every deferred index in one pass over the loaded tables.
+
+    Args:
+        connection: Connection inside an open transaction
+        metadata: Metadata holding the tables
+        if_not_exists: Skip indexes that already exist, e.g. in a database refined before
+
+    Returns:
+        Number of indexes created or checked
+    """
+    statements = deferred_index_statements(metadata)
+    for statement in statements:
+        if if_not_exists:
+            statement = statement.replace("CREATE INDEX", "CREATE INDEX IF NOT EXISTS", 1)
+        connection.exec_driver_sql(statement)
+    return len(statements)
@@ -0,0 +1,411 @@
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+from refiner.models.refined import (
+    Base, Patient, Practitioner, Organization, Encounter, Observation, Condition,
+    MedicationRequest, Immunization, DiagnosticReport, Procedure, Claim
+)
+from refiner.utils.date import parse_fhir_date, parse_fhir_datetime, to_naive_utc
+
+NPI_SYSTEM = "http://hl7.org/fhir/sid/us-npi"
+SSN_SYSTEM = "http://hl7.org/fhir/sid/us-ssn"
+
+
+class ReferenceIndex:
+    """
+    In-memory index resolving FHIR references within a bundle to resource ids,
+    so foreign keys are filled without querying the database.
+    """
+
+    def __init__(self):
+        self._ids: Dict[str, str] = {}
+
+    def register(self, resource: Any, full_url: Optional[str] = None) -> None:
+        """Index a resource under its fullUrl, relative reference and identifiers."""
+        resource_type, resource_id = resource.resourceType, resource.id
+        self._ids[f"{resource_type}/{resource_id}"] = resource_id
+        if full_url:
+            self._ids[full_url] = resource_id
+        for identifier in resource.identifier or ():
+            system, value = _path(identifier, 'system'), _path(identifier, 'value')
+            if system and value:
+                self._ids[f"{resource_type}?identifier={system}|{value}"] = resource_id
+
+    def resolve(self, reference: Any) -> Optional[str]:
+        """
+        Resolve a Reference (or reference string) to a resource id.
+
+        Args:
+            reference: FHIR Reference element or its 'reference' string
+
+        Returns:
+            Id of the referenced resource, or None if it cannot be determined
+        """
+        if isinstance(reference, dict):
+            reference = reference.get('reference')
+        if not reference:
+            return None
+
+        resource_id = self._ids.get(reference)
+        if resource_id is not None:
+            return resource_id
+
+        # Not seen yet: fall back to the id embedded in literal references
+        if reference.startswith('urn:uuid:'):
+            return reference[len('urn:uuid:'):]
+        if '?' not in reference and '/' in reference:
+            return reference.rsplit('/', 1)[1]
+        return None
+
+
+class MappingContext:
+    """State shared by the resource mappers during one pass over a bundle."""
+
+    def __init__(self, created_at: datetime):
+        self.created_at = created_at
+        self.references = ReferenceIndex()
+        self.seen: Set[Tuple[str, str]] = set()
+
+
+ResourceMapper = Callable[[Any, MappingContext], Base]
+
+# resourceType -> mapper, looked up once per bundle entry
+RESOURCE_MAPPERS: Dict[str, ResourceMapper] = {}
+
+
+def register_mapper(resource_type: str) -> Callable[[ResourceMapper], ResourceMapper]:
+    """Register a function mapping a FHIR resource of the given type to a refined model."""
+    def decorator(mapper: ResourceMapper) -> ResourceMapper:
+        RESOURCE_MAPPERS[resource_type] = mapper
+        return mapper
+    return decorator
+
+
+def map_resource(resource: Any, context: MappingContext, full_url: Optional[str] = None) -> Optional[Base]:
+    """
+    Map a bundle resource with the mapper registered for its resourceType.
+
+    Args:
+        resource: Validated FHIR resource
+        context: Mapping state for the current bundle
+        full_url: The entry's fullUrl, used to resolve references to this resource
+
+    Returns:
+        Refined model instance, or None if the type is unsupported or already mapped
+    """
+    if resource is None or resource.id is None:
+        return None
+    context.references.register(resource, full_url)
+
+    mapper = RESOURCE_MAPPERS.get(resource.resourceType)
+    if mapper is None:
+        return None
+
+    key = (resource.resourceType, resource.id)
+    if key in context.seen:
+        return None
+    context.seen.add(key)
+    return mapper(resource, context)
+
+
+def _path(value: Any, *keys: Any) -> Any:
+    """Walk nested models, dicts and lists, returning None when any step is missing."""
+    for key in keys:
+        if value is None:
+            return None
+        if isinstance(key, int):
+            value = value[key] if isinstance(value, list) and len(value) > key else None
+        elif isinstance(value, dict):
+            value = value.get(key)
+        else:
+            value = getattr(value, key, None)
+    return value
+
+
+def _family(name: Any) -> Optional[str]:
+    family = _path(name, 'family')
+    return " ".join(family) if isinstance(family, list) else family
+
+
+def _find(items: Any, **match: Any) -> Any:
+    """Return the first element whose fields equal all of match."""
+    for item in items or ():
+        if all(_path(item, key) == value for key, value in match.items()):
+            return item
+    return None
+
+
+def _extension(resource: Any, suffix: str) -> Any:
+    """Return the first extension whose url ends with suffix."""
+    for extension in _path(resource, 'extension') or ():
+        url = _path(extension, 'url')
+        if url and url.endswith(suffix):
+            return extension
+    return None
+
+
+def _identifier(resource: Any, system: Optional[str] = None, type_code: Optional[str] = None) -> Optional[str]:
+    for identifier in _path(resource, 'identifier') or ():
+        if system and _path(identifier, 'system') == system:
+            return _path(identifier, 'value')
+        if type_code and _path(identifier, 'type', 'coding', 0, 'code') == type_code:
+            return _path(identifier, 'value')
+    return None
+
+
+# =====================================================
+# FHIR Core Resources
+# =====================================================
+
+@register_mapper("Patient")
+def map_patient(patient: Any, context: MappingContext) -> Patient:
+    name = _path(patient, 'name', 0)
+    address = _path(patient, 'address', 0)
+    birth_place = _path(_extension(patient, 'patient-birthPlace'), 'valueAddress')
+
+    return Patient(
+        id=patient.id,
+        resource_id=patient.id,
+        first_name=_path(name, 'given', 0),
+        last_name=_family(name),
+        prefix=_path(name, 'prefix', 0),
+        gender=patient.gender,
+        birth_date=patient.birthDate,
+        deceased_date_time=to_naive_utc(patient.deceasedDateTime),
+        marital_status=_path(patient, 'maritalStatus', 'coding', 0, 'code'),
+        multiple_birth_boolean=patient.multipleBirthBoolean,
+        race=_path(_extension(_extension(patient, 'us-core-race'), 'text'), 'valueString'),
+        ethnicity=_path(_extension(_extension(patient, 'us-core-ethnicity'), 'text'), 'valueString'),
+        birth_sex=_path(_extension(patient, 'us-core-birthsex'), 'valueCode'),
+        birth_place_city=_path(birth_place, 'city'),
+        birth_place_state=_path(birth_place, 'state'),
+        birth_place_country=_path(birth_place, 'country'),
+        # optional: flatten address
+        address_line=",".join(address.line) if address and address.line else None,
+        address_city=_path(address, 'city'),
+        address_state=_path(address, 'state'),
+        address_postal_code=_path(address, 'postalCode'),
+        address_country=_path(address, 'country'),
+        phone=_path(_find(patient.telecom, system='phone'), 'value'),
+        language=(
+            _path(patient, 'communication', 0, 'language', 'coding', 0, 'display')
+            or _path(patient, 'communication', 0, 'language', 'text')
+        ),
+        ssn=_identifier(patient, system=SSN_SYSTEM, type_code='SS'),
+        drivers_license=_identifier(patient, type_code='DL'),
+        mothers_maiden_name=_path(_extension(patient, 'patient-mothersMaidenName'), 'valueString'),
+        daly=_path(_extension(patient, 'disability-adjusted-life-years'), 'valueDecimal'),
+        qaly=_path(_extension(patient, 'quality-adjusted-life-years'), 'valueDecimal'),
+        import_date=context.created_at,
+    )
+
+
+@register_mapper("Practitioner")
+def map_practitioner(practitioner: Any, context: MappingContext) -> Practitioner:
+    name = _path(practitioner, 'name', 0)
+    return Practitioner(
+        id=practitioner.id,
+        resource_id=practitioner.id,
+        first_name=_path(name, 'given', 0),
+        last_name=_family(name),
+        prefix=_path(name, 'prefix', 0),
+        suffix=_path(name, 'suffix', 0),
+        gender=practitioner.gender,
+        birth_date=parse_fhir_date(practitioner.birthDate),
+        npi=_identifier(practitioner, system=NPI_SYSTEM),
+        license_number=_path(practitioner, 'qualification', 0, 'identifier', 0, 'value'),
+        specialty=_path(practitioner, 'qualification', 0, 'code', 'coding', 0, 'display'),
+        import_date=context.created_at,
+    )
+
+
+@register_mapper("Organization")
+def map_organization(organization: Any, context: MappingContext) -> Organization:
+    address = _path(organization, 'address', 0)
+    line = _path(address, 'line')
+    return Organization(
+        id=organization.id,
+        resource_id=organization.id,
+        name=organization.name,
+        type=_path(organization, 'type', 0, 'coding', 0, 'code'),
+        address_line=",".join(line) if line else None,
+        address_city=_path(address, 'city'),
+        address_state=_path(address, 'state'),
+        address_postal_code=_path(address, 'postalCode'),
+        address_country=_path(address, 'country'),
+        phone=_path(_find(organization.telecom, system='phone'), 'value'),
+        import_date=context.created_at,
+    )
+
+
+# =====================================================
+# Clinical Resources
+# =====================================================
+
+@register_mapper("Encounter")
+def map_encounter(encounter: Any, context: MappingContext) -> Encounter:
+    resolve = context.references.resolve
+    return Encounter(
+        id=encounter.id,
+        resource_id=encounter.id,
+        patient_id=resolve(_path(encounter, 'subject')),
+        practitioner_id=resolve(_path(encounter, 'participant', 0, 'individual')),
+        organization_id=resolve(_path(encounter, 'serviceProvider')),
+        status=_path(encounter, 'status'),
+        class_code=_path(encounter, 'class', 'code'),
+        type_code=_path(encounter, 'type', 0, 'coding', 0, 'code'),
+        type_display=_path(encounter, 'type', 0, 'coding', 0, 'display'),
+        start_date=parse_fhir_datetime(_path(encounter, 'period', 'start')),
+        end_date=parse_fhir_datetime(_path(encounter, 'period', 'end')),
+        import_date=context.created_at,
+    )
+
+
+@register_mapper("Observation")
+def map_observation(observation: Any, context: MappingContext) -> Observation:
+    resolve = context.references.resolve
+    value_coding = _path(observation, 'valueCodeableConcept', 'coding', 0)
+    return Observation(
+        id=observation.id,
+        resource_id=observation.id,
+        patient_id=resolve(_path(observation, 'subject')),
+        encounter_id=resolve(_path(observation, 'encounter')),
+        performer_id=resolve(_path(observation, 'performer', 0)),
+        status=_path(observation, 'status'),
+        category_code=_path(observation, 'category', 0, 'coding', 0, 'code'),
+        code=_path(observation, 'code', 'coding', 0, 'code'),
+        display=_path(observation, 'code', 'coding', 0, 'display'),
+        effective_date_time=parse_fhir_datetime(
+            _path(observation, 'effectiveDateTime') or _path(observation, 'effectivePeriod', 'start')
+        ),
+        issued=parse_fhir_datetime(_path(observation, 'issued')),
+        value_quantity=_path(observation, 'valueQuantity', 'value'),
+        value_unit=_path(observation, 'valueQuantity', 'unit'),
+        value_code=_path(value_coding, 'code'),
+        value_display=_path(value_coding, 'display'),
+        value_string=_path(observation, 'valueString'),
+        value_boolean=_path(observation, 'valueBoolean'),
+        reference_range_low=_path(observation, 'referenceRange', 0, 'low', 'value'),
+        reference_range_high=_path(observation, 'referenceRange', 0, 'high', 'value'),
+        import_date=context.created_at,
+    )
+
+
+@register_mapper("Condition")
+def map_condition(condition: Any, context: MappingContext) -> Condition:
+    resolve = context.references.resolve
+    return Condition(
+        id=condition.id,
+        resource_id=condition.id,
+        patient_id=resolve(_path(condition, 'subject')),
+        encounter_id=resolve(_path(condition, 'encounter')),
+        asserter_id=resolve(_path(condition, 'asserter') or _path(condition, 'recorder')),
+        category_code=_path(condition, 'category', 0, 'coding', 0, 'code'),
+        code=_path(condition, 'code', 'coding', 0, 'code'),
+        display=_path(condition, 'code', 'coding', 0, 'display'),
+        onset_date_time=parse_fhir_datetime(_path(condition, 'onsetDateTime')),
+        abatement_date_time=parse_fhir_datetime(_path(condition, 'abatementDateTime')),
+        clinical_status=_path(condition, 'clinicalStatus', 'coding', 0, 'code'),
+        verification_status=_path(condition, 'verificationStatus', 'coding', 0, 'code'),
+        import_date=context.created_at,
+    )
+
+
+@register_mapper("MedicationRequest")
+def map_medication_request(request: Any, context: MappingContext) -> MedicationRequest:
+    resolve = context.references.resolve
+    return MedicationRequest(
+        id=request.id,
+        resource_id=request.id,
+        patient_id=resolve(_path(request, 'subject')),
+        encounter_id=resolve(_path(request, 'encounter')),
+        requester_id=resolve(_path(request, 'requester')),
+        status=_path(request, 'status'),
+        intent=_path(request, 'intent'),
+        medication_code=_path(request, 'medicationCodeableConcept', 'coding', 0, 'code'),
+        medication_display=(
+            _path(request, 'medicationCodeableConcept', 'coding', 0, 'display')
+            or _path(request, 'medicationReference', 'display')
+        ),
+        authored_on=parse_fhir_datetime(_path(request, 'authoredOn')),
+        dosage_instruction=_path(request, 'dosageInstruction', 0, 'text'),
+        import_date=context.created_at,
+    )
+
+
+@register_mapper("Immunization")
+def map_immunization(immunization: Any, context: MappingContext) -> Immunization:
+    resolve = context.references.resolve
+    return Immunization(
+        id=immunization.id,
+        resource_id=immunization.id,
+        patient_id=resolve(_path(immunization, 'patient')),
+        performer_id=resolve(_path(immunization, 'performer', 0, 'actor')),
+        status=_path(immunization, 'status'),
+        vaccine_code=_path(immunization, 'vaccineCode', 'coding', 0, 'code'),
+        vaccine_display=_path(immunization, 'vaccineCode', 'coding', 0, 'display'),
+        occurrence_date_time=parse_fhir_datetime(_path(immunization, 'occurrenceDateTime')),
+        lot_number=_path(immunization, 'lotNumber'),
+        import_date=context.created_at,
+    )
+
+
+@register_mapper("DiagnosticReport")
+def map_diagnostic_report(report: Any, context: MappingContext) -> DiagnosticReport:
+    resolve = context.references.resolve
+    return DiagnosticReport(
+        id=report.id,
+        resource_id=report.id,
+        patient_id=resolve(_path(report, 'subject')),
+        encounter_id=resolve(_path(report, 'encounter')),
+        performer_id=resolve(_path(report, 'performer', 0)),
+        status=_path(report, 'status'),
+        category_code=_path(report, 'category', 0, 'coding', 0, 'code'),
+        code=_path(report, 'code', 'coding', 0, 'code'),
+        display=_path(report, 'code', 'coding', 0, 'display'),
+        effective_date_time=parse_fhir_datetime(
+            _path(report, 'effectiveDateTime') or _path(report, 'effectivePeriod', 'start')
+        ),
+        issued=parse_fhir_datetime(_path(report, 'issued')),
+        conclusion=_path(report, 'conclusion'),
+        import_date=context.created_at,
+    )
+
+
+@register_mapper("Procedure")
+def map_procedure(procedure: Any, context: MappingContext) -> Procedure:
+    resolve = context.references.resolve
+    return Procedure(
+        id=procedure.id,
+        resource_id=procedure.id,
+        patient_id=resolve(_path(procedure, 'subject')),
+        encounter_id=resolve(_path(procedure, 'encounter')),
+        performer_id=resolve(_path(procedure, 'performer', 0, 'actor')),
+        location_id=resolve(_path(procedure, 'location')),
+        status=_path(procedure, 'status'),
+        code=_path(procedure, 'code', 'coding', 0, 'code'),
+        display=_path(procedure, 'code', 'coding', 0, 'display'),
+        performed_date_time=parse_fhir_datetime(
+            _path(procedure, 'performedDateTime') or _path(procedure, 'performedPeriod', 'start')
+        ),
+        import_date=context.created_at,
+    )
+
+
+@register_mapper("Claim")
+def map_claim(claim: Any, context: MappingContext) -> Claim:
+    resolve = context.references.resolve
+    return Claim(
+        id=claim.id,
+        resource_id=claim.id,
+        patient_id=resolve(_path(claim, 'patient')),
+        insurer_id=resolve(_path(claim, 'insurer')),
+        status=_path(claim, 'status'),
+        type_code=_path(claim, 'type', 'coding', 0, 'code'),
+        type_display=_path(claim, 'type', 'coding', 0, 'display'),
+        sub_type_code=_path(claim, 'subType', 'coding', 0, 'code'),
+        sub_type_display=_path(claim, 'subType', 'coding', 0, 'display'),
+        use=_path(claim, 'use'),
+        created=parse_fhir_datetime(_path(claim, 'created')),
+        total=_path(claim, 'total', 'value'),
+        import_date=context.created_at,
+    )
@@ -0,0 +1,163 @@
+import hashlib
+import logging
+import os
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional
+import sqlalchemy
+from sqlalchemy import MetaData
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.engine import Connection
+from sqlalchemy.schema import CreateTable
+from refiner.models import refined
+from refiner.transformer import indexes
+from refiner.transformer.indexes import deferred_index_statements
+from refiner.utils import json_codec
+
+# Source files the DDL is derived from: editing any of them invalidates compiled DDL
+SCHEMA_SOURCES = (refined.__file__, indexes.__file__)
+
+
+class CompiledSchema(NamedTuple):
+    """DDL of the models, as SQLite stores it in sqlite_master."""
+    fingerprint: str
+    # CREATE TABLE statement per table name, without trailing semicolons
+    tables: Dict[str, str]
+    # Deferred CREATE INDEX statements, ordered by index name
+    indexes: List[str]
+
+    def sql(self, secondary_indexes: bool = True) -> str:
+        """
+        The schema as published in schema.json: tables ordered by name, then the secondary indexes.
+
+        Args:
+            secondary_indexes: Include the deferred indexes
+
+        Returns:
+            Semicolon-terminated statements separated by blank lines
+        """
+        statements = [self.tables[name] for name in sorted(self.tables)]
+        if secondary_indexes:
+            statements.extend(self.indexes)
+        return "\n\n".join(statement + ";" for statement in statements)
+
+
+@lru_cache(maxsize=None)
+def models_fingerprint() -> str:
+    """
+    Fingerprint of everything the DDL depends on: the model and index sources
+    and the SQLAlchemy version. Much cheaper than walking the metadata.
+
+    Returns:
+        Hex SHA-256 digest
+    """
+    digest = hashlib.sha256(f"sqlalchemy {sqlalchemy.__version__}\n".encode())
+    for path in SCHEMA_SOURCES:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def compile_schema(metadata: MetaData, fingerprint: str) -> CompiledSchema:
+    """
+    Compile the DDL of every table in the metadata for SQLite.
+
+    Args:
+        metadata: Metadata holding the tables
+        fingerprint: Fingerprint to record with the DDL
+
+    Returns:
+        The compiled schema
+    """
+    dialect = sqlite.dialect()
+    # str() as table names are str subclasses, which some JSON encoders reject
+    tables = {
+        str(table.name): str(CreateTable(table).compile(dialect=dialect)).strip()
+        for table in metadata.sorted_tables
+    }
+    return CompiledSchema(fingerprint, tables, deferred_index_statements(metadata))
+
+
+_compiled: Dict[str, CompiledSchema] = {}
+
+
+def compiled_schema(metadata: MetaData, cache_path: Optional[str] = None) -> CompiledSchema:
+    """
+    DDL of the models, compiled once per process and, with a cache file,
+    once per change of the models.
+
+    Args:
+        metadata: Metadata holding the tables, defined in SCHEMA_SOURCES
+        cache_path: JSON file the compiled DDL is loaded from and saved to
+
+    Returns:
+        The compiled schema
+    """
+    fingerprint = models_fingerprint()
+    if fingerprint in _compiled:
+        return _compiled[fingerprint]
+
+    schema = _load_cached(cache_path, fingerprint) if cache_path else None
+    if schema is None:
+        schema = compile_schema(metadata, fingerprint)
+        if cache_path:
+            _save_cached(cache_path, schema)
+    _compiled[fingerprint] = schema
+    return schema
+
+
+def _load_cached(cache_path: str, fingerprint: str) -> Optional[CompiledSchema]:
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        cached = json_codec.load_file(cache_path)
+        if cached.get('fingerprint') != fingerprint:
+            logging.info("Models changed since the schema DDL was cached, compiling it again")
+            return None
+        return CompiledSchema(fingerprint, dict(cached['tables']), list(cached['indexes']))
+    except (OSError, ValueError, KeyError, AttributeError, TypeError) as e:
+        logging.warning(f"Ignoring unreadable schema DDL cache at {cache_path}: {e}")
+        return None
+
+
+def _save_cached(cache_path: str, schema: CompiledSchema) -> None:
+    try:
+        directory = os.path.dirname(cache_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Write then rename so a crash never leaves a truncated cache behind
+        temp_path = f"{cache_path}.tmp"
+        json_codec.dump_file(schema._asdict(), temp_path, indent=2)
+        os.replace(temp_path, cache_path)
+    except OSError as e:
+        logging.warning(f"Could not cache the schema DDL at {cache_path}: {e}")
+
+
+def stored_tables(connection: Connection, table_names: List[str]) -> Dict[str, str]:
+    """
+    CREATE TABLE statements SQLite stored for the given tables.
+
+    Args:
+        connection: Connection to the database
+        table_names: Tables to look up
+
+    Returns:
+        Statement per table name, for the tables that exist
+    """
+    rows = connection.exec_driver_sql("SELECT name, sql FROM sqlite_master WHERE type='table'")
+    wanted = set(table_names)
+    return {name: sql for name, sql in rows if name in wanted}
+
+
+def schema_mismatches(schema: CompiledSchema, connection: Connection) -> List[str]:
+    """
+    Self-check of compiled DDL against what SQLite actually stored.
+
+    Args:
+        schema: The compiled schema
+        connection: Connection to a database created from the models
+
+    Returns:
+        Names of the tables that are missing or were created differently
+    """
+    stored = stored_tables(connection, list(schema.tables))
+    return [name for name in sorted(schema.tables) if stored.get(name) != schema.tables[name]]
@@ -0,0 +1,102 @@
+import logging
+import sqlite3
+from typing import Dict, Union
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+PragmaValue = Union[int, str]
+
+# Settings for loading a freshly created database that is thrown away if the
+# run fails: no fsyncs, rollback journal kept in memory, temp tables in memory
+BULK_LOAD_PRAGMAS: Dict[str, PragmaValue] = {
+    'journal_mode': 'MEMORY',
+    'synchronous': 'OFF',
+    'temp_store': 'MEMORY',
+}
+
+# SQLite defaults, restored before the database file is handed on
+SAFE_PRAGMAS: Dict[str, PragmaValue] = {
+    'journal_mode': 'DELETE',
+    'synchronous': 'FULL',
+}
+
+
+def apply_pragmas(dbapi_connection: sqlite3.Connection, pragmas: Dict[str, PragmaValue]) -> None:
+    """
+    Run PRAGMA statements on a DB-API connection.
+
+    Args:
+        dbapi_connection: Open sqlite3 connection
+        pragmas: Pragma names and values, applied in order
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def bulk_load_pragmas(cache_size_mb: int = 64, page_size: int = 4096) -> Dict[str, PragmaValue]:
+    """
+    Pragmas for the bulk-load phase.
+
+    Args:
+        cache_size_mb: Page cache size per connection, in MiB
+        page_size: Database page size in bytes, only effective before the first table is created
+
+    Returns:
+        Pragma names and values
+    """
+    pragmas: Dict[str, PragmaValue] = {'page_size': page_size}
+    pragmas.update(BULK_LOAD_PRAGMAS)
+    # A negative cache_size is a size in KiB rather than a number of pages
+    pragmas['cache_size'] = -cache_size_mb * 1024
+    return pragmas
+
+
+def attach_bulk_load_profile(engine: Engine, cache_size_mb: int = 64, page_size: int = 4096) -> None:
+    """
+    Apply the bulk-load pragmas to every connection the engine opens.
+
+    Args:
+        engine: SQLite engine of a newly created database
+        cache_size_mb: Page cache size per connection, in MiB
+        page_size: Database page size in bytes
+    """
+    pragmas = bulk_load_pragmas(cache_size_mb, page_size)
+
+    @event.listens_for(engine, 'connect')
+    def _on_connect(dbapi_connection, connection_record):
+        apply_pragmas(dbapi_connection, pragmas)
+
+
+def optimize_database(dbapi_connection: sqlite3.Connection) -> None:
+    """
+    Refresh planner statistics and rewrite the database compactly.
+
+    Args:
+        dbapi_connection: Open sqlite3 connection with no transaction in progress
+    """
+    dbapi_connection.execute("ANALYZE")
+    dbapi_connection.execute("VACUUM")
+
+
+def finalize_database(db_path: str, optimize: bool = True) -> None:
+    """
+    Make a bulk-loaded database safe to hand on: restore durable settings and,
+    optionally, refresh planner statistics and rewrite the file compactly.
+    Every other connection to the database must be closed first.
+
+    Args:
+        db_path: Path of the SQLite database
+        optimize: Run ANALYZE and VACUUM
+    """
+    connection = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        apply_pragmas(connection, SAFE_PRAGMAS)
+        if optimize:
+            optimize_database(connection)
+    finally:
+        connection.close()
+    logging.info(f"Finalized database at {db_path}")
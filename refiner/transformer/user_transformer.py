@@ -1,9 +1,10 @@
-from typing import Dict, Any, List
-from refiner.models.refined import Base, UserRefined, StorageMetric, AuthSource, Patient
-from refiner.models.unrefined import GoogleProfileFHIRPatient, PatientResource
+from datetime import datetime
+from typing import Dict, Any, Iterable, Iterator, List, Optional
+from refiner.models.refined import Base, UserRefined, StorageMetric, AuthSource
+from refiner.models.unrefined import Entry, GoogleProfileFHIRHeader, GoogleProfileFHIRPatient, TrustedResource, trusted_resource
 from refiner.transformer.base_transformer import DataTransformer
+from refiner.transformer.resource_mappers import MappingContext, map_resource
 from refiner.utils.date import parse_timestamp
-from refiner.utils.pii import mask_email
 
 
 class UserTransformer(DataTransformer):
@@ -11,6 +12,9 @@ class UserTransformer(DataTransformer):
     Transformer for Google Profile + FHIR Patient Bundle
     into refined SQLAlchemy models.
     """
+
+    # Rows mapped from the bundle header rather than from FHIR resources
+    rebuilt_tables = ('users', 'storage_metrics', 'auth_sources')
     
     def transform(self, data: Dict[str, Any]) -> List[Base]:
         """
@@ -22,16 +26,86 @@ class UserTransformer(DataTransformer):
         Returns:
             List of SQLAlchemy model instances
         """
+        # Entries are checked one at a time, so unchanged ones are never validated
+        if self.trusted_input or self.resource_hashes is not None:
+            header = {key: value for key, value in data.items() if key != self.stream_key}
+            return list(self.transform_stream(header, data.get(self.stream_key) or []))
+
         # Validate data against Pydantic schema
-        bundle = GoogleProfileFHIRPatient.model_validate(data)
-        created_at = parse_timestamp(bundle.timestamp)
+        return self.transform_bundle(GoogleProfileFHIRPatient.model_validate(data))
+
+    def transform_bundle(self, bundle: GoogleProfileFHIRPatient) -> List[Base]:
+        """
+        Map an already validated bundle into SQLAlchemy model instances.
         
+        Args:
+            bundle: Validated Google profile + FHIR patient bundle
+            
+        Returns:
+            List of SQLAlchemy model instances
+        """
+        created_at = parse_timestamp(bundle.timestamp)
+
+        models = self._transform_header(bundle, created_at)
+        context = MappingContext(created_at)
+        for entry in bundle.entry:
+            model = self._transform_entry(entry, context)
+            if model is not None:
+                models.append(model)
+
+        return models
+
+    def transform_stream(self, header: Dict[str, Any], entries: Iterable[Dict[str, Any]]) -> Iterator[Base]:
+        """
+        Transform a bundle whose entries are decoded one at a time.
+
+        Args:
+            header: Dictionary containing the top-level user data
+            entries: Iterable of raw FHIR bundle entries
+
+        Returns:
+            Iterator of SQLAlchemy model instances
+        """
+        bundle = GoogleProfileFHIRHeader.model_validate(header)
+        created_at = parse_timestamp(bundle.timestamp)
+
+        yield from self._transform_header(bundle, created_at)
+        context = MappingContext(created_at)
+        hashes = self.resource_hashes
+        checked = set()
+        for raw_entry in entries:
+            if hashes is not None:
+                raw_resource = raw_entry.get('resource')
+                if not isinstance(raw_resource, dict) or raw_resource.get('id') is None:
+                    continue
+                # Like map_resource, the first occurrence in a bundle wins
+                resource_key = (raw_resource.get('resourceType'), raw_resource['id'])
+                key, digest = (None, None) if resource_key in checked else hashes.check(raw_resource)
+                checked.add(resource_key)
+                if key is None:
+                    # Not mapped again, but other resources may still refer to it
+                    context.references.register(TrustedResource(raw_resource), raw_entry.get('fullUrl'))
+                    continue
+
+            if self.trusted_input:
+                resource = trusted_resource(raw_entry.get('resource'))
+                model = map_resource(resource, context, raw_entry.get('fullUrl'))
+            else:
+                model = self._transform_entry(Entry.model_validate(raw_entry), context)
+
+            if hashes is not None:
+                hashes.record(key, digest, model)
+            if model is not None:
+                yield model
+
+    def _transform_header(self, bundle: GoogleProfileFHIRHeader, created_at: datetime) -> List[Base]:
+        """Map the Google profile fields of a bundle."""
         # -----------------------------
         # User Profile
         # -----------------------------
         user = UserRefined(
             user_id=bundle.userId,
-            email=mask_email(bundle.email),
+            email=bundle.email,
             name=bundle.profile.name,
             locale=bundle.profile.locale,
             created_at=created_at
@@ -57,50 +131,11 @@ class UserTransformer(DataTransformer):
             )
             models.append(auth_source)
 
+        return models
+
+    def _transform_entry(self, entry: Entry, context: MappingContext) -> Optional[Base]:
+        """Map a single bundle entry, returning None for unsupported resources."""
         # -----------------------------
-        # Patient Resource(s) in Bundle
+        # FHIR Resources in Bundle
         # -----------------------------
-        for entry in bundle.entry:
-            if entry.resource and entry.resource.resourceType == "Patient":
-                patient: PatientResource = entry.resource
-
-                patient_model = Patient(
-                    id=patient.id,
-                    resource_id=patient.id,
-                    first_name=(
-                        patient.name[0].given[0]
-                        if patient.name and patient.name[0].given
-                        else None
-                    ),
-                    last_name=(
-                        patient.name[0].family
-                        if patient.name and patient.name[0].family
-                        else None
-                    ),
-                    prefix=(
-                        patient.name[0].prefix[0]
-                        if patient.name and patient.name[0].prefix
-                        else None
-                    ),
-                    gender=patient.gender,
-                    birth_date=patient.birthDate,
-                    deceased_date_time=patient.deceasedDateTime,
-                    marital_status=(
-                        patient.maritalStatus.coding[0].code
-                        if patient.maritalStatus and patient.maritalStatus.coding
-                        else None
-                    ),
-                    multiple_birth_boolean=patient.multipleBirthBoolean,
-                    # optional: flatten address
-                    address_line=",".join(patient.address[0].line)
-                        if patient.address and patient.address[0].line else None,
-                    address_city=patient.address[0].city if patient.address else None,
-                    address_state=patient.address[0].state if patient.address else None,
-                    address_postal_code=patient.address[0].postalCode if patient.address else None,
-                    address_country=patient.address[0].country if patient.address else None,
-                    import_date=created_at,
-                )
-
-                models.append(patient_model)
-
-        return models
+        return map_resource(entry.resource, context, entry.fullUrl)
@@ -0,0 +1,184 @@
+import io
+import logging
+import os
+import threading
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import IO, Iterator, List, NamedTuple, Sequence, Tuple, Union
+
+# Archives kept open by this process, so the central directory of each is parsed
+# once rather than for every member read. Bounded for long-running batch workers.
+MAX_OPEN_ARCHIVES = 16
+_open_archives: 'OrderedDict[str, Tuple[Tuple[int, int], zipfile.ZipFile]]' = OrderedDict()
+_open_archives_lock = threading.Lock()
+
+
+class ZipMember(NamedTuple):
+    """A file inside a zip archive, read in place instead of being extracted."""
+    archive: str
+    name: str
+    file_size: int
+
+
+# An input file on disk, or a member of an archive
+InputSource = Union[str, ZipMember]
+
+
+def _open_archive(archive_path: str) -> zipfile.ZipFile:
+    """
+    Return the open ZipFile of an archive, reopening it only when the file on
+    disk has changed since, e.g. when a batch job reuses an input path.
+    """
+    stat = os.stat(archive_path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _open_archives_lock:
+        cached = _open_archives.get(archive_path)
+        if cached is not None and cached[0] == signature:
+            _open_archives.move_to_end(archive_path)
+            return cached[1]
+        if cached is not None:
+            # Members still being read keep the underlying file open until they are closed
+            cached[1].close()
+        archive = zipfile.ZipFile(archive_path, 'r')
+        _open_archives[archive_path] = (signature, archive)
+        while len(_open_archives) > MAX_OPEN_ARCHIVES:
+            _open_archives.popitem(last=False)[1][1].close()
+        return archive
+
+
+def close_archives() -> None:
+    """Close the archives this process keeps open for reading members."""
+    with _open_archives_lock:
+        for _, archive in _open_archives.values():
+            archive.close()
+        _open_archives.clear()
+
+
+@contextmanager
+def open_input(source: InputSource, text: bool = False) -> Iterator[IO]:
+    """
+    Open an input file or archive member for reading, decompressing members as they are read.
+
+    Args:
+        source: Path of the file, or the archive member
+        text: Decode the content as UTF-8 text instead of returning bytes
+
+    Returns:
+        Context manager yielding the open file object
+    """
+    if isinstance(source, ZipMember):
+        with _open_archive(source.archive).open(source.name, 'r') as member:
+            yield io.TextIOWrapper(member, encoding='utf-8') if text else member
+    else:
+        with open(source, 'r', encoding='utf-8') if text else open(source, 'rb') as f:
+            yield f
+
+
+def read_input(source: InputSource) -> bytes:
+    """Read the whole content of an input file or archive member."""
+    with open_input(source) as f:
+        return f.read()
+
+
+def input_size(source: InputSource) -> int:
+    """Uncompressed size of an input file or archive member, in bytes."""
+    if isinstance(source, ZipMember):
+        return source.file_size
+    return os.path.getsize(source)
+
+
+def input_name(source: InputSource) -> str:
+    """Short name of an input for log messages."""
+    if isinstance(source, ZipMember):
+        return f"{os.path.basename(source.archive)}:{source.name}"
+    return os.path.basename(source)
+
+
+def is_json_input(file_name: str) -> bool:
+    """
+    Whether a file is refined as input: a .json file that is not hidden, such
+    as the ._*.json AppleDouble files macOS adds next to every file it zips.
+
+    Args:
+        file_name: Name of the file, without directories
+
+    Returns:
+        True for input files
+    """
+    return not file_name.startswith('.') and os.path.splitext(file_name)[1].lower() == '.json'
+
+
+def _checked_members(archive_paths: Sequence[str], max_members: int,
+                     max_total_size: int) -> List[List[zipfile.ZipInfo]]:
+    """
+    Read the central directory of each archive and reject the lot if, together,
+    they hold more members or more uncompressed bytes than allowed. zipfile stops
+    reading a member at its declared size and fails on a CRC mismatch, so the
+    declared sizes bound what is actually decompressed.
+    """
+    members = []
+    member_count = 0
+    total_size = 0
+    for archive_path in archive_paths:
+        with zipfile.ZipFile(archive_path, 'r') as archive:
+            infos = [info for info in archive.infolist() if not info.is_dir()]
+        member_count += len(infos)
+        total_size += sum(info.file_size for info in infos)
+        if member_count > max_members:
+            raise ValueError(f"Zip archives in the input hold more than {max_members} members")
+        if total_size > max_total_size:
+            raise ValueError(f"Zip archives in the input expand to more than {max_total_size} bytes")
+        members.append(infos)
+    return members
+
+
+def list_json_members(archive_paths: Sequence[str], max_members: int, max_total_size: int) -> List[ZipMember]:
+    """
+    List the JSON input members at the top level of zip archives, after
+    checking the archives against the limits. These are the files refined
+    when the archives are extracted into the input directory instead:
+    members in folders, such as __MACOSX/, are skipped.
+
+    Args:
+        archive_paths: Paths of the zip archives
+        max_members: Maximum number of files in all archives together
+        max_total_size: Maximum uncompressed size of all archives together, in bytes
+
+    Returns:
+        JSON members in archive order
+    """
+    json_members = []
+    for archive_path, infos in zip(archive_paths, _checked_members(archive_paths, max_members, max_total_size)):
+        for info in infos:
+            if '/' not in info.filename and is_json_input(info.filename):
+                json_members.append(ZipMember(archive_path, info.filename, info.file_size))
+    return json_members
+
+
+def extract_archives(archive_paths: Sequence[str], target_dir: str, max_members: int,
+                     max_total_size: int, max_workers: int = 4) -> None:
+    """
+    Extract zip archives into a directory, several archives at a time, after
+    checking them against the limits.
+
+    Args:
+        archive_paths: Paths of the zip archives
+        target_dir: Directory to extract into
+        max_members: Maximum number of files in all archives together
+        max_total_size: Maximum uncompressed size of all archives together, in bytes
+        max_workers: Number of archives extracted concurrently
+    """
+    _checked_members(archive_paths, max_members, max_total_size)
+    if not archive_paths:
+        return
+
+    def extract(archive_path: str) -> None:
+        with zipfile.ZipFile(archive_path, 'r') as archive:
+            archive.extractall(target_dir)
+        logging.info(f"Extracted {os.path.basename(archive_path)}")
+
+    # Decompression releases the GIL, so threads extract archives in parallel
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(archive_paths))) as pool:
+        list(pool.map(extract, archive_paths))
@@ -1,8 +1,41 @@
-from datetime import datetime
+from datetime import datetime, timezone
 
 
 def parse_timestamp(timestamp):
     """Parse a timestamp to a datetime object."""
     if isinstance(timestamp, int):
         return datetime.fromtimestamp(timestamp / 1000.0)
-    return datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
\ No newline at end of file
+    return datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+
+
+def _parse_fhir_value(value):
+    """Parse a FHIR date or dateTime as written, completing partial dates such as '2020' or '2020-05'."""
+    if not value:
+        return None
+    if len(value) == 4:
+        value = f"{value}-01-01"
+    elif len(value) == 7:
+        value = f"{value}-01"
+    return parse_timestamp(value)
+
+
+def parse_fhir_datetime(value):
+    """
+    Parse a FHIR date or dateTime, allowing partial dates such as '2020' or '2020-05'.
+    Times with a UTC offset are converted to naive UTC, as SQLite DateTime
+    columns drop the offset without converting.
+    """
+    return to_naive_utc(_parse_fhir_value(value))
+
+
+def to_naive_utc(value):
+    """Convert a datetime with a UTC offset to naive UTC; naive datetimes and None pass through."""
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def parse_fhir_date(value):
+    """Parse a FHIR date to a date object, the calendar date as written."""
+    parsed = _parse_fhir_value(value)
+    return parsed.date() if parsed else None
@@ -1,16 +1,272 @@
-import pgpy
-from pgpy.constants import CompressionAlgorithm, HashAlgorithm
+import base64
+import hashlib
 import os
+import zlib
+from typing import BinaryIO, Callable, Iterator, List, Optional
+
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms
+try:
+    from cryptography.hazmat.decrepit.ciphers.modes import CFB
+except ImportError:  # cryptography < 43
+    from cryptography.hazmat.primitives.ciphers.modes import CFB
+
 from refiner.config import settings
 
+# Plaintext bytes read from the database per step of the streaming encryptor
+ENCRYPT_CHUNK_SIZE = 1024 * 1024
+
+# OpenPGP (RFC 4880) constants used by the streaming encryptor
+_TAG_SKESK = 3
+_TAG_COMPRESSED = 8
+_TAG_LITERAL = 11
+_TAG_SEIPD = 18
+_SYM_AES256 = 9
+_HASH_SHA512 = 10
+_COMPRESS_ZLIB = 2
+_S2K_ITERATED = 3
+_S2K_COUNT = 255  # 65011712 octets hashed, the value pgpy uses for SHA512
+_PARTIAL_POWER = 16  # partial body chunks of 64 KiB
+
+_CRC24_INIT = 0xB704CE
+_CRC24_POLY = 0x1864CFB
+
+_ARMOR_HEADER = b'-----BEGIN PGP MESSAGE-----\n\n'
+_ARMOR_FOOTER = b'-----END PGP MESSAGE-----\n'
+
+
+def _crc24_table() -> List[int]:
+    table = []
+    for byte in range(256):
+        crc = byte << 16
+        for _ in range(8):
+            crc <<= 1
+            if crc & 0x1000000:
+                crc ^= _CRC24_POLY
+        table.append(crc & 0xFFFFFF)
+    return table
+
+
+_CRC24_TABLE = _crc24_table()
+
+
+def _crc24(data: bytes, crc: int) -> int:
+    table = _CRC24_TABLE
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFFFF) ^ table[(crc >> 16) ^ byte]
+    return crc
+
+
+def _new_length(length: int) -> bytes:
+    """Encode a definite new-format packet length."""
+    if length < 192:
+        return bytes([length])
+    if length < 8384:
+        length -= 192
+        return bytes([(length >> 8) + 192, length & 0xFF])
+    return b'\xff' + length.to_bytes(4, 'big')
+
+
+def _s2k_derive_key(passphrase: bytes, salt: bytes, count: int, key_size: int) -> bytes:
+    """Iterated and salted S2K (RFC 4880 3.7.1.3), hashing in blocks instead of one big buffer."""
+    seed = salt + passphrase
+    octets = max(count, len(seed))
+    block = seed * max(1, (64 * 1024) // len(seed))
+    hasher = hashlib.sha512()
+    while octets >= len(block):
+        hasher.update(block)
+        octets -= len(block)
+    hasher.update((seed * (octets // len(seed) + 1))[:octets])
+    return hasher.digest()[:key_size]
+
+
+class _PacketWriter:
+    """Writes a new-format packet whose body is emitted as partial body length chunks."""
+
+    def __init__(self, tag: int, sink: Callable[[bytes], None]):
+        self._sink = sink
+        self._buffer = bytearray()
+        self._part_size = 1 << _PARTIAL_POWER
+        self._sink(bytes([0xC0 | tag]))
+
+    def write(self, data: bytes) -> None:
+        self._buffer += data
+        while len(self._buffer) >= self._part_size:
+            self._sink(bytes([0xE0 | _PARTIAL_POWER]) + bytes(self._buffer[:self._part_size]))
+            del self._buffer[:self._part_size]
+
+    def close(self) -> None:
+        self._sink(_new_length(len(self._buffer)) + bytes(self._buffer))
+        self._buffer.clear()
+
+
+class _ZlibWriter:
+    def __init__(self, sink: _PacketWriter):
+        self._sink = sink
+        self._compressor = zlib.compressobj()
+
+    def write(self, data: bytes) -> None:
+        compressed = self._compressor.compress(data)
+        if compressed:
+            self._sink.write(compressed)
+
+    def close(self) -> None:
+        self._sink.write(self._compressor.flush())
+        self._sink.close()
+
+
+class _EncryptingWriter:
+    """OpenPGP CFB encryption with a modification detection code (RFC 4880 5.13)."""
+
+    def __init__(self, key: bytes, sink: _PacketWriter):
+        self._sink = sink
+        self._encryptor = Cipher(algorithms.AES(key), CFB(b'\x00' * 16)).encryptor()
+        self._mdc = hashlib.sha1()
+        prefix = os.urandom(16)
+        self.write(prefix + prefix[-2:])
+
+    def write(self, data: bytes) -> None:
+        self._mdc.update(data)
+        self._sink.write(self._encryptor.update(data))
+
+    def close(self) -> None:
+        trailer = b'\xd3\x14'
+        self._mdc.update(trailer)
+        self._sink.write(self._encryptor.update(trailer + self._mdc.digest()) + self._encryptor.finalize())
+        self._sink.close()
+
+
+class _ArmorWriter:
+    """ASCII armor in the layout pgpy produces, with a running CRC24."""
+
+    def __init__(self, sink: Callable[[bytes], None]):
+        self._sink = sink
+        self._buffer = bytearray()
+        self._crc = _CRC24_INIT
+        self._sink(_ARMOR_HEADER)
+
+    def __call__(self, data: bytes) -> None:
+        self._crc = _crc24(data, self._crc)
+        self._buffer += data
+        # 48 raw bytes per 64-character line
+        whole = len(self._buffer) - len(self._buffer) % 48
+        if whole:
+            self._sink(self._encode(self._buffer[:whole]))
+            del self._buffer[:whole]
 
-def encrypt_file(encryption_key: str, file_path: str, output_path: str = None) -> str:
+    def close(self) -> None:
+        tail = self._encode(self._buffer) if self._buffer else b''
+        checksum = base64.b64encode(self._crc.to_bytes(3, 'big'))
+        self._sink(tail + b'=' + checksum + b'\n' + _ARMOR_FOOTER)
+
+    @staticmethod
+    def _encode(data: bytes) -> bytes:
+        return b''.join(
+            base64.b64encode(data[start:start + 48]) + b'\n' for start in range(0, len(data), 48)
+        )
+
+
+def armored_size(binary_size: int) -> int:
+    """Size of the ASCII armor encoding of a binary OpenPGP message of binary_size bytes."""
+    full_lines, remainder = divmod(binary_size, 48)
+    body = full_lines * 65 + (4 * -(-remainder // 3) + 1 if remainder else 0)
+    return len(_ARMOR_HEADER) + body + len(b'=XXXX\n') + len(_ARMOR_FOOTER)
+
+
+def is_armored(data: bytes) -> bool:
+    """Whether data is an ASCII-armored (rather than binary) OpenPGP message."""
+    return data.lstrip()[:len(_ARMOR_HEADER) - 2] == _ARMOR_HEADER[:-2]
+
+
+def iter_encrypted(encryption_key: str, source: BinaryIO, chunk_size: int = ENCRYPT_CHUNK_SIZE,
+                   armor: bool = True) -> Iterator[bytes]:
+    """Symmetrically encrypt a binary stream, yielding OpenPGP output as it is produced.
+
+    The message is an AES-256 symmetrically encrypted, integrity protected packet
+    holding a ZLIB compressed literal packet, the same structure pgpy produces,
+    so it can be read by decrypt_file. Memory use is independent of the input size.
+
+    Args:
+        encryption_key: The passphrase to encrypt with
+        source: Binary stream to encrypt
+        chunk_size: Number of plaintext bytes read at a time
+        armor: Wrap the packets in ASCII armor; binary output is about 25% smaller
+
+    Returns:
+        Iterator over chunks of the encrypted message
+    """
+    output: List[bytes] = []
+    armor_writer = _ArmorWriter(output.append) if armor else None
+    sink = armor_writer or output.append
+
+    # Symmetric-key encrypted session key packet, using the S2K derived key directly
+    salt = os.urandom(8)
+    count = (16 + (_S2K_COUNT & 15)) << ((_S2K_COUNT >> 4) + 6)
+    key = _s2k_derive_key(encryption_key.encode(), salt, count, 32)
+    skesk = bytes([4, _SYM_AES256, _S2K_ITERATED, _HASH_SHA512]) + salt + bytes([_S2K_COUNT])
+    sink(bytes([0xC0 | _TAG_SKESK]) + _new_length(len(skesk)) + skesk)
+
+    # Encrypted data -> compressed data -> literal data, each streamed with partial lengths
+    seipd = _PacketWriter(_TAG_SEIPD, sink)
+    seipd.write(b'\x01')
+    encrypted = _EncryptingWriter(key, seipd)
+    compressed = _PacketWriter(_TAG_COMPRESSED, encrypted.write)
+    compressed.write(bytes([_COMPRESS_ZLIB]))
+    compressor = _ZlibWriter(compressed)
+    literal = _PacketWriter(_TAG_LITERAL, compressor.write)
+    literal.write(b'b\x00' + b'\x00\x00\x00\x00')
+
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        literal.write(chunk)
+        if output:
+            yield b''.join(output)
+            output.clear()
+
+    literal.close()
+    compressor.close()
+    encrypted.close()
+    if armor_writer:
+        armor_writer.close()
+    yield b''.join(output)
+
+
+def iter_encrypted_file(encryption_key: str, file_path: str, armor: bool = True,
+                        copy_path: Optional[str] = None) -> Iterator[bytes]:
+    """Symmetrically encrypt a file, yielding the message in chunks without writing it to disk.
+
+    Args:
+        encryption_key: The passphrase to encrypt with
+        file_path: Path to the file to encrypt
+        armor: Produce an ASCII-armored message instead of raw binary packets
+        copy_path: Optional path to also write the encrypted message to
+
+    Returns:
+        Iterator over chunks of the encrypted message
+    """
+    with open(file_path, 'rb') as source:
+        chunks = iter_encrypted(encryption_key, source, armor=armor)
+        if copy_path is None:
+            yield from chunks
+            return
+        with open(copy_path, 'wb') as copy:
+            for chunk in chunks:
+                copy.write(chunk)
+                yield chunk
+
+
+def encrypt_file(encryption_key: str, file_path: str, output_path: str = None, streaming: bool = True,
+                 armor: bool = True) -> str:
     """Symmetrically encrypts a file with an encryption key.
 
     Args:
         encryption_key: The passphrase to encrypt with
         file_path: Path to the file to encrypt
         output_path: Optional path to save encrypted file (defaults to file_path + .pgp)
+        streaming: Encrypt in fixed-size chunks straight to disk instead of
+            building the whole message in memory with pgpy
+        armor: Write an ASCII-armored message instead of raw binary packets
 
     Returns:
         Path to encrypted file
@@ -18,6 +274,16 @@ def encrypt_file(encryption_key: str, file_path: str, output_path: str = None) -
     if output_path is None:
         output_path = f"{file_path}.pgp"
     
+    if streaming:
+        with open(file_path, 'rb') as source, open(output_path, 'wb') as f:
+            for chunk in iter_encrypted(encryption_key, source, armor=armor):
+                f.write(chunk)
+        return output_path
+
+    # pgpy is slow to import and only needed here and for decryption
+    import pgpy
+    from pgpy.constants import CompressionAlgorithm, HashAlgorithm
+
     with open(file_path, 'rb') as f:
         buffer = f.read()
     
@@ -27,7 +293,7 @@ def encrypt_file(encryption_key: str, file_path: str, output_path: str = None) -
     )
     
     with open(output_path, 'wb') as f:
-        f.write(str(encrypted_message).encode())
+        f.write(str(encrypted_message).encode() if armor else bytes(encrypted_message))
     
     return output_path
 
@@ -37,7 +303,7 @@ def decrypt_file(encryption_key: str, file_path: str, output_path: str = None) -
 
     Args:
         encryption_key: The passphrase to decrypt with
-        file_path: Path to the encrypted file
+        file_path: Path to the encrypted file, either ASCII-armored or binary
         output_path: Optional path to save decrypted file (defaults to file_path without .pgp)
 
     Returns:
@@ -49,10 +315,15 @@ def decrypt_file(encryption_key: str, file_path: str, output_path: str = None) -
         else:
             output_path = f"{file_path}.decrypted"
             
+    import pgpy
+
     with open(file_path, 'rb') as f:
         encrypted_data = f.read()
     
-    message = pgpy.PGPMessage.from_blob(encrypted_data)
+    if is_armored(encrypted_data):
+        message = pgpy.PGPMessage.from_blob(encrypted_data.decode('latin-1'))
+    else:
+        message = pgpy.PGPMessage.from_blob(bytearray(encrypted_data))
     decrypted_message = message.decrypt(encryption_key)
     
     with open(output_path, 'wb') as f:
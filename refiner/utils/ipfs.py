@@ -1,11 +1,284 @@
-import json
 import logging
 import os
+import random
+import time
+import uuid
 import requests
+from requests.adapters import HTTPAdapter
 from refiner.config import settings
+from refiner.utils import json_codec
+
+PINATA_FILE_API_PATH = "/pinning/pinFileToIPFS"
+PINATA_JSON_API_PATH = "/pinning/pinJSONToIPFS"
+
+# Responses worth retrying: rate limiting and transient server errors
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+# Upper bound of a single backoff delay, in seconds
+MAX_RETRY_DELAY = 60.0
+
+
+class MultipartFileBody:
+    """
+    A multipart/form-data body with a single file field, read from disk as it is sent.
+    Exposes its length so the request carries a Content-Length header rather than
+    using chunked transfer encoding.
+    """
+
+    def __init__(self, file_path, field_name='file'):
+        """
+        :param file_path: Path to the file to send
+        :param field_name: Name of the form field holding the file
+        """
+        boundary = uuid.uuid4().hex
+        filename = os.path.basename(file_path).replace('"', '')
+        self.content_type = f"multipart/form-data; boundary={boundary}"
+        self._head = (
+            f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="{field_name}"; filename="{filename}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'
+        ).encode()
+        self._tail = f'\r\n--{boundary}--\r\n'.encode()
+        self._file = open(file_path, 'rb')
+        self._length = len(self._head) + os.fstat(self._file.fileno()).st_size + len(self._tail)
+        self._parts = [self._head, self._file, self._tail]
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size=-1):
+        chunks = []
+        while self._parts and (size < 0 or size > 0):
+            part = self._parts[0]
+            if isinstance(part, bytes):
+                chunk = part if size < 0 else part[:size]
+                if len(chunk) == len(part):
+                    self._parts.pop(0)
+                else:
+                    self._parts[0] = part[len(chunk):]
+            else:
+                chunk = part.read(size)
+                if not chunk or size < 0:
+                    self._parts.pop(0)
+            chunks.append(chunk)
+            if size > 0:
+                size -= len(chunk)
+        return b''.join(chunks)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def iter_multipart_chunks(chunks, boundary, field_name='file', filename='file'):
+    """
+    Wrap a stream of file chunks in a multipart/form-data body with a single file field.
+    :param chunks: Iterable of bytes making up the file
+    :param boundary: Multipart boundary, also sent in the Content-Type header
+    :param field_name: Name of the form field holding the file
+    :param filename: File name reported to the server
+    :return: Iterator of body chunks
+    """
+    yield (
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="{field_name}"; filename="{filename}"\r\n'
+        f'Content-Type: application/octet-stream\r\n\r\n'
+    ).encode()
+    for chunk in chunks:
+        if chunk:
+            yield chunk
+    yield f'\r\n--{boundary}--\r\n'.encode()
+
+
+class IPFSClient:
+    """
+    Pinata API client holding one pooled keep-alive session.
+    Uploads are retried with jittered exponential backoff after connection
+    errors, timeouts, 429 and 5xx responses.
+    """
+
+    def __init__(self, api_key=None, api_secret=None, api_url=None, connect_timeout=None,
+                 read_timeout=None, max_retries=None, retry_backoff=None, pool_size=4):
+        """
+        :param api_key: Pinata API key (defaults to settings.PINATA_API_KEY)
+        :param api_secret: Pinata API secret (defaults to settings.PINATA_API_SECRET)
+        :param api_url: Base URL of the API (defaults to settings.PINATA_API_URL)
+        :param connect_timeout: Seconds to wait for a connection (defaults to settings.IPFS_CONNECT_TIMEOUT)
+        :param read_timeout: Seconds to wait for a response (defaults to settings.IPFS_READ_TIMEOUT)
+        :param max_retries: Retries after the first attempt (defaults to settings.IPFS_MAX_RETRIES)
+        :param retry_backoff: Base backoff delay in seconds (defaults to settings.IPFS_RETRY_BACKOFF)
+        :param pool_size: Number of connections kept alive per host
+        """
+        api_key = api_key or settings.PINATA_API_KEY
+        api_secret = api_secret or settings.PINATA_API_SECRET
+        if not api_key or not api_secret:
+            raise Exception("Error: Pinata IPFS API credentials not found, please check your environment variables")
+
+        self.api_url = (api_url or settings.PINATA_API_URL).rstrip('/')
+        self.timeout = (
+            connect_timeout if connect_timeout is not None else settings.IPFS_CONNECT_TIMEOUT,
+            read_timeout if read_timeout is not None else settings.IPFS_READ_TIMEOUT
+        )
+        self.max_retries = max_retries if max_retries is not None else settings.IPFS_MAX_RETRIES
+        self.retry_backoff = retry_backoff if retry_backoff is not None else settings.IPFS_RETRY_BACKOFF
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            "pinata_api_key": api_key,
+            "pinata_secret_api_key": api_secret
+        })
+
+    def upload_json(self, data):
+        """
+        Uploads JSON data to IPFS.
+        :param data: JSON data to upload (dictionary or list)
+        :return: IPFS hash
+        """
+        body = json_codec.dumps(data)
+        try:
+            response = self._post(
+                PINATA_JSON_API_PATH,
+                lambda: body,
+                {"Content-Type": "application/json"}
+            )
+            result = response.json()
+            logging.info(f"Successfully uploaded JSON to IPFS with hash: {result['IpfsHash']}")
+            return result['IpfsHash']
+
+        except requests.exceptions.RequestException as e:
+            logging.error(f"An error occurred while uploading JSON to IPFS: {e}")
+            raise e
+
+    def upload_file(self, file_path):
+        """
+        Uploads a file to IPFS, streaming it from disk.
+        :param file_path: Path to the file to upload
+        :return: IPFS hash
+        """
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"File not found: {file_path}")
+
+        bodies = []
+
+        def open_body():
+            # Each attempt re-reads the file from the start
+            body = MultipartFileBody(file_path)
+            bodies.append(body)
+            return body
+
+        try:
+            response = self._post(
+                PINATA_FILE_API_PATH,
+                open_body,
+                lambda body: {"Content-Type": body.content_type}
+            )
+            result = response.json()
+            logging.info(f"Successfully uploaded file to IPFS with hash: {result['IpfsHash']}")
+            return result['IpfsHash']
+
+        except requests.exceptions.RequestException as e:
+            logging.error(f"An error occurred while uploading file to IPFS: {e}")
+            raise e
+        finally:
+            for body in bodies:
+                body.close()
+
+    def upload_chunks(self, make_chunks, filename):
+        """
+        Uploads a file produced on the fly, such as an encryption stream, as a
+        chunked multipart body so it never has to be written to disk.
+        :param make_chunks: Callable returning a fresh iterable of file chunks for each attempt
+        :param filename: File name reported to the server
+        :return: IPFS hash
+        """
+        boundary = uuid.uuid4().hex
+        try:
+            response = self._post(
+                PINATA_FILE_API_PATH,
+                lambda: iter_multipart_chunks(make_chunks(), boundary, filename=filename),
+                {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+            )
+            result = response.json()
+            logging.info(f"Successfully uploaded file to IPFS with hash: {result['IpfsHash']}")
+            return result['IpfsHash']
+
+        except requests.exceptions.RequestException as e:
+            logging.error(f"An error occurred while uploading file to IPFS: {e}")
+            raise e
+
+    def _post(self, path, make_body, headers):
+        """
+        POST to the API, retrying transient failures.
+        :param path: Path of the endpoint below api_url
+        :param make_body: Callable returning a fresh request body for each attempt
+        :param headers: Request headers, or a callable building them from the body
+        :return: Successful response
+        """
+        url = f"{self.api_url}{path}"
+        attempt = 0
+        while True:
+            body = make_body()
+            try:
+                response = self.session.post(
+                    url,
+                    data=body,
+                    headers=headers(body) if callable(headers) else headers,
+                    timeout=self.timeout
+                )
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt >= self.max_retries:
+                    raise e
+                delay = self._backoff(attempt)
+                logging.warning(f"Request to {url} failed ({e}), retrying in {delay:.2f}s")
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    response.raise_for_status()
+                    return response
+                delay = self._backoff(attempt, response.headers.get('Retry-After'))
+                logging.warning(f"Request to {url} returned {response.status_code}, retrying in {delay:.2f}s")
+                response.close()
+
+            time.sleep(delay)
+            attempt += 1
+
+    def _backoff(self, attempt, retry_after=None):
+        """Full-jitter exponential backoff, never shorter than a numeric Retry-After."""
+        delay = random.uniform(0, min(MAX_RETRY_DELAY, self.retry_backoff * 2 ** attempt))
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, min(MAX_RETRY_DELAY, float(retry_after)))
+        return delay
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+_client = None
+
+
+def get_ipfs_client():
+    """
+    Returns the shared client, creating it on first use so its session and
+    connections are reused across uploads.
+    :return: IPFSClient
+    """
+    global _client
+    if _client is None:
+        _client = IPFSClient()
+    return _client
 
-PINATA_FILE_API_ENDPOINT = "https://api.pinata.cloud/pinning/pinFileToIPFS"
-PINATA_JSON_API_ENDPOINT = "https://api.pinata.cloud/pinning/pinJSONToIPFS"
 
 def upload_json_to_ipfs(data):
     """
@@ -13,30 +286,7 @@ def upload_json_to_ipfs(data):
     :param data: JSON data to upload (dictionary or list)
     :return: IPFS hash
     """
-    if not settings.PINATA_API_KEY or not settings.PINATA_API_SECRET:
-        raise Exception("Error: Pinata IPFS API credentials not found, please check your environment variables")
-
-    headers = {
-        "Content-Type": "application/json",
-        "pinata_api_key": settings.PINATA_API_KEY,
-        "pinata_secret_api_key": settings.PINATA_API_SECRET
-    }
-
-    try:
-        response = requests.post(
-            PINATA_JSON_API_ENDPOINT,
-            data=json.dumps(data),
-            headers=headers
-        )
-        response.raise_for_status()
-
-        result = response.json()
-        logging.info(f"Successfully uploaded JSON to IPFS with hash: {result['IpfsHash']}")
-        return result['IpfsHash']
-
-    except requests.exceptions.RequestException as e:
-        logging.error(f"An error occurred while uploading JSON to IPFS: {e}")
-        raise e
+    return get_ipfs_client().upload_json(data)
 
 def upload_file_to_ipfs(file_path=None):
     """
@@ -47,37 +297,20 @@ def upload_file_to_ipfs(file_path=None):
     if file_path is None:
         # Default to the encrypted database file
         file_path = os.path.join(settings.OUTPUT_DIR, "db.libsql.pgp")
-    
+
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"File not found: {file_path}")
-        
-    if not settings.PINATA_API_KEY or not settings.PINATA_API_SECRET:
-        raise Exception("Error: Pinata IPFS API credentials not found, please check your environment variables")
-
-    headers = {
-        "pinata_api_key": settings.PINATA_API_KEY,
-        "pinata_secret_api_key": settings.PINATA_API_SECRET
-    }
-
-    try:
-        with open(file_path, 'rb') as file:
-            files = {
-                'file': file
-            }
-            response = requests.post(
-                PINATA_FILE_API_ENDPOINT,
-                files=files,
-                headers=headers
-            )
-        
-        response.raise_for_status()
-        result = response.json()
-        logging.info(f"Successfully uploaded file to IPFS with hash: {result['IpfsHash']}")
-        return result['IpfsHash']
 
-    except requests.exceptions.RequestException as e:
-        logging.error(f"An error occurred while uploading file to IPFS: {e}")
-        raise e
+    return get_ipfs_client().upload_file(file_path)
+
+def upload_chunks_to_ipfs(make_chunks, filename):
+    """
+    Uploads a file streamed from an iterable of chunks using Pinata API.
+    :param make_chunks: Callable returning a fresh iterable of file chunks, called again on retries
+    :param filename: File name reported to the server
+    :return: IPFS hash
+    """
+    return get_ipfs_client().upload_chunks(make_chunks, filename)
 
 # Test with: python -m refiner.utils.ipfs
 if __name__ == "__main__":
@@ -87,4 +320,4 @@ if __name__ == "__main__":
 
     ipfs_hash = upload_json_to_ipfs()
     print(f"JSON uploaded to IPFS with hash: {ipfs_hash}")
-    print(f"Access at: {settings.IPFS_GATEWAY_URL}/{ipfs_hash}")
\ No newline at end of file
+    print(f"Access at: {settings.IPFS_GATEWAY_URL}/{ipfs_hash}")
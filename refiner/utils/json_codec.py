@@ -0,0 +1,146 @@
+"""
+JSON encoding and decoding through the fastest available backend:
+orjson, then msgspec, then the standard library.
+"""
+import json
+from typing import Any, Callable, Optional, Union
+
+from refiner.config import settings
+
+BACKENDS = ('orjson', 'msgspec', 'json')
+
+
+def _stdlib_codec():
+    def loads(data: Union[bytes, str]) -> Any:
+        # json.loads detects UTF-8/16/32 in bytes itself
+        return json.loads(data)
+
+    def dumps(obj: Any, indent: Optional[int] = None, sort_keys: bool = False) -> bytes:
+        # Compact like the other backends, so each encodes a value to the same bytes
+        separators = None if indent else (',', ':')
+        return json.dumps(
+            obj, indent=indent, separators=separators, sort_keys=sort_keys, ensure_ascii=False
+        ).encode('utf-8')
+
+    return loads, dumps
+
+
+def _orjson_codec():
+    import orjson
+
+    def dumps(obj: Any, indent: Optional[int] = None, sort_keys: bool = False) -> bytes:
+        # orjson only supports two-space indentation
+        option = orjson.OPT_INDENT_2 if indent else 0
+        return orjson.dumps(obj, option=option | orjson.OPT_SORT_KEYS if sort_keys else option)
+
+    return orjson.loads, dumps
+
+
+def _msgspec_codec():
+    import msgspec
+
+    decoder = msgspec.json.Decoder()
+    encoder = msgspec.json.Encoder()
+    sorted_encoder = msgspec.json.Encoder(order='sorted')
+
+    def loads(data: Union[bytes, str]) -> Any:
+        try:
+            return decoder.decode(data)
+        except msgspec.DecodeError as e:
+            # Invalid documents raise ValueError with every backend
+            raise ValueError(str(e)) from e
+
+    def dumps(obj: Any, indent: Optional[int] = None, sort_keys: bool = False) -> bytes:
+        data = (sorted_encoder if sort_keys else encoder).encode(obj)
+        return msgspec.json.format(data, indent=indent) if indent else data
+
+    return loads, dumps
+
+
+_CODECS = {
+    'orjson': _orjson_codec,
+    'msgspec': _msgspec_codec,
+    'json': _stdlib_codec,
+}
+
+
+def select_backend(name: str = 'auto'):
+    """
+    Choose the JSON backend used by loads, dumps, load_file and dump_file.
+
+    Args:
+        name: 'orjson', 'msgspec', 'json', or 'auto' for the first one installed
+
+    Returns:
+        Name of the selected backend
+    """
+    global backend, _loads, _dumps
+    candidates = BACKENDS if name == 'auto' else (name,)
+    for candidate in candidates:
+        if candidate not in _CODECS:
+            raise ValueError(f"Unknown JSON backend: {candidate}")
+        try:
+            _loads, _dumps = _CODECS[candidate]()
+        except ImportError:
+            if name != 'auto':
+                raise
+            continue
+        backend = candidate
+        return backend
+
+
+def _configured_loads(data: Union[bytes, str]) -> Any:
+    select_backend(settings.JSON_BACKEND)
+    return _loads(data)
+
+
+def _configured_dumps(obj: Any, indent: Optional[int], sort_keys: bool) -> bytes:
+    select_backend(settings.JSON_BACKEND)
+    return _dumps(obj, indent, sort_keys)
+
+
+# The configured backend is selected on first use rather than at import, so
+# importing this module neither reads the settings nor imports orjson or msgspec
+backend: str = 'json'
+_loads: Callable[[Union[bytes, str]], Any] = _configured_loads
+_dumps: Callable[..., bytes] = _configured_dumps
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """
+    Decode a JSON document. Invalid JSON raises ValueError with every backend.
+
+    Args:
+        data: UTF-8 encoded bytes, or text
+
+    Returns:
+        The decoded value
+    """
+    return _loads(data)
+
+
+def dumps(obj: Any, indent: Optional[int] = None, sort_keys: bool = False) -> bytes:
+    """
+    Encode a value as UTF-8 JSON.
+
+    Args:
+        obj: Value made of dicts, lists, strings, numbers, booleans and None
+        indent: Pretty-print with this indentation (orjson always uses 2 spaces)
+        sort_keys: Write object keys in sorted order, for a canonical encoding
+
+    Returns:
+        The encoded document
+    """
+    return _dumps(obj, indent, sort_keys)
+
+
+def load_file(path: str) -> Any:
+    """Decode a JSON file from its raw bytes, without a separate text-decoding pass."""
+    with open(path, 'rb') as f:
+        return _loads(f.read())
+
+
+def dump_file(obj: Any, path: str, indent: Optional[int] = None) -> None:
+    """Encode a value and write it to a file."""
+    with open(path, 'wb') as f:
+        f.write(_dumps(obj, indent, False))
@@ -0,0 +1,191 @@
+import json
+import re
+from typing import Any, Dict, IO, Iterator
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_STRUCTURAL = re.compile(r'[\[\]{}"]')
+_STRING = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+_NUMBER_TAIL = re.compile(r'[0-9.eE+\-]*')
+
+
+class JSONStreamReader:
+    """
+    Incrementally decodes a JSON document from a text stream.
+
+    Only the part of the document currently being decoded is buffered, so
+    large arrays can be consumed one element at a time.
+    """
+
+    def __init__(self, fp: IO[str], chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self._fp = fp
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self) -> bool:
+        """Read more input, dropping everything before the current position."""
+        if self._eof:
+            return False
+        # Grow geometrically so values larger than a chunk are re-scanned O(log n) times
+        chunk = self._fp.read(max(self._chunk_size, len(self._buf) - self._pos))
+        if not chunk:
+            self._eof = True
+            return False
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Return the next non-whitespace character without consuming it."""
+        while True:
+            self._pos = _WHITESPACE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                raise ValueError("Unexpected end of JSON input")
+
+    def _expect(self, char: str) -> None:
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected '{char}' but found '{found}' in JSON input")
+        self._pos += 1
+
+    def read_value(self) -> Any:
+        """Decode and return the next complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # A number running up to the end of the buffer may continue in the next chunk
+            if (isinstance(value, (int, float))
+                    and _NUMBER_TAIL.match(self._buf, end).end() == len(self._buf)
+                    and self._fill()):
+                continue
+            self._pos = end
+            return value
+
+    def skip_value(self) -> None:
+        """Consume the next JSON value without building Python objects for it."""
+        if self.peek() not in '[{':
+            self.read_value()
+            return
+
+        depth = 0
+        while True:
+            match = _STRUCTURAL.search(self._buf, self._pos)
+            if match is None:
+                self._pos = len(self._buf)
+                if not self._fill():
+                    raise ValueError("Unexpected end of JSON input")
+                continue
+
+            char = match.group()
+            if char == '"':
+                string = _STRING.match(self._buf, match.start())
+                if string is None:
+                    # String continues in the next chunk
+                    self._pos = match.start()
+                    if not self._fill():
+                        raise ValueError("Unterminated string in JSON input")
+                    continue
+                self._pos = string.end()
+                continue
+
+            self._pos = match.end()
+            depth += 1 if char in '[{' else -1
+            if depth == 0:
+                return
+
+    def iter_keys(self) -> Iterator[str]:
+        """
+        Iterate over the keys of the next JSON object.
+        The caller must consume each key's value before advancing the iterator.
+        """
+        self._expect('{')
+        if self.peek() == '}':
+            self._pos += 1
+            return
+
+        while True:
+            key = self.read_value()
+            if not isinstance(key, str):
+                raise ValueError("Expected a string key in JSON object")
+            self._expect(':')
+            yield key
+
+            char = self.peek()
+            self._pos += 1
+            if char == '}':
+                return
+            if char != ',':
+                raise ValueError(f"Expected ',' or '}}' but found '{char}' in JSON input")
+
+    def iter_array(self) -> Iterator[Any]:
+        """Decode the next JSON array, yielding its elements one at a time."""
+        if self.peek() == 'n':
+            self.read_value()
+            return
+        self._expect('[')
+        if self.peek() == ']':
+            self._pos += 1
+            return
+
+        while True:
+            yield self.read_value()
+
+            char = self.peek()
+            self._pos += 1
+            if char == ']':
+                return
+            if char != ',':
+                raise ValueError(f"Expected ',' or ']' but found '{char}' in JSON input")
+
+
+def read_bundle_header(fp: IO[str], stream_key: str = 'entry', chunk_size: int = DEFAULT_CHUNK_SIZE) -> Dict[str, Any]:
+    """
+    Read the top-level fields of a JSON object, skipping over the streamed array.
+
+    Args:
+        fp: Text stream positioned at the start of the document
+        stream_key: Key of the array that should not be loaded
+        chunk_size: Number of characters to read at a time
+
+    Returns:
+        Dictionary of all top-level fields except stream_key
+    """
+    reader = JSONStreamReader(fp, chunk_size)
+    header = {}
+    for key in reader.iter_keys():
+        if key == stream_key:
+            reader.skip_value()
+        else:
+            header[key] = reader.read_value()
+    return header
+
+
+def iter_bundle_entries(fp: IO[str], stream_key: str = 'entry', chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Any]:
+    """
+    Yield the elements of a top-level JSON array one at a time.
+
+    Args:
+        fp: Text stream positioned at the start of the document
+        stream_key: Key of the array to stream
+        chunk_size: Number of characters to read at a time
+
+    Returns:
+        Iterator over the decoded array elements
+    """
+    reader = JSONStreamReader(fp, chunk_size)
+    for key in reader.iter_keys():
+        if key == stream_key:
+            yield from reader.iter_array()
+            return
+        reader.skip_value()
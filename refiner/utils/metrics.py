@@ -0,0 +1,97 @@
+import resource
+import sys
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator
+
+from refiner.utils import json_codec
+from refiner.utils.timing import StageTimings
+
+
+def peak_rss_mb(who: int = resource.RUSAGE_SELF) -> float:
+    """
+    Peak resident set size so far, in MiB.
+
+    Args:
+        who: resource.RUSAGE_SELF for this process, or resource.RUSAGE_CHILDREN
+            for the largest terminated child process, such as a transform worker
+
+    Returns:
+        Peak RSS in MiB
+    """
+    peak = resource.getrusage(who).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class RefinementMetrics(StageTimings):
+    """
+    Stage timings of one refinement run, plus how often each stage ran,
+    named counters such as rows per table and bytes in and out, and the
+    process's peak memory when each stage last finished.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.calls: Dict[str, int] = {}
+        self.counters: Dict[str, int] = {}
+        self.peak_rss_mb: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        try:
+            with super().stage(name):
+                yield
+        finally:
+            self._finish(name)
+
+    def add_time(self, name: str, seconds: float) -> None:
+        """
+        Record one run of a stage timed elsewhere, e.g. one interleaved with another stage.
+
+        Args:
+            name: Name of the stage
+            seconds: Wall-clock seconds to add
+        """
+        with self._lock:
+            self.durations[name] = self.durations.get(name, 0.0) + seconds
+        self._finish(name)
+
+    def _finish(self, name: str) -> None:
+        peak = peak_rss_mb()
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            self.peak_rss_mb[name] = max(self.peak_rss_mb.get(name, 0.0), peak)
+
+    def count(self, name: str, value: int = 1) -> None:
+        """
+        Add to a named counter. Safe to use from several threads.
+
+        Args:
+            name: Name of the counter, e.g. 'rows.observations'
+            value: Amount to add
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Snapshot of every metric, ready to be written as JSON."""
+        with self._lock:
+            return {
+                'stages': {
+                    name: {
+                        'seconds': round(seconds, 6),
+                        'calls': self.calls.get(name, 0),
+                        'peak_rss_mb': round(self.peak_rss_mb[name], 1) if name in self.peak_rss_mb else None,
+                    }
+                    for name, seconds in self.durations.items()
+                },
+                'counters': dict(self.counters),
+                'peak_rss_mb': {
+                    'process': round(peak_rss_mb(), 1),
+                    'workers': round(peak_rss_mb(resource.RUSAGE_CHILDREN), 1),
+                },
+            }
+
+    def write(self, path: str) -> None:
+        """Write the metrics to a JSON file."""
+        json_codec.dump_file(self.to_dict(), path, indent=2)
@@ -1,4 +1,37 @@
 import hashlib
+import hmac
+from decimal import Decimal, ROUND_DOWN
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+from sqlalchemy import MetaData, inspect
+
+from refiner.config import settings
+
+# Distinct values remembered per masking rule
+DEFAULT_CACHE_SIZE = 65536
+
+# HKDF context of the masking key derived from the refinement encryption key
+PII_KEY_INFO = b'refiner pii hmac key'
+
+
+def derive_pii_key(encryption_key: str) -> str:
+    """
+    Derive the key of 'hmac' rules from the refinement encryption key with
+    HKDF-SHA256, so masked values published in the database are never keyed
+    with the encryption passphrase itself.
+
+    Args:
+        encryption_key: The refinement encryption key
+
+    Returns:
+        Hex-encoded 256-bit key
+    """
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+    hkdf = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=PII_KEY_INFO)
+    return hkdf.derive(encryption_key.encode()).hex()
 
 def mask_email(email: str) -> str:
     """
@@ -16,4 +49,165 @@ def mask_email(email: str) -> str:
     local_part, domain = email.split('@', 1)
     hashed_local = hashlib.md5(local_part.encode()).hexdigest()
     
-    return f"{hashed_local}@{domain}" 
\ No newline at end of file
+    return f"{hashed_local}@{domain}"
+
+
+class MaskingRule:
+    """
+    Masks the values of one column. Results are memoized in a bounded LRU,
+    so repeated values such as shared addresses are only masked once.
+    """
+
+    def __init__(self, cache_size: int = DEFAULT_CACHE_SIZE):
+        self.mask = lru_cache(maxsize=cache_size)(self._mask)
+
+    def _mask(self, value: Any) -> Any:
+        raise NotImplementedError
+
+    def mask_column(self, values: Sequence[Any]) -> List[Any]:
+        """Mask a whole column of a batch. None stays None."""
+        mask = self.mask
+        return [None if value is None else mask(value) for value in values]
+
+
+class HashRule(MaskingRule):
+    """Unsalted SHA-256 hex digest. Equal inputs stay joinable across databases."""
+
+    def _mask(self, value: Any) -> str:
+        return hashlib.sha256(str(value).encode()).hexdigest()
+
+
+class HmacRule(MaskingRule):
+    """HMAC-SHA256 hex digest under a secret key, so values cannot be recovered by brute force."""
+
+    def __init__(self, key: str, cache_size: int = DEFAULT_CACHE_SIZE):
+        if not key:
+            raise ValueError("An HMAC key is required to mask PII with the 'hmac' rule")
+        self.key = key.encode()
+        super().__init__(cache_size)
+
+    def _mask(self, value: Any) -> str:
+        return hmac.new(self.key, str(value).encode(), hashlib.sha256).hexdigest()
+
+
+class TruncateRule(MaskingRule):
+    """Keep the first `length` characters of strings, or `length` decimal places of numbers."""
+
+    def __init__(self, length: int, cache_size: int = DEFAULT_CACHE_SIZE):
+        self.length = length
+        super().__init__(cache_size)
+
+    def _mask(self, value: Any) -> Any:
+        if isinstance(value, str):
+            return value[:self.length]
+        if isinstance(value, (int, float, Decimal)):
+            return Decimal(str(value)).quantize(Decimal(1).scaleb(-self.length), rounding=ROUND_DOWN)
+        return value
+
+
+class NullRule(MaskingRule):
+    """Drop the value entirely."""
+
+    def _mask(self, value: Any) -> None:
+        return None
+
+    def mask_column(self, values: Sequence[Any]) -> List[Any]:
+        return [None] * len(values)
+
+
+class EmailRule(MaskingRule):
+    """mask_email: hash the local part, keep the domain."""
+
+    def _mask(self, value: Any) -> str:
+        return mask_email(value)
+
+
+RuleSpec = Union[str, Tuple[Any, ...]]
+
+
+def build_rule(spec: RuleSpec, hmac_key: Optional[str] = None, cache_size: int = DEFAULT_CACHE_SIZE) -> MaskingRule:
+    """
+    Create a masking rule from its declaration in a column's info['pii'].
+
+    Args:
+        spec: Rule name, or a tuple of the name and its arguments, e.g. ('truncate', 3).
+            One of 'hash', 'hmac', 'truncate', 'null', 'email'
+        hmac_key: Secret key for the 'hmac' rule
+        cache_size: Distinct values memoized by the rule
+
+    Returns:
+        The masking rule
+    """
+    name, *args = (spec,) if isinstance(spec, str) else spec
+    if name == 'hash':
+        return HashRule(cache_size)
+    if name == 'hmac':
+        return HmacRule(hmac_key, cache_size)
+    if name == 'truncate':
+        return TruncateRule(*args, cache_size=cache_size)
+    if name == 'null':
+        return NullRule(cache_size)
+    if name == 'email':
+        return EmailRule(cache_size)
+    raise ValueError(f"Unknown PII masking rule: {name}")
+
+
+class PIIMasker:
+    """
+    Applies the masking rules declared on the model columns as info={'pii': rule}
+    to batches of rows before they are inserted.
+    """
+
+    def __init__(self, metadata: MetaData, hmac_key: Optional[str] = None, cache_size: int = DEFAULT_CACHE_SIZE):
+        """
+        Args:
+            metadata: Metadata holding the tables and their column declarations
+            hmac_key: Secret key for 'hmac' rules (defaults to settings.PII_HMAC_KEY,
+                then a key derived from settings.REFINEMENT_ENCRYPTION_KEY)
+            cache_size: Distinct values memoized per rule
+        """
+        hmac_key = hmac_key or settings.PII_HMAC_KEY
+        if not hmac_key and settings.REFINEMENT_ENCRYPTION_KEY:
+            hmac_key = derive_pii_key(settings.REFINEMENT_ENCRYPTION_KEY)
+        self.rules: Dict[str, Dict[str, MaskingRule]] = {}
+        for table in metadata.sorted_tables:
+            for column in table.columns:
+                spec = column.info.get('pii')
+                if spec is not None:
+                    self.rules.setdefault(table.name, {})[column.name] = build_rule(spec, hmac_key, cache_size)
+
+    def mask_rows(self, table_name: str, columns: Sequence[str], rows: List[Tuple[Any, ...]]) -> List[Tuple[Any, ...]]:
+        """
+        Mask a batch of rows column by column.
+
+        Args:
+            table_name: Table the rows belong to
+            columns: Column names, in the order values appear in each row
+            rows: Row value tuples
+
+        Returns:
+            Masked rows, or the same list when the table has nothing to mask
+        """
+        rules = self.rules.get(table_name)
+        if not rules or not rows:
+            return rows
+        masked = [(index, rules[name]) for index, name in enumerate(columns) if name in rules]
+        if not masked:
+            return rows
+
+        values = list(zip(*rows))
+        for index, rule in masked:
+            values[index] = rule.mask_column(values[index])
+        return list(zip(*values))
+
+    def mask_model(self, model: Any) -> None:
+        """Mask the attributes set on an ORM instance in place."""
+        state = inspect(model)
+        rules = self.rules.get(state.mapper.local_table.name)
+        if not rules:
+            return
+        for prop in state.mapper.column_attrs:
+            rule = rules.get(prop.columns[0].name)
+            value = state.dict.get(prop.key)
+            if rule is not None and value is not None:
+                setattr(model, prop.key, rule.mask(value))
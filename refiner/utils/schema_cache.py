@@ -0,0 +1,58 @@
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, Optional
+
+from refiner.models.offchain_schema import OffChainSchema
+
+
+def schema_hash(schema: OffChainSchema) -> str:
+    """
+    Hash the canonical JSON form of a schema.
+
+    Args:
+        schema: The schema to hash
+
+    Returns:
+        Hex SHA-256 digest, identical for schemas with equal content
+    """
+    canonical = json.dumps(schema.model_dump(), sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class SchemaCache:
+    """
+    Persistent map from schema hash to the IPFS CID the schema was uploaded as,
+    so an unchanged schema is not uploaded again.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: JSON file the cache is loaded from and saved to
+        """
+        self.path = path
+        self._entries: Dict[str, str] = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    self._entries = dict(json.load(f))
+            except (OSError, ValueError) as e:
+                logging.warning(f"Ignoring unreadable schema cache at {path}: {e}")
+
+    def get(self, schema: OffChainSchema) -> Optional[str]:
+        """Return the CID previously recorded for this schema, if any."""
+        return self._entries.get(schema_hash(schema))
+
+    def put(self, schema: OffChainSchema, ipfs_hash: str) -> None:
+        """Record the CID of an uploaded schema and save the cache."""
+        self._entries[schema_hash(schema)] = ipfs_hash
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Write then rename so a crash never leaves a truncated cache behind
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(self._entries, f, indent=2, sort_keys=True)
+        os.replace(temp_path, self.path)
@@ -0,0 +1,68 @@
+"""
+Import-time profile of the refiner's start-up path. The modules of each stage
+of a run are imported in the order the run first needs them, every stage
+timed on top of the previous ones, so a new heavy import shows up in the
+stage that pulled it in. Only meaningful in a fresh interpreter, such as
+`python -m refiner --profile-startup`, and this module itself only imports
+the standard library.
+"""
+import importlib
+import json
+import logging
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+# Stages of a run, in order, with the modules each one imports first
+STARTUP_STAGES: Tuple[Tuple[str, Tuple[str, ...]], ...] = (
+    ('settings', ('refiner.config',)),
+    ('transform', ('refiner.refine', 'refiner.transformer.user_transformer')),
+    ('encrypt', ('refiner.utils.encrypt',)),
+    ('upload', ('refiner.utils.ipfs',)),
+)
+
+
+def _timed(action) -> Tuple[float, int]:
+    """Run action, returning its wall-clock seconds and the number of modules it imported."""
+    modules_before = len(sys.modules)
+    start = time.perf_counter()
+    action()
+    return time.perf_counter() - start, len(sys.modules) - modules_before
+
+
+def profile_startup(output_path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Import the modules of each stage, then read the settings and select the
+    JSON backend, logging how long each step took.
+
+    Args:
+        output_path: Optional path of a JSON report, to compare across commits
+
+    Returns:
+        One entry per step with its seconds and number of newly imported modules
+    """
+    steps: List[Tuple[str, Any]] = [
+        (f"import {name}", lambda modules=modules: [importlib.import_module(module) for module in modules])
+        for name, modules in STARTUP_STAGES
+    ]
+    steps.append(('load settings', lambda: sys.modules['refiner.config'].get_settings()))
+    steps.append(('select json backend', lambda: sys.modules['refiner.utils.json_codec'].dumps(None)))
+
+    report = []
+    for name, action in steps:
+        try:
+            seconds, modules = _timed(action)
+        except Exception as e:
+            # e.g. settings missing from the environment; the imports were still timed
+            logging.warning(f"{name:<24} failed: {e}")
+            continue
+        report.append({'step': name, 'seconds': round(seconds, 6), 'modules': modules})
+        logging.info(f"{name:<24} {seconds * 1000:8.1f} ms  {modules:4d} modules")
+    total = sum(step['seconds'] for step in report)
+    logging.info(f"{'total':<24} {total * 1000:8.1f} ms  {len(sys.modules):4d} modules loaded")
+
+    if output_path:
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump({'python': sys.version.split()[0], 'steps': report}, f, indent=2)
+        logging.info(f"Start-up profile written to {output_path}")
+    return report
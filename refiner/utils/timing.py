@@ -0,0 +1,32 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+
+class StageTimings:
+    """Wall-clock seconds spent in each named stage, summed over repeated runs of a stage."""
+
+    def __init__(self):
+        self.durations: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Time the enclosed block as part of a stage. Safe to use from several threads.
+
+        Args:
+            name: Name of the stage
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.durations[name] = self.durations.get(name, 0.0) + elapsed
+
+    def summary(self) -> str:
+        """Human readable one-line summary, in the order stages first finished."""
+        return ", ".join(f"{name}={seconds:.3f}s" for name, seconds in self.durations.items())
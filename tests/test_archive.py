@@ -0,0 +1,54 @@
+import os
+import zipfile
+
+from refiner.utils import archive as archive_module
+from refiner.utils.archive import (
+    close_archives, extract_archives, input_size, is_json_input, list_json_members, read_input
+)
+
+
+def _macos_archive(path):
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr('bundle.json', '{}')
+        archive.writestr('notes.txt', 'not an input')
+        archive.writestr('nested/other.json', '{}')
+        archive.writestr('__MACOSX/._bundle.json', b'\x00\x05\x16\x07 AppleDouble')
+        archive.writestr('._bundle.json', b'\x00\x05\x16\x07 AppleDouble')
+
+
+def test_streamed_members_match_extracted_files(tmp_path):
+    archive_path = str(tmp_path / 'input.zip')
+    _macos_archive(archive_path)
+
+    members = list_json_members([archive_path], max_members=100, max_total_size=1024 * 1024)
+    assert [member.name for member in members] == ['bundle.json']
+
+    target_dir = tmp_path / 'extracted'
+    extract_archives([archive_path], str(target_dir), max_members=100, max_total_size=1024 * 1024)
+    extracted = [name for name in os.listdir(target_dir) if is_json_input(name)]
+    assert extracted == ['bundle.json']
+
+
+def test_members_share_one_open_archive(tmp_path, monkeypatch):
+    archive_path = str(tmp_path / 'input.zip')
+    with zipfile.ZipFile(archive_path, 'w') as archive:
+        for i in range(20):
+            archive.writestr(f'bundle{i}.json', '{"id": %d}' % i)
+    members = list_json_members([archive_path], max_members=100, max_total_size=1024 * 1024)
+
+    opened = []
+    zip_file = zipfile.ZipFile
+    monkeypatch.setattr(archive_module.zipfile, 'ZipFile', lambda *args: opened.append(args) or zip_file(*args))
+    try:
+        assert [input_size(member) for member in members] == [len(read_input(member)) for member in members]
+        assert [read_input(member) for member in members[:2]] == [b'{"id": 0}', b'{"id": 1}']
+        assert len(opened) == 1
+
+        # A new archive at the same path is read afresh
+        with zip_file(archive_path, 'w') as archive:
+            archive.writestr('bundle0.json', '{"id": "replaced"}')
+        os.utime(archive_path, ns=(0, 0))
+        assert read_input(members[0]) == b'{"id": "replaced"}'
+        assert len(opened) == 2
+    finally:
+        close_archives()
@@ -0,0 +1,32 @@
+import pytest
+
+from refiner.batch import RESULT_FILE, pending_jobs, read_manifest, run_job
+from refiner.utils import json_codec
+
+
+def test_invalid_manifest_lines_fail_alone(tmp_path):
+    manifest = tmp_path / 'jobs.jsonl'
+    manifest.write_text(
+        '{"id": "a", "input_dir": "a/in", "output_dir": "a/out", "encryption_key": "k"}\n'
+        '{not json\n'
+        '{"id": "c", "input_dir": "c/in", "output_dir": "c/out"}\n'
+    )
+
+    jobs = read_manifest(str(manifest))
+    assert [(job.job_id, job.error is None) for job in jobs] == [('a', True), ('2', False), ('c', False)]
+
+    assert not run_job(jobs[2], refine=lambda executor: pytest.fail('an invalid job must not run'))
+    result = json_codec.load_file(str(tmp_path / 'c' / 'out' / RESULT_FILE))
+    assert result['status'] == 'failed'
+    assert 'encryption_key' in result['error']
+
+
+def test_invalid_job_folder_is_recorded_once(tmp_path):
+    (tmp_path / 'broken').mkdir()
+    (tmp_path / 'broken' / 'job.json').write_text('{broken')
+
+    jobs = pending_jobs(str(tmp_path))
+    assert [job.job_id for job in jobs] == ['broken']
+    assert not run_job(jobs[0], refine=lambda executor: pytest.fail('an invalid job must not run'))
+    assert pending_jobs(str(tmp_path)) == []
+
@@ -0,0 +1,28 @@
+from datetime import date, datetime
+
+from refiner.models.unrefined import PatientResource
+from refiner.transformer.resource_mappers import MappingContext, map_patient
+from refiner.utils.date import parse_fhir_date, parse_fhir_datetime
+
+
+def test_offsets_are_converted_to_utc():
+    assert parse_fhir_datetime('2020-01-01T10:00:00+05:00') == datetime(2020, 1, 1, 5, 0)
+    assert parse_fhir_datetime('2020-01-01T10:00:00Z') == datetime(2020, 1, 1, 10, 0)
+    assert parse_fhir_datetime('2020-01-01T02:00:00+05:00') == datetime(2019, 12, 31, 21, 0)
+    assert parse_fhir_datetime('2020-01-01T10:00:00+05:00').tzinfo is None
+
+
+def test_partial_dates():
+    assert parse_fhir_datetime('2020') == datetime(2020, 1, 1)
+    assert parse_fhir_datetime('2020-05') == datetime(2020, 5, 1)
+    assert parse_fhir_datetime('') is None
+    assert parse_fhir_date('1980-02-03') == date(1980, 2, 3)
+
+
+def test_patient_deceased_date_time_is_stored_as_utc():
+    patient = PatientResource.model_validate({
+        'resourceType': 'Patient', 'id': 'p1', 'deceasedDateTime': '2020-01-01T10:00:00+05:00'
+    })
+    row = map_patient(patient, MappingContext(datetime(2024, 1, 1)))
+    assert row.deceased_date_time == datetime(2020, 1, 1, 5, 0)
+    assert row.deceased_date_time.tzinfo is None
@@ -0,0 +1,44 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from refiner.utils.encrypt import decrypt_file, encrypt_file, is_armored
+
+KEY = 'test passphrase'
+
+# Around the 64 KiB partial body chunks and across several 1 MiB read chunks
+SIZES = [0, 64 * 1024 - 1, 64 * 1024, 64 * 1024 + 1, 3 * 1024 * 1024]
+
+
+def _encrypt(tmp_path, size, armor):
+    plaintext = os.urandom(size)
+    source = tmp_path / 'db.libsql'
+    source.write_bytes(plaintext)
+    encrypted_path = encrypt_file(KEY, str(source), armor=armor)
+    return plaintext, encrypted_path
+
+
+@pytest.mark.parametrize('armor', [True, False])
+@pytest.mark.parametrize('size', SIZES)
+def test_streamed_message_decrypts(tmp_path, size, armor):
+    plaintext, encrypted_path = _encrypt(tmp_path, size, armor)
+    with open(encrypted_path, 'rb') as f:
+        assert is_armored(f.read()) == armor
+
+    decrypted_path = decrypt_file(KEY, encrypted_path, output_path=str(tmp_path / 'decrypted'))
+    with open(decrypted_path, 'rb') as f:
+        assert f.read() == plaintext
+
+
+@pytest.mark.skipif(shutil.which('gpg') is None, reason='gpg is not installed')
+@pytest.mark.parametrize('armor', [True, False])
+def test_streamed_message_decrypts_with_gpg(tmp_path, armor):
+    plaintext, encrypted_path = _encrypt(tmp_path, 64 * 1024 + 1, armor)
+    result = subprocess.run(
+        ['gpg', '--batch', '--quiet', '--homedir', str(tmp_path), '--pinentry-mode', 'loopback',
+         '--passphrase', KEY, '--decrypt', encrypted_path],
+        capture_output=True, check=True
+    )
+    assert result.stdout == plaintext
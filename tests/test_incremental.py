@@ -0,0 +1,110 @@
+import os
+import sqlite3
+
+import pytest
+
+from benchmarks.synthetic import synthetic_bundle
+from refiner.config import override_settings
+from refiner.models.output import Output
+from refiner.refine import Refiner
+from refiner.transformer.incremental import hashes_path
+from refiner.transformer.user_transformer import UserTransformer
+from refiner.utils import ipfs
+from refiner.utils.encrypt import decrypt_file
+
+
+def _refine(db_path, bundle):
+    transformer = UserTransformer(db_path, upsert=True, incremental=True, pii_key='test')
+    transformer.process(bundle)
+    transformer.finalize()
+    return transformer.resource_hashes
+
+
+def _observations(db_path):
+    with sqlite3.connect(db_path) as connection:
+        return dict(connection.execute("SELECT id, status FROM observations"))
+
+
+def test_incremental_run_writes_only_changes(tmp_path):
+    db_path = str(tmp_path / 'db.libsql')
+    bundle = synthetic_bundle(40)
+    first = _refine(db_path, bundle)
+    assert first.unchanged == 0
+    assert first.changed == 40
+
+    observations = [entry['resource'] for entry in bundle['entry'] if entry['resource']['resourceType'] == 'Observation']
+    changed, removed = observations[0], observations[1]
+    changed['status'] = 'amended'
+    bundle['entry'] = [entry for entry in bundle['entry'] if entry['resource'] is not removed]
+
+    second = _refine(db_path, bundle)
+    assert second.unchanged == 38
+    assert second.changed == 1
+
+    rows = _observations(db_path)
+    assert rows[changed['id']] == 'amended'
+    assert removed['id'] not in rows
+    assert len(rows) == len(observations) - 1
+
+
+def test_hashes_are_kept_out_of_the_database(tmp_path):
+    db_path = str(tmp_path / 'db.libsql')
+    _refine(db_path, synthetic_bundle(10))
+
+    with sqlite3.connect(db_path) as connection:
+        tables = {name for name, in connection.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    assert 'resource_hashes' not in tables
+    with sqlite3.connect(hashes_path(db_path)) as connection:
+        assert connection.execute("SELECT COUNT(*) FROM resource_hashes").fetchone()[0] == 10
+
+
+def test_database_without_hashes_is_rebuilt(tmp_path):
+    db_path = str(tmp_path / 'db.libsql')
+    _refine(db_path, synthetic_bundle(10))
+    (tmp_path / 'db.libsql.hashes').unlink()
+
+    rebuilt = _refine(db_path, synthetic_bundle(10))
+    assert rebuilt.unchanged == 0
+    assert rebuilt.changed == 10
+
+
+def _incremental_settings(tmp_path):
+    return override_settings(
+        OUTPUT_DIR=str(tmp_path), REFINEMENT_ENCRYPTION_KEY='test', INCREMENTAL_REFINEMENT=True,
+        SCHEMA_CACHE_ENABLED=False, STREAMING_ENCRYPTION=True, FUSED_ENCRYPT_UPLOAD=True
+    )
+
+
+def test_failed_upload_keeps_the_previous_database(tmp_path, monkeypatch):
+    previous = tmp_path / 'db.libsql.pgp'
+    previous.write_bytes(b'previous run')
+    (tmp_path / 'db.libsql').write_bytes(os.urandom(3 * 1024 * 1024))
+
+    def failing_upload(make_chunks, filename):
+        next(iter(make_chunks()))
+        raise ConnectionError('connection reset')
+
+    monkeypatch.setattr(ipfs, 'upload_chunks_to_ipfs', failing_upload)
+    with _incremental_settings(tmp_path):
+        with pytest.raises(ConnectionError):
+            Refiner()._encrypt_and_upload_stream(Output())
+    assert previous.read_bytes() == b'previous run'
+    assert not (tmp_path / 'db.libsql.pgp.tmp').exists()
+
+    monkeypatch.setattr(ipfs, 'upload_chunks_to_ipfs', lambda make_chunks, filename: list(make_chunks()) and 'hash')
+    with _incremental_settings(tmp_path):
+        Refiner()._encrypt_and_upload_stream(Output())
+    decrypted = decrypt_file('test', str(previous), output_path=str(tmp_path / 'decrypted'))
+    with open(decrypted, 'rb') as f:
+        assert f.read() == (tmp_path / 'db.libsql').read_bytes()
+
+
+def test_undecryptable_previous_database_is_rebuilt(tmp_path):
+    (tmp_path / 'db.libsql.pgp').write_bytes(b'truncated')
+    (tmp_path / 'db.libsql').write_bytes(b'left behind')
+
+    with _incremental_settings(tmp_path):
+        refiner = Refiner()
+        refiner._restore_previous_database()
+    assert not os.path.exists(refiner.db_path)
+    assert not os.path.exists(hashes_path(refiner.db_path))
@@ -0,0 +1,86 @@
+import hashlib
+import os
+
+import pytest
+import requests
+
+from benchmarks.pipeline import serve_stub_pinata
+from refiner.utils import json_codec
+from refiner.utils.ipfs import PINATA_FILE_API_PATH, PINATA_JSON_API_PATH, IPFSClient
+
+
+def _client(server, max_retries=3):
+    return IPFSClient('key', 'secret', api_url=server.url, max_retries=max_retries, retry_backoff=0)
+
+
+def _multipart(request, filename, content):
+    """The body a single-file multipart request with the request's boundary should carry."""
+    boundary = request.headers['Content-Type'].split('boundary=')[1]
+    return (
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f'Content-Type: application/octet-stream\r\n\r\n'
+    ).encode() + content + f'\r\n--{boundary}--\r\n'.encode()
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+@pytest.mark.parametrize('status', [429, 500, 502, 503, 504])
+def test_transient_errors_are_retried(status):
+    with serve_stub_pinata(failures=[status, status]) as server, _client(server) as client:
+        ipfs_hash = client.upload_json({'name': 'schema'})
+
+    body = json_codec.dumps({'name': 'schema'})
+    assert ipfs_hash == f"Qm{_sha256(body)[:44]}"
+    assert [request.path for request in server.requests] == [PINATA_JSON_API_PATH] * 3
+    assert {request.sha256 for request in server.requests} == {_sha256(body)}
+
+
+def test_retries_are_bounded():
+    with serve_stub_pinata(failures=[503] * 3) as server, _client(server, max_retries=1) as client:
+        with pytest.raises(requests.exceptions.HTTPError):
+            client.upload_json({})
+    assert len(server.requests) == 2
+
+
+def test_client_errors_are_not_retried():
+    with serve_stub_pinata(failures=[400]) as server, _client(server) as client:
+        with pytest.raises(requests.exceptions.HTTPError):
+            client.upload_json({})
+    assert len(server.requests) == 1
+
+
+def test_file_upload_sends_content_length(tmp_path):
+    content = os.urandom(3 * 1024 * 1024 + 7)
+    file_path = tmp_path / 'db.libsql.pgp'
+    file_path.write_bytes(content)
+
+    with serve_stub_pinata(failures=[502]) as server, _client(server) as client:
+        client.upload_file(str(file_path))
+
+    assert [request.path for request in server.requests] == [PINATA_FILE_API_PATH] * 2
+    for request in server.requests:
+        expected = _multipart(request, 'db.libsql.pgp', content)
+        assert not request.chunked
+        assert int(request.headers['Content-Length']) == request.length == len(expected)
+        assert request.sha256 == _sha256(expected)
+
+
+def test_chunked_upload_restarts_the_stream_on_retry():
+    chunks = [os.urandom(64 * 1024) for _ in range(5)] + [b'', b'tail']
+    streams = []
+
+    def make_chunks():
+        streams.append(len(streams))
+        return iter(chunks)
+
+    with serve_stub_pinata(failures=[500]) as server, _client(server) as client:
+        client.upload_chunks(make_chunks, 'db.libsql.pgp')
+
+    assert len(streams) == 2
+    for request in server.requests:
+        assert request.chunked
+        assert 'Content-Length' not in request.headers
+        assert request.sha256 == _sha256(_multipart(request, 'db.libsql.pgp', b''.join(chunks)))
@@ -0,0 +1,25 @@
+import pytest
+
+from refiner.utils import json_codec
+
+VALUE = {'b': [1, -2.5, True, False, None], 'a': 'unicode é \U0001F600 "quoted"', 'nested': {'z': {}, 'y': []}}
+
+
+@pytest.fixture(params=json_codec.BACKENDS)
+def backend(request):
+    if request.param != 'json':
+        pytest.importorskip(request.param)
+    json_codec.select_backend(request.param)
+    yield request.param
+    json_codec.select_backend('auto')
+
+
+def test_round_trip(backend):
+    assert json_codec.loads(json_codec.dumps(VALUE)) == VALUE
+    assert json_codec.loads(json_codec.dumps(VALUE).decode('utf-8')) == VALUE
+    assert json_codec.loads(json_codec.dumps(VALUE, indent=2)) == VALUE
+
+
+def test_every_backend_raises_value_error(backend):
+    with pytest.raises(ValueError):
+        json_codec.loads(b'{not json')
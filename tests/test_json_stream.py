@@ -0,0 +1,78 @@
+import io
+import json
+import sqlite3
+
+import pytest
+
+from benchmarks.synthetic import synthetic_bundle
+from refiner.transformer.user_transformer import UserTransformer
+from refiner.utils.json_stream import JSONStreamReader, iter_bundle_entries, read_bundle_header
+
+DOCUMENT = {
+    'id]': 'a,b}c',
+    'escaped': 'quote " backslash \\ newline \n unicode \u00e9 \U0001F600 ]},',
+    'numbers': [0, -12, 3.5e-10, 12345678901234567890],
+    'nested': {'{': ['[', ']', {'}': None}], 'flags': [True, False]},
+    'entry': [{'resource': {'id': '1', 'text': '"]"'}}, {'resource': {'id': '2,'}}, 7, 'x'],
+    'after': {'entry': 'not streamed'},
+}
+
+
+def _stream(document, **kwargs):
+    return io.StringIO(json.dumps(document, **kwargs))
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 64])
+def test_values_split_across_chunks(chunk_size):
+    text = json.dumps(DOCUMENT, indent=1)
+    reader = JSONStreamReader(io.StringIO(text), chunk_size)
+    assert reader.read_value() == json.loads(text)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 5, 64])
+def test_header_and_entries(chunk_size):
+    expected = {key: value for key, value in json.loads(json.dumps(DOCUMENT)).items() if key != 'entry'}
+    assert read_bundle_header(_stream(DOCUMENT), chunk_size=chunk_size) == expected
+    assert list(iter_bundle_entries(_stream(DOCUMENT), chunk_size=chunk_size)) == DOCUMENT['entry']
+
+
+@pytest.mark.parametrize('entry', ['missing', [], None])
+def test_missing_empty_and_null_entry(entry):
+    document = {'resourceType': 'Bundle'}
+    if entry != 'missing':
+        document['entry'] = entry
+    assert list(iter_bundle_entries(_stream(document), chunk_size=3)) == []
+    assert read_bundle_header(_stream(document), chunk_size=3) == {'resourceType': 'Bundle'}
+
+
+@pytest.mark.parametrize('text', ['{"entry": [1 2]}', '{"entry": [1,]}', '{"entry": [1', '{"entry" [1]}'])
+def test_malformed_arrays(text):
+    with pytest.raises(ValueError):
+        list(iter_bundle_entries(io.StringIO(text), chunk_size=2))
+
+
+def _table_rows(db_path):
+    with sqlite3.connect(db_path) as connection:
+        tables = [name for name, in connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name"
+        )]
+        return {table: sorted(connection.execute(f'SELECT * FROM "{table}"').fetchall(), key=repr)
+                for table in tables}
+
+
+def test_process_stream_matches_process(tmp_path):
+    bundle = synthetic_bundle(50, seed=0)
+    input_path = tmp_path / 'bundle.json'
+    input_path.write_text(json.dumps(bundle))
+
+    loaded, streamed = str(tmp_path / 'loaded.libsql'), str(tmp_path / 'streamed.libsql')
+    transformer = UserTransformer(loaded, pii_key='test')
+    transformer.process(bundle)
+    transformer.finalize()
+    transformer = UserTransformer(streamed, pii_key='test', batch_size=7)
+    transformer.process_stream(str(input_path), chunk_size=101)
+    transformer.finalize()
+
+    rows = _table_rows(loaded)
+    assert rows['patients']
+    assert _table_rows(streamed) == rows
@@ -0,0 +1,21 @@
+import sqlite3
+
+import pytest
+
+from benchmarks.synthetic import synthetic_bundle
+from refiner.transformer.user_transformer import UserTransformer
+
+
+@pytest.mark.parametrize('bulk_insert', [True, False])
+def test_same_email_under_another_user_id_is_replaced(tmp_path, bulk_insert):
+    db_path = str(tmp_path / 'db.libsql')
+    first, second = synthetic_bundle(10, seed=0), synthetic_bundle(10, seed=1)
+    second['email'] = first['email']
+
+    transformer = UserTransformer(db_path, upsert=True, bulk_insert=bulk_insert, pii_key='test')
+    transformer.process(first)
+    transformer.process(second)
+    transformer.finalize()
+
+    with sqlite3.connect(db_path) as connection:
+        assert connection.execute("SELECT user_id FROM users").fetchall() == [(second['userId'],)]
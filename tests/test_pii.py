@@ -0,0 +1,24 @@
+import hashlib
+import hmac
+
+from refiner.config import override_settings
+from refiner.models.refined import Base
+from refiner.utils.pii import PIIMasker, derive_pii_key
+
+
+def _ssn_rule(masker):
+    return masker.rules['patients']['ssn']
+
+
+def test_masking_key_is_derived_from_the_encryption_key():
+    with override_settings(REFINEMENT_ENCRYPTION_KEY='passphrase', PII_HMAC_KEY=None):
+        masked = _ssn_rule(PIIMasker(Base.metadata)).mask('999-11-2222')
+
+    assert masked == hmac.new(derive_pii_key('passphrase').encode(), b'999-11-2222', hashlib.sha256).hexdigest()
+    assert masked != hmac.new(b'passphrase', b'999-11-2222', hashlib.sha256).hexdigest()
+
+
+def test_configured_masking_key_wins():
+    with override_settings(REFINEMENT_ENCRYPTION_KEY='passphrase', PII_HMAC_KEY='pii key'):
+        assert _ssn_rule(PIIMasker(Base.metadata)).key == b'pii key'
+    assert _ssn_rule(PIIMasker(Base.metadata, 'explicit')).key == b'explicit'